@@ -0,0 +1,344 @@
+"""
+Background loading and caching of the frame and hat assets.
+
+`AssetLibrary` decodes asset images on a small thread pool (OpenCV releases
+the GIL while decoding and resizing) and prepares birthday frames for a
+given preview size ahead of time, resized and premultiplied by their alpha
+(see `frame_processor.prepare_overlay`). A frame rendered at exactly that
+size in a `WxH` subdirectory (see `create_assets.py --resolutions`) is
+used in place of resizing. Switching to a prepared frame then
+costs nothing on the UI or processing threads.
+
+Decoded and prepared images share one memory budget (`ASSET_CACHE_MB`).
+By default it is `ASSET_CACHE_BASE_MB` for the decoded images plus room for
+every frame prepared at the preview size, so the prepared set is never
+evicted. When it is exceeded, the least recently used entries are dropped;
+they are decoded or prepared again if needed later.
+
+Both are also cached on disk by `AssetDiskCache` as raw NumPy arrays, keyed
+by a hash of the asset file's contents and, for prepared frames, the target
+size. Restarts and re-scans load these instead of decoding and resizing
+assets that have not changed.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from frame_processor import prepare_overlay
+
+# --- CONFIGURATION ---
+ASSET_CACHE_MB = int(os.environ.get('ASSET_CACHE_MB', '0'))    # Memory budget for decoded and prepared assets, 0 to fit the prepared frames
+ASSET_WORKERS = int(os.environ.get('ASSET_WORKERS', '2'))      # Background loading threads
+ASSET_DISK_CACHE_DIR = os.environ.get(
+    'ASSET_DISK_CACHE_DIR',
+    os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'photobooth', 'assets')
+)                                                                 # Empty to disable the disk cache
+ASSET_DISK_CACHE_MB = int(os.environ.get('ASSET_DISK_CACHE_MB', '2048'))
+# --- END CONFIGURATION ---
+
+INDEX_FILE = 'index.json'
+INDEX_WRITE_DELAY = 1.0    # Seconds to gather new hashes before the index is written
+ASSET_CACHE_BASE_MB = 256  # The automatic budget's room for decoded images
+MB = 1024 * 1024
+
+
+def _nbytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, tuple):
+        return sum(part.nbytes for part in value)
+    return value.nbytes
+
+
+class AssetDiskCache:
+    """
+    Stores decoded and prepared assets on disk, keyed by content hash.
+
+    An index maps each asset path to its modification time, size and hash,
+    so unchanged files are not even re-read to be hashed. New hashes are
+    written to it in one go, `INDEX_WRITE_DELAY` seconds after the first.
+    """
+    def __init__(self, directory=ASSET_DISK_CACHE_DIR, budget_mb=ASSET_DISK_CACHE_MB):
+        """
+        Initializes the AssetDiskCache.
+
+        Args:
+            directory (str): Where cached arrays are kept.
+            budget_mb (int): Disk budget in megabytes; the oldest files are
+                removed beyond it.
+        """
+        self.directory = directory
+        self.budget = budget_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self._index = {}
+        self._flush_timer = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, INDEX_FILE)) as f:
+                self._index = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring the asset cache index in {directory}: {e}")
+
+    def digest(self, path):
+        """
+        Returns the content hash of an asset file, or None if it cannot be read.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._index.get(path)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+
+        try:
+            with open(path, 'rb') as f:
+                digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        except OSError:
+            return None
+        with self._lock:
+            self._index[path] = [stat.st_mtime_ns, stat.st_size, digest]
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(INDEX_WRITE_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        return digest
+
+    def flush(self):
+        """Writes the index if hashes were added since it was last written."""
+        with self._lock:
+            if self._flush_timer is None:
+                return
+            self._flush_timer.cancel()
+            self._flush_timer = None
+            # Written under the lock so an older index never replaces a newer one
+            self._write(INDEX_FILE, json.dumps(self._index).encode())
+
+    def _name(self, digest, size=None):
+        if size is None:
+            return f"{digest}.npy"
+        return f"{digest}_{size[0]}x{size[1]}.npz"
+
+    def load(self, digest, size=None):
+        """
+        Returns a cached decoded image, or for a (w, h) size a prepared
+        (premultiplied, inverse_alpha) pair, or None on a miss.
+        """
+        path = os.path.join(self.directory, self._name(digest, size))
+        try:
+            if size is None:
+                return np.load(path)
+            with np.load(path) as arrays:
+                return arrays['premultiplied'], arrays['inverse_alpha']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable asset cache file {path}: {e}")
+            return None
+
+    def store(self, digest, value, size=None):
+        """Caches a decoded image, or a prepared pair for a (w, h) size."""
+        buf = io.BytesIO()
+        if size is None:
+            np.save(buf, value)
+        else:
+            np.savez(buf, premultiplied=value[0], inverse_alpha=value[1])
+        self._write(self._name(digest, size), buf.getbuffer())
+        self._prune()
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write the asset cache file {path}: {e}")
+
+    def _prune(self):
+        """Removes the least recently written files beyond the disk budget."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.endswith(('.npy', '.npz'))]
+            total = sum(entry.stat().st_size for entry in entries)
+            for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+                if total <= self.budget:
+                    break
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+        except OSError as e:
+            logging.warning(f"Failed to prune the asset cache: {e}")
+
+
+class AssetLibrary:
+    """Loads and prepares assets in the background, within a memory budget."""
+    def __init__(self, budget_mb=ASSET_CACHE_MB, workers=ASSET_WORKERS, disk_cache_dir=ASSET_DISK_CACHE_DIR):
+        """
+        Initializes the AssetLibrary.
+
+        Args:
+            budget_mb (int): Memory budget in megabytes, or 0 to grow it to
+                fit every prepared frame.
+            workers (int): Number of loading threads.
+            disk_cache_dir (str): Directory for the disk cache, or empty for none.
+        """
+        self.auto_budget = not budget_mb
+        self.budget = (budget_mb or ASSET_CACHE_BASE_MB) * MB
+        self._prepared_paths = {}  # (w, h) -> paths prepared for that size
+        self.disk_cache = AssetDiskCache(disk_cache_dir) if disk_cache_dir else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='assets')
+        self._lock = threading.Lock()
+        # ('image', path) or ('prepared', path, (w, h)) -> Future, least recently used first
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+
+    def _submit(self, key, fn, *args):
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+                return future
+            future = self._executor.submit(fn, *args)
+            self._entries[key] = future
+        future.add_done_callback(lambda f: self._account(key, f))
+        return future
+
+    def _account(self, key, future):
+        if future.cancelled() or future.exception() is not None:
+            with self._lock:
+                self._entries.pop(key, None)
+            return
+        size = _nbytes(future.result())
+        with self._lock:
+            if self._entries.get(key) is not future:
+                return  # Evicted before it finished
+            self._sizes[key] = size
+            self._total += size
+            # Evict finished entries, oldest first, but never the one just added
+            for old_key in list(self._entries):
+                if self._total <= self.budget:
+                    break
+                if old_key == key or old_key not in self._sizes:
+                    continue
+                del self._entries[old_key]
+                self._total -= self._sizes.pop(old_key)
+                logging.debug(f"Evicted asset {old_key[:2]} from the cache.")
+
+    def _decode(self, path):
+        digest = self.disk_cache.digest(path) if self.disk_cache else None
+        if digest:
+            image = self.disk_cache.load(digest)
+            if image is not None:
+                return image
+
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            logging.error(f"Failed to load asset {path}")
+        elif digest:
+            self.disk_cache.store(digest, image)
+        return image
+
+    def _prepare(self, path, size):
+        variant = os.path.join(os.path.dirname(path), f"{size[0]}x{size[1]}", os.path.basename(path))
+        if os.path.exists(variant):
+            path = variant  # Rendered at this size by create_assets.py, so no resize is needed
+        digest = self.disk_cache.digest(path) if self.disk_cache else None
+        if digest:
+            prepared = self.disk_cache.load(digest, size)
+            if prepared is not None:
+                return prepared
+
+        with self._lock:
+            future = self._entries.get(('image', path))
+        # Never wait on another pool task from inside the pool; decode here instead
+        image = future.result() if future is not None and future.done() else self._decode(path)
+        if image is None:
+            return None
+        prepared = prepare_overlay(image, size)
+        if digest:
+            self.disk_cache.store(digest, prepared, size)
+        return prepared
+
+    def load(self, path):
+        """Starts decoding an asset and returns its Future."""
+        return self._submit(('image', path), self._decode, path)
+
+    def preload(self, paths):
+        """Starts decoding several assets."""
+        for path in paths:
+            self.load(path)
+
+    def get(self, path):
+        """
+        Returns a decoded BGRA asset, waiting for it if it is still loading.
+
+        Returns:
+            numpy.ndarray: The image, or None if it could not be read.
+        """
+        return self.load(path).result()
+
+    def prepare(self, path, size):
+        """Starts preparing a frame overlay for a (w, h) size and returns its Future."""
+        return self._submit(('prepared', path, tuple(size)), self._prepare, path, tuple(size))
+
+    def prepare_all(self, paths, size):
+        """Starts preparing several frame overlays for a (w, h) size, in order."""
+        if self.auto_budget:
+            w, h = size
+            with self._lock:
+                prepared = self._prepared_paths.setdefault(tuple(size), set())
+                prepared.update(paths)
+                # Two 3-channel images per prepared frame
+                needed = ASSET_CACHE_BASE_MB * MB + len(prepared) * w * h * 6
+                if needed > self.budget:
+                    self.budget = needed
+                    logging.info(f"Asset cache budget raised to {needed // MB}MB to hold {len(prepared)} prepared frames.")
+        for path in paths:
+            self.prepare(path, size)
+
+    def peek_prepared(self, path, size):
+        """
+        Returns a prepared overlay if it is ready, without waiting.
+
+        Returns:
+            tuple: The (premultiplied, inverse_alpha) pair, or None.
+        """
+        key = ('prepared', path, tuple(size))
+        with self._lock:
+            future = self._entries.get(key)
+            if future is None or not future.done() or future.exception() is not None:
+                return None
+            self._entries.move_to_end(key)
+        return future.result()
+
+    def invalidate(self, path):
+        """Forgets everything cached in memory for an asset that changed or was removed."""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == path]:
+                future = self._entries.pop(key)
+                future.cancel()
+                self._total -= self._sizes.pop(key, 0)
+
+    def memory_used(self):
+        """Returns the bytes held by finished entries."""
+        with self._lock:
+            return self._total
+
+    def shutdown(self):
+        """Stops the loading threads, dropping work that has not started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.disk_cache:
+            self.disk_cache.flush()
@@ -0,0 +1,129 @@
+"""
+Watches the asset directories for new, changed and removed images.
+
+On Linux the directories are watched with inotify (through ctypes, so no
+extra dependency is needed); anywhere inotify is unavailable the watcher
+falls back to polling. Either way, a wake-up only triggers a rescan of the
+directories, which is compared with the previous scan by modification time
+and size. Changes are reported once writes have settled, so a file that is
+still being copied in is not picked up half-written.
+"""
+import ctypes
+import ctypes.util
+import glob
+import logging
+import os
+import select
+import threading
+
+# --- CONFIGURATION ---
+ASSET_POLL_INTERVAL = float(os.environ.get('ASSET_POLL_INTERVAL', '2.0'))  # Seconds, without inotify
+# --- END CONFIGURATION ---
+
+SETTLE_TIME = 0.5  # Seconds without events before a rescan
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+
+def scan(directory, pattern='*.png'):
+    """Returns {path: (mtime_ns, size)} for the matching files in a directory."""
+    snapshot = {}
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue  # Removed while scanning
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _open_inotify(directories):
+    """
+    Sets up inotify watches on the directories.
+
+    Returns:
+        int: The inotify file descriptor, or None if inotify is unavailable.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError) as e:
+        logging.info(f"inotify is not available ({e}); polling for asset changes.")
+        return None
+    if fd < 0:
+        logging.info(f"inotify_init1 failed ({os.strerror(ctypes.get_errno())}); polling for asset changes.")
+        return None
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            logging.info(f"Cannot watch {directory} ({os.strerror(ctypes.get_errno())}); "
+                         f"polling for asset changes.")
+            os.close(fd)
+            return None
+    return fd
+
+
+class AssetWatcher(threading.Thread):
+    """
+    A worker thread that reports changes to asset directories.
+
+    `on_change` is called from the watcher thread with (directory, added,
+    removed, changed), three sorted lists of paths, whenever a directory's
+    contents change.
+    """
+    def __init__(self, directories, on_change, poll_interval=ASSET_POLL_INTERVAL, **kwargs):
+        super(AssetWatcher, self).__init__(daemon=True, **kwargs)
+        self.directories = list(directories)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self._snapshots = {directory: scan(directory) for directory in self.directories}
+
+    def _rescan(self):
+        for directory in self.directories:
+            old = self._snapshots[directory]
+            new = scan(directory)
+            if new == old:
+                continue
+            self._snapshots[directory] = new
+            added = sorted(set(new) - set(old))
+            removed = sorted(set(old) - set(new))
+            changed = sorted(path for path in set(new) & set(old) if new[path] != old[path])
+            logging.info(f"Assets in {directory} changed: {len(added)} added, "
+                         f"{len(removed)} removed, {len(changed)} changed.")
+            self.on_change(directory, added, removed, changed)
+
+    def run(self):
+        fd = _open_inotify(self.directories)
+        if fd is None:
+            while not self.stop_event.wait(self.poll_interval):
+                self._rescan()
+            return
+
+        logging.info(f"Watching {', '.join(self.directories)} for asset changes.")
+        try:
+            pending = False
+            while not self.stop_event.is_set():
+                readable, _, _ = select.select([fd], [], [], SETTLE_TIME)
+                if readable:
+                    try:
+                        while os.read(fd, 4096):
+                            pass  # The events only tell us to rescan
+                    except BlockingIOError:
+                        pass
+                    pending = True
+                elif pending:
+                    # Quiet for SETTLE_TIME: the writes are done
+                    pending = False
+                    self._rescan()
+        finally:
+            os.close(fd)
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,746 @@
+"""
+Headless benchmark for the frame-processing path.
+
+Runs the same `FrameProcessor` code the booth uses, without Kivy or a camera,
+over a matrix of resolutions, green screen background on/off, colour
+effects, frame assets, hat on/off and face counts, and
+reports per-stage latency percentiles, fps, CPU use and allocations.
+
+Frames come from one of three sources:
+
+* `synthetic`: generated noise and gradients (the default).
+* `videotestsrc`: GStreamer test frames, taken through the worker's sample
+  handling exactly as camera samples are.
+* `files`: recorded frames from a directory (`--frames-dir`), resized to
+  each resolution.
+
+Face counts are simulated with evenly spaced face boxes so hat compositing can
+be measured on any source; detection still runs on the real frame and is
+timed as its own stage. Use `--faces detect` to composite whatever the
+detector actually finds.
+
+Results can be written as JSON (`--output`) and compared with an earlier run
+(`--compare`), which exits non-zero if any case got slower than `--threshold`.
+
+`--workers` instead measures throughput through a `FrameProcessPool` for each
+number of worker processes (0 is the single-threaded path), with the last
+frame asset and hat setting and real face detection, to show how processing
+scales with cores.
+
+`--detectors` compares face detector backends instead: each one, at each
+`--detect-scales` downscale, is run over the same frames (use `--source files`
+with a folder of sample photos), reporting ms/frame and how many of the
+faces found by the first backend and scale it also found.
+
+`--smile` measures the smile trigger instead: the cost of one check for each
+`--faces` count, its share of a core at `SMILE_CHECK_FPS`, and the face
+detection it needs when no hat is drawn. If Whisper is installed, the voice
+trigger's model load and per-window transcription are timed alongside.
+
+`--voice` compares the voice trigger's inference backends instead. Each one
+is loaded in a fresh process and run over the listening windows of the WAV
+recordings in `--audio-dir`, reporting load time, resident memory,
+per-window latency, CPU use and the windows in which the keyword was heard.
+
+Examples:
+    python benchmark.py --resolutions 1280x720,1920x1080 --faces 0,1,4 --output bench.json
+    python benchmark.py --resolutions 1920x1080 --effects none,sepia,vintage,noir --hats off
+    python benchmark.py --resolutions 1280x720,1920x1080 --backgrounds off,on --hats off
+    python benchmark.py --resolutions 1280x720,1920x1080 --faces 1,2,4 --smile
+    python benchmark.py --voice whisper,faster-whisper --audio-dir recordings
+    python benchmark.py --resolutions 1920x1080,3840x2160 --workers 0,1,2,4
+    python benchmark.py --source files --frames-dir samples --frames 50 --detectors haar,lbp,yunet --detect-scales 1,2
+"""
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import wave
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# GStreamer and the optional features are imported by the modes that use them,
+# so that, for example, --detectors runs without GStreamer installed
+from frame_processor import FrameProcessor
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_RESOLUTIONS = '640x480,1280x720,1920x1080'
+SYNTHETIC_FRAME_COUNT = 8
+VOICE_KEYWORD = 'smile'  # As listened for by VoiceListener
+KEY_STAGES = ('key_mask', 'key_upscale', 'key_composite')  # Printed for background-on cases
+
+
+def parse_resolutions(value):
+    resolutions = []
+    for item in value.split(','):
+        w, h = item.lower().split('x')
+        resolutions.append((int(w), int(h)))
+    return resolutions
+
+
+def percentiles(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    return {
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+    }
+
+
+def synthetic_frames(w, h, count=SYNTHETIC_FRAME_COUNT):
+    """Returns BGR frames of gradients with noise, so no two are alike."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    frames = []
+    for i in range(count):
+        base = np.broadcast_to(gradient, (h, w, 3)) * (0.5 + 0.5 * i / count)
+        noise = rng.integers(0, 40, size=(h, w, 3), dtype=np.uint8)
+        frames.append(cv2.add(base.astype(np.uint8), noise))
+    return frames
+
+
+def file_frames(frames_dir, w, h):
+    paths = sorted(glob.glob(os.path.join(frames_dir, '*.png')) + glob.glob(os.path.join(frames_dir, '*.jpg')))
+    frames = []
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            frames.append(cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA))
+    if not frames:
+        raise SystemExit(f"No readable .png/.jpg frames in {frames_dir}")
+    return frames
+
+
+class VideoTestSource:
+    """
+    Pulls BGR samples from a GStreamer `videotestsrc` and converts them with
+    `FrameProcessorWorker.sample_to_frame`, as the booth does with camera samples.
+    """
+    def __init__(self, w, h):
+        try:
+            import gi
+            gi.require_version('Gst', '1.0')
+            from gi.repository import Gst
+        except (ImportError, ValueError) as e:
+            raise SystemExit(f"--source videotestsrc needs GStreamer and PyGObject: {e}")
+        from frame_processor import FrameProcessorWorker
+
+        Gst.init(None)
+        self.null_state = Gst.State.NULL
+        self.pipeline = Gst.parse_launch(
+            f"videotestsrc pattern=ball is-live=false ! "
+            f"video/x-raw,format=BGR,width={w},height={h},framerate=30/1 ! "
+            f"appsink name=sink sync=false max-buffers=4"
+        )
+        self.sink = self.pipeline.get_by_name('sink')
+        self.pipeline.set_state(Gst.State.PLAYING)
+        # The worker is only used for its sample conversion, so it needs no queues
+        self.worker = FrameProcessorWorker(app=None)
+
+    def next_frame(self, stage_times):
+        sample = self.sink.emit('pull-sample')
+        start = time.perf_counter()
+        frame = self.worker.sample_to_frame(sample)
+        stage_times.setdefault('map', []).append((time.perf_counter() - start) * 1000)
+        return frame
+
+    def close(self):
+        self.pipeline.set_state(self.null_state)
+
+
+class ListSource:
+    """Cycles through a list of prepared frames."""
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def next_frame(self, stage_times):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+def make_source(args, w, h):
+    if args.source == 'videotestsrc':
+        return VideoTestSource(w, h)
+    if args.source == 'files':
+        return ListSource(file_frames(args.frames_dir, w, h))
+    return ListSource(synthetic_frames(w, h))
+
+
+def synthetic_faces(count, w, h):
+    """Returns `count` face boxes spread across the middle of the frame."""
+    size = max(min(w // (count + 1), h // 3), 100)
+    y = h // 2 - size // 2
+    return np.array([
+        ((i + 1) * w // (count + 1) - size // 2, y, size, size) for i in range(count)
+    ], dtype=np.int32).reshape(-1, 4)
+
+
+def run_case(args, processor, resolution, background, effect, frame_asset, hat, faces):
+    from effects import get_effect
+
+    w, h = resolution
+    processor.background = background
+    processor.effect = get_effect(effect)
+    processor.set_birthday_frame(cv2.imread(frame_asset, cv2.IMREAD_UNCHANGED) if frame_asset else None)
+    processor.hat = hat
+    face_boxes = None if faces == 'detect' else synthetic_faces(int(faces), w, h)
+
+    stage_times = {}
+    processor.stage_timer = lambda stage, seconds: stage_times.setdefault(stage, []).append(seconds * 1000)
+    source = make_source(args, w, h)
+
+    def process_one():
+        frame_start = time.perf_counter()
+        frame = source.next_frame(stage_times)
+        if hat is not None and face_boxes is not None:
+            # Time detection on the real frame, then composite the simulated faces
+            start = time.perf_counter()
+            processor.detect_faces(frame)
+            stage_times.setdefault('detect', []).append((time.perf_counter() - start) * 1000)
+        processor.apply_overlay(frame, faces=face_boxes)
+        stage_times.setdefault('total', []).append((time.perf_counter() - frame_start) * 1000)
+
+    try:
+        for _ in range(args.warmup):
+            process_one()
+        stage_times.clear()
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        for _ in range(args.frames):
+            process_one()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        # Allocations are measured on a separate, shorter pass since tracing slows everything down
+        alloc_peaks = []
+        tracemalloc.start()
+        for _ in range(min(args.frames, args.alloc_frames)):
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            process_one()
+            alloc_peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+    finally:
+        source.close()
+        processor.stage_timer = None
+
+    return {
+        'resolution': f"{w}x{h}",
+        'background': background is not None,
+        'effect': effect,
+        'frame_asset': os.path.basename(frame_asset) if frame_asset else 'none',
+        'hat': hat is not None,
+        'faces': faces,
+        'frames': args.frames,
+        'fps': args.frames / wall,
+        'cpu_percent': cpu / wall * 100,
+        'alloc_peak_bytes': int(np.mean(alloc_peaks)) if alloc_peaks else None,
+        'stages': {stage: percentiles(values) for stage, values in stage_times.items() if values},
+    }
+
+
+def run_scaling_case(args, processor, resolution, workers):
+    """
+    Measures frames per second through `workers` worker processes, or on
+    this thread for 0, keeping every pool slot busy.
+    """
+    from process_pool import FrameProcessPool
+
+    w, h = resolution
+    source = make_source(args, w, h)
+    stage_times = {}
+    done = threading.Semaphore(0)
+
+    def run(count):
+        if workers == 0:
+            for _ in range(count):
+                processor.process(source.next_frame(stage_times))
+            return
+        for _ in range(count):
+            pool.submit(source.next_frame(stage_times))
+        for _ in range(count):
+            done.acquire()
+
+    pool = FrameProcessPool(processor, workers, on_result=lambda *result: done.release()) if workers else None
+    try:
+        run(args.warmup)
+        wall_start = time.perf_counter()
+        run(args.frames)
+        wall = time.perf_counter() - wall_start
+    finally:
+        source.close()
+        if pool:
+            pool.close()
+    return {
+        'resolution': f"{w}x{h}",
+        'workers': workers,
+        'frames': args.frames,
+        'fps': args.frames / wall,
+    }
+
+
+def run_detector_cases(args, resolution, detectors, scales):
+    """
+    Times each detector backend and downscale on the same frames and measures
+    agreement with the first one.
+
+    Returns:
+        list: A result dict per backend and scale that could be loaded.
+    """
+    from face_detectors import DETECTORS, match_faces
+
+    w, h = resolution
+    source = make_source(args, w, h)
+    try:
+        frames = [source.next_frame({}) for _ in range(args.frames)]
+    finally:
+        source.close()
+
+    results = []
+    reference = None
+    for name in detectors:
+        for scale in scales:
+            detector = DETECTORS[name](scale)
+            if not detector.available:
+                logging.warning(f"Skipping the unavailable {name} detector.")
+                break
+            detector.detect(frames[0])  # Warm up
+            times, found = [], []
+            for frame in frames:
+                start = time.perf_counter()
+                found.append(detector.detect(frame))
+                times.append((time.perf_counter() - start) * 1000)
+
+            if reference is None:
+                reference = found
+            reference_faces = sum(len(faces) for faces in reference)
+            matched = sum(match_faces(faces, ref) for faces, ref in zip(found, reference))
+            total = sum(len(faces) for faces in found)
+            results.append({
+                'resolution': f"{w}x{h}",
+                'detector': name,
+                'scale': scale,
+                'frames': len(frames),
+                'ms': percentiles(times),
+                'faces': total,
+                'agreement': matched / reference_faces if reference_faces else None,
+                'extra_faces': total - matched,
+            })
+    return results
+
+
+def run_smile_cases(args, resolution):
+    """
+    Times the smile trigger's checks for each simulated face count, and the
+    face detection it needs when no hat is drawn.
+
+    Returns:
+        list: A result dict per face count.
+    """
+    from smile_trigger import SmileTrigger, SMILE_CHECK_FPS
+
+    w, h = resolution
+    source = make_source(args, w, h)
+    try:
+        frames = [source.next_frame({}) for _ in range(args.frames)]
+    finally:
+        source.close()
+    trigger = SmileTrigger(lambda: None, check_fps=1e9)
+    detector = FrameProcessor().detector
+
+    detect_times = []
+    for frame in frames:
+        start = time.perf_counter()
+        detector.detect(frame)
+        detect_times.append((time.perf_counter() - start) * 1000)
+
+    results = []
+    for faces in args.faces.split(','):
+        if faces == 'detect':
+            continue
+        boxes = synthetic_faces(int(faces), w, h)
+        times = []
+        for frame in frames:
+            start = time.perf_counter()
+            trigger.update(frame, boxes)
+            times.append((time.perf_counter() - start) * 1000)
+        check = percentiles(times)
+        results.append({
+            'resolution': f"{w}x{h}",
+            'faces': int(faces),
+            'check_ms': check,
+            'detect_ms': percentiles(detect_times),
+            # Share of one core at the configured check rate
+            'check_fps': SMILE_CHECK_FPS,
+            'cpu_percent': check['mean'] * SMILE_CHECK_FPS / 10,
+        })
+    return results
+
+
+def read_audio_fixtures(audio_dir):
+    """
+    Reads the WAV recordings in a directory as 16kHz mono float32 audio.
+
+    Without a directory, three seconds of quiet noise are generated instead,
+    which times the models but cannot test what they hear.
+
+    Returns:
+        list: (name, audio) tuples.
+    """
+    from voice_listener import SAMPLERATE
+
+    if not audio_dir:
+        rng = np.random.default_rng(0)
+        return [('noise', (rng.standard_normal(SAMPLERATE * 3) * 0.01).astype(np.float32))]
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(audio_dir, '*.wav'))):
+        with wave.open(path) as f:
+            if f.getsampwidth() != 2:
+                logging.warning(f"Skipping {path}: only 16-bit WAV files are supported.")
+                continue
+            rate, channels = f.getframerate(), f.getnchannels()
+            samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        audio = samples.reshape(-1, channels).mean(axis=1) / 32768.0
+        if rate != SAMPLERATE:
+            positions = np.arange(0, len(audio), rate / SAMPLERATE)
+            audio = np.interp(positions, np.arange(len(audio)), audio)
+        fixtures.append((os.path.basename(path), audio.astype(np.float32)))
+    if not fixtures:
+        logging.warning(f"No WAV files found in {audio_dir}.")
+    return fixtures
+
+
+def _voice_case(backend, fixtures, keyword, results):
+    """Loads and times one voice backend; runs in a fresh process."""
+    from frame_pool import memory_mb
+    from voice_listener import SAMPLERATE, VOICE_MODEL, WINDOW_SECONDS, load_transcriber
+
+    rss_before, _ = memory_mb()
+    start = time.perf_counter()
+    try:
+        transcribe = load_transcriber(backend, VOICE_MODEL)
+    except Exception as e:  # Not installed, or the model could not be downloaded
+        results.put({'backend': backend, 'error': str(e)})
+        return
+    load_seconds = time.perf_counter() - start
+    rss_loaded, _ = memory_mb()
+
+    window_size = int(SAMPLERATE * WINDOW_SECONDS)
+    times = []
+    hits = {}
+    cpu_start = time.process_time()
+    for name, audio in fixtures:
+        hits[name] = 0
+        for offset in range(0, max(len(audio) - window_size // 2, 1), window_size):
+            window = audio[offset:offset + window_size]
+            start = time.perf_counter()
+            text = transcribe(window)
+            times.append((time.perf_counter() - start) * 1000)
+            hits[name] += keyword in text.lower()
+    cpu = time.process_time() - cpu_start
+    rss_after, rss_peak = memory_mb()
+    results.put({
+        'backend': backend,
+        'model': VOICE_MODEL,
+        'window_seconds': WINDOW_SECONDS,
+        'load_seconds': load_seconds,
+        'rss_mb': {'before': rss_before, 'loaded': rss_loaded, 'after': rss_after, 'peak': rss_peak},
+        'first_window_ms': times[0],
+        'window_ms': percentiles(times[1:] or times),
+        # Share of a core needed to keep up, one window per WINDOW_SECONDS of audio
+        'cpu_percent': cpu / (len(times) * WINDOW_SECONDS) * 100,
+        'keyword_windows': hits,
+    })
+
+
+def run_voice_case(backend, fixtures, keyword=VOICE_KEYWORD):
+    """
+    Times a voice backend's model load, memory and transcription of each
+    listening window of the fixtures, in a fresh process so that imports
+    and memory are its own.
+
+    Returns:
+        dict: The result, or None if the backend could not be loaded.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_voice_case, args=(backend, fixtures, keyword, results))
+    process.start()
+    result = None
+    while result is None and (process.is_alive() or not results.empty()):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            pass
+    process.join()
+    if result is None:
+        logging.error(f"Voice backend {backend} exited with code {process.exitcode}.")
+        return None
+    if 'error' in result:
+        logging.warning(f"Voice backend {backend} could not be loaded ({result['error']}); skipping it.")
+        return None
+    return result
+
+
+def print_voice_result(result):
+    rss = result['rss_mb']
+    hits = sum(result['keyword_windows'].values())
+    print(f"{'voice':>10} {result['backend']:<14} load {result['load_seconds']:5.1f}s  "
+          f"rss {rss['loaded']:6.0f}MB (+{rss['loaded'] - rss['before']:.0f}MB, peak {rss['peak']:.0f}MB)  "
+          f"{result['window_seconds']:g}s window p50 {result['window_ms']['p50']:6.0f}ms  "
+          f"p95 {result['window_ms']['p95']:6.0f}ms  first {result['first_window_ms']:.0f}ms  "
+          f"cpu {result['cpu_percent']:5.1f}%  keyword in {hits} window(s)")
+
+
+def case_key(result):
+    # Runs from before backgrounds and effects were benchmarked had neither
+    return (result['resolution'], result.get('background', False), result.get('effect', 'none'),
+            result['frame_asset'], result['hat'], str(result['faces']))
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Prints the fps change of every case found in a baseline run.
+
+    Returns:
+        bool: True if any case regressed by more than `threshold` percent.
+    """
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)['results']}
+
+    regressed = False
+    print(f"\nComparison with {baseline_path}:")
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None:
+            continue
+        change = (result['fps'] - old['fps']) / old['fps'] * 100
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {' / '.join(map(str, case_key(result)))}: {old['fps']:.1f} -> {result['fps']:.1f} fps "
+              f"({change:+.1f}%){flag}")
+    return regressed
+
+
+def metadata():
+    try:
+        revision = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        revision = None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'revision': revision,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the photobooth frame-processing path.")
+    parser.add_argument('--source', choices=['synthetic', 'videotestsrc', 'files'], default='synthetic')
+    parser.add_argument('--frames-dir', help='Directory of recorded frames for --source files')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS,
+                        help=f'Comma-separated WxH list (default: {DEFAULT_RESOLUTIONS})')
+    parser.add_argument('--frame-assets', default=None,
+                        help='Comma-separated frame overlay paths, or "none" (default: none and the first asset)')
+    parser.add_argument('--hat', default=None, help='Hat image for the hat-on cases (default: first in assets/hats)')
+    parser.add_argument('--backgrounds', default='off',
+                        help='Comma-separated green screen background settings (default: off; e.g. off,on)')
+    parser.add_argument('--background', help='Background image (default: the first green screen background)')
+    parser.add_argument('--effects', default='none',
+                        help="Comma-separated colour effects, e.g. none,sepia,vintage (default: none)")
+    parser.add_argument('--hats', default='off,on', help='Comma-separated hat settings (default: off,on)')
+    parser.add_argument('--faces', default='0,1,4',
+                        help='Comma-separated simulated face counts, or "detect" (default: 0,1,4)')
+    parser.add_argument('--frames', type=int, default=200, help='Measured frames per case')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured frames per case')
+    parser.add_argument('--alloc-frames', type=int, default=30, help='Frames in the allocation-tracing pass')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    parser.add_argument('--compare', help='Compare with a previous JSON result file')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='fps drop, in percent, reported as a regression (default: 10)')
+    parser.add_argument('--workers',
+                        help='Comma-separated worker process counts to measure scaling with, e.g. 0,1,2,4')
+    parser.add_argument('--detectors',
+                        help="Comma-separated face detectors to compare, e.g. haar,lbp,yunet")
+    parser.add_argument('--detect-scales', default='1',
+                        help='Comma-separated detection downscales for --detectors (default: 1)')
+    parser.add_argument('--smile', action='store_true',
+                        help='Measure the smile trigger per --faces count, next to the voice trigger')
+    parser.add_argument('--voice',
+                        help='Comma-separated voice backends to compare, e.g. whisper,faster-whisper')
+    parser.add_argument('--audio-dir', help='Directory of WAV recordings for --voice and --smile')
+    args = parser.parse_args()
+
+    if args.source == 'files' and not args.frames_dir:
+        parser.error('--source files requires --frames-dir')
+
+    if args.frame_assets:
+        frame_assets = [None if a == 'none' else a for a in args.frame_assets.split(',')]
+    else:
+        frame_assets = [None] + sorted(glob.glob('assets/frames/*.png'))[:1]
+
+    hat_path = args.hat or next(iter(sorted(glob.glob('assets/hats/*.png'))), None)
+    hat_image = cv2.imread(hat_path, cv2.IMREAD_UNCHANGED) if hat_path else None
+    hats = []
+    for setting in args.hats.split(','):
+        if setting == 'on' and hat_image is None:
+            logging.warning("No hat image available; skipping hat-on cases.")
+            continue
+        hats.append(hat_image if setting == 'on' else None)
+
+    if args.detectors:
+        from face_detectors import DETECTORS
+
+        detectors = args.detectors.split(',')
+        for name in detectors:
+            if name not in DETECTORS:
+                parser.error(f"Unknown detector '{name}'")
+        scales = [float(scale) for scale in args.detect_scales.split(',')]
+        results = []
+        for resolution in parse_resolutions(args.resolutions):
+            for result in run_detector_cases(args, resolution, detectors, scales):
+                results.append(result)
+                agreement = 'n/a' if result['agreement'] is None else f"{result['agreement'] * 100:.0f}%"
+                print(f"{result['resolution']:>10} {result['detector']:<6} scale={result['scale']:<4g} "
+                      f"p50 {result['ms']['p50']:7.2f}ms  p95 {result['ms']['p95']:7.2f}ms  "
+                      f"faces {result['faces']:<5} agreement {agreement:>4}  extra {result['extra_faces']}")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'meta': metadata(), 'detectors': results}, f, indent=2)
+            logging.info(f"Results written to {args.output}")
+        return
+
+    if args.voice:
+        from voice_listener import VOICE_BACKENDS
+
+        backends = args.voice.split(',')
+        for backend in backends:
+            if backend not in VOICE_BACKENDS:
+                parser.error(f"Unknown voice backend '{backend}'")
+        fixtures = read_audio_fixtures(args.audio_dir)
+        results = []
+        for backend in backends:
+            result = run_voice_case(backend, fixtures)
+            if result:
+                results.append(result)
+                print_voice_result(result)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'meta': metadata(), 'voice': results}, f, indent=2)
+            logging.info(f"Results written to {args.output}")
+        return
+
+    if args.smile:
+        results = []
+        for resolution in parse_resolutions(args.resolutions):
+            for result in run_smile_cases(args, resolution):
+                results.append(result)
+                print(f"{result['resolution']:>10} smile faces={result['faces']:<3} "
+                      f"check p50 {result['check_ms']['p50']:6.2f}ms  p95 {result['check_ms']['p95']:6.2f}ms  "
+                      f"cpu {result['cpu_percent']:5.1f}% at {result['check_fps']:g} checks/s  "
+                      f"(face detection without a hat: p50 {result['detect_ms']['p50']:.1f}ms/frame)")
+        from voice_listener import VOICE_BACKEND
+
+        voice = run_voice_case(VOICE_BACKEND, read_audio_fixtures(args.audio_dir))
+        if voice:
+            print_voice_result(voice)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'meta': metadata(), 'smile': results, 'voice': voice}, f, indent=2)
+            logging.info(f"Results written to {args.output}")
+        return
+
+    processor = FrameProcessor()
+    if args.workers:
+        processor.set_birthday_frame(cv2.imread(frame_assets[-1], cv2.IMREAD_UNCHANGED) if frame_assets[-1] else None)
+        processor.hat = hats[-1] if hats else None
+        results = []
+        for resolution in parse_resolutions(args.resolutions):
+            baseline = None
+            for workers in (int(n) for n in args.workers.split(',')):
+                result = run_scaling_case(args, processor, resolution, workers)
+                results.append(result)
+                baseline = baseline or result['fps']
+                print(f"{result['resolution']:>10} workers={workers:<3} {result['fps']:7.1f} fps  "
+                      f"x{result['fps'] / baseline:.2f}")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'meta': metadata(), 'scaling': results}, f, indent=2)
+            logging.info(f"Results written to {args.output}")
+        return
+
+    from chroma_key import BACKGROUNDS_DIR, ChromaKeyer
+    from effects import EFFECT_PRESETS
+
+    effects = args.effects.split(',')
+    for effect in effects:
+        if effect not in EFFECT_PRESETS:
+            parser.error(f"Unknown effect '{effect}'")
+
+    background_path = args.background or next(iter(sorted(glob.glob(f'{BACKGROUNDS_DIR}/*.png'))), None)
+    background_image = cv2.imread(background_path, cv2.IMREAD_UNCHANGED) if background_path else None
+    backgrounds = []
+    for setting in args.backgrounds.split(','):
+        if setting == 'on' and background_image is None:
+            logging.warning("No background image available; skipping background-on cases.")
+            continue
+        backgrounds.append(background_image if setting == 'on' else None)
+
+    if any(background is not None for background in backgrounds) and processor.chroma_keyer is None:
+        processor.chroma_keyer = ChromaKeyer()
+    cases = [(background, effect, frame_asset, hat, faces)
+             for background in backgrounds for effect in effects for frame_asset in frame_assets for hat in hats
+             # Face counts only matter when a hat is drawn
+             for faces in (args.faces.split(',') if hat is not None else ['0'])]
+    results = []
+    for resolution in parse_resolutions(args.resolutions):
+        for background, effect, frame_asset, hat, faces in cases:
+            result = run_case(args, processor, resolution, background, effect, frame_asset, hat, faces)
+            results.append(result)
+            total = result['stages']['total']
+            print(f"{result['resolution']:>10} bg={'on ' if result['background'] else 'off'} effect={effect:<8} "
+                  f"frame={result['frame_asset']:<20} hat={'on ' if result['hat'] else 'off'} faces={faces:<6} "
+                  f"{result['fps']:7.1f} fps  p50 {total['p50']:6.2f}ms  p99 {total['p99']:6.2f}ms  "
+                  f"cpu {result['cpu_percent']:5.0f}%  alloc {(result['alloc_peak_bytes'] or 0) / 1e6:6.1f}MB")
+            if result['background']:
+                print(' ' * 11 + '  '.join(f"{stage} {result['stages'][stage]['p50']:.2f}ms"
+                                           for stage in KEY_STAGES if stage in result['stages']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+        logging.info(f"Results written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
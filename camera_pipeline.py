@@ -0,0 +1,368 @@
+"""
+GStreamer capture pipeline for the photobooth camera.
+
+A `CameraPipeline` wraps one `v4l2src ! ... ! appsink` pipeline. Pipelines
+start out inactive: they run and record when their first frame arrives, but
+only hand samples to the app once they are activated. This lets a new
+pipeline warm up next to the old one before the switch-over.
+
+For MJPG cameras the decode path is chosen from what is installed (see
+`MJPG_DECODER`). In the "libjpeg" mode the appsink receives the JPEG frames
+as they come from the camera and the app decodes them with OpenCV, straight
+to BGR and optionally at a reduced size (`PREVIEW_SCALE`) using libjpeg's
+DCT scaling, which skips most of the decode work. In the other MJPG modes
+the camera's JPEG frames can also be kept on a side branch (`keep_jpeg`) so
+that photos can be saved without re-encoding.
+
+Instead of a camera, a pipeline can read from a stand-in source, to profile
+or load-test the booth without hardware: GStreamer's `videotestsrc`, a video
+file (looped) or a numbered image sequence. These are scaled to the requested
+format and, for MJPG, encoded to JPEG, so frames take the same decode path as
+a camera's. They run in real time or, with `SOURCE_PACING=fast`, as fast as
+the app takes their frames (see `source_kind`).
+"""
+import logging
+import os
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from metrics import metrics
+from pipeline_profiler import ElementProfiler
+
+# --- CONFIGURATION ---
+# MJPG decode path: "auto", "hw", "jpegdec" or "libjpeg"
+MJPG_DECODER = os.environ.get('MJPG_DECODER', 'auto')
+# Preview downscale for the "libjpeg" decoder: 1, 2, 4 or 8
+PREVIEW_SCALE = int(os.environ.get('PREVIEW_SCALE', '1'))
+# videoconvert worker threads, 0 for one per core
+CONVERT_THREADS = int(os.environ.get('CONVERT_THREADS', '0'))
+# Log per-element processing time
+PIPELINE_PROFILE = os.environ.get('PIPELINE_PROFILE')
+# Stand-in sources: "realtime" (at their framerate) or "fast" (as fast as frames are taken)
+SOURCE_PACING = os.environ.get('SOURCE_PACING', 'realtime')
+# --- END CONFIGURATION ---
+
+# Hardware JPEG decoders, in order of preference
+HW_JPEG_DECODERS = ['v4l2jpegdec', 'vajpegdec', 'vaapijpegdec']
+
+profiler = ElementProfiler() if PIPELINE_PROFILE else None
+
+
+class GlibMainLoopWorker(threading.Thread):
+    """A worker thread that runs the GLib.MainLoop."""
+    def __init__(self, **kwargs):
+        super(GlibMainLoopWorker, self).__init__(**kwargs)
+        self.main_loop = GLib.MainLoop()
+
+    def run(self):
+        logging.info("GLib main loop worker started.")
+        self.main_loop.run()
+        logging.info("GLib main loop worker stopped.")
+
+    def stop(self):
+        if self.main_loop.is_running():
+            self.main_loop.quit()
+
+
+def source_kind(device_path):
+    """
+    Returns what kind of source a device path names.
+
+    Returns:
+        str: "v4l2" for a device node such as "/dev/video0", "videotestsrc"
+             for "videotestsrc" or "videotestsrc:PATTERN" (e.g.
+             "videotestsrc:smpte"), "images" for an image sequence pattern
+             such as "recording/%05d.jpg", and "file" for anything else,
+             which is played as a video file.
+    """
+    if device_path.partition(':')[0] == 'videotestsrc':
+        return 'videotestsrc'
+    if device_path.startswith('/dev/'):
+        return 'v4l2'
+    if '%' in os.path.basename(device_path):
+        return 'images'
+    return 'file'
+
+
+def stand_in_description(device_path, w, h, pixel_format, framerate, live):
+    """
+    Returns the gst-launch description of a stand-in source bin that
+    produces what a camera would for the format.
+
+    Args:
+        device_path (str): The source, see `source_kind`.
+        w (int): Frame width.
+        h (int): Frame height.
+        pixel_format (str): "MJPG", or a GStreamer raw format such as "YUY2".
+        framerate (int): Frames per second.
+        live (bool): Produce frames in real time (only matters for
+            `videotestsrc`; file sources are paced by the appsink).
+    """
+    kind = source_kind(device_path)
+    if kind == 'videotestsrc':
+        pattern = device_path.partition(':')[2] or 'ball'
+        head = f"videotestsrc pattern={pattern} is-live={'true' if live else 'false'}"
+    elif kind == 'images':
+        # Sequences usually start at 0 or 1
+        start = next((i for i in (0, 1) if os.path.exists(device_path % i)), 0)
+        image_caps = 'image/png' if device_path.lower().endswith('.png') else 'image/jpeg'
+        head = (f'multifilesrc location="{device_path}" index={start} loop=true '
+                f'caps="{image_caps},framerate={framerate}/1" ! decodebin')
+    else:
+        head = f'filesrc location="{device_path}" ! decodebin'
+    description = (f"{head} ! videoconvert ! videoscale ! videorate ! "
+                   f"video/x-raw,width={w},height={h},framerate={framerate}/1")
+    if pixel_format == 'MJPG':
+        return f"{description} ! jpegenc"
+    return f"{description} ! videoconvert ! video/x-raw,format={pixel_format}"
+
+
+def select_mjpg_decoder():
+    """
+    Picks the MJPG decode path.
+
+    Returns:
+        tuple: (mode, element_name), where mode is "hw", "jpegdec" or
+               "libjpeg" and element_name is the decoder element to use, or
+               None when the app decodes the frames itself.
+    """
+    mode = MJPG_DECODER
+    if mode in ('auto', 'hw'):
+        for name in HW_JPEG_DECODERS:
+            if Gst.ElementFactory.find(name):
+                return 'hw', name
+        if mode == 'hw':
+            logging.warning("No hardware JPEG decoder found; using a software decoder.")
+        mode = 'libjpeg' if PREVIEW_SCALE > 1 else 'jpegdec'
+
+    if mode == 'libjpeg':
+        return 'libjpeg', None
+    if mode != 'jpegdec':
+        logging.warning(f"Unknown MJPG_DECODER '{MJPG_DECODER}'; using jpegdec.")
+    return 'jpegdec', 'jpegdec'
+
+
+class CameraPipeline:
+    """
+    A camera capture pipeline that delivers samples to a callback.
+
+    Samples are BGR frames, except in the "libjpeg" MJPG mode where they are
+    the camera's JPEG frames.
+    """
+    def __init__(self, device_path, w, h, pixel_format, framerate, on_sample, keep_jpeg=False,
+                 pacing=SOURCE_PACING):
+        """
+        Builds (but does not start) the pipeline.
+
+        Args:
+            device_path (str): The V4L2 device node, e.g. "/dev/video0", or a
+                stand-in source (see `source_kind`).
+            w (int): Capture width.
+            h (int): Capture height.
+            pixel_format (str): The V4L2 fourcc, e.g. "MJPG" or "YUYV".
+            framerate (int): Capture framerate.
+            on_sample: Called with each `Gst.Sample` and a dict of timestamps
+                once the pipeline is active. The dict holds `t_appsink`, the
+                `time.monotonic()` arrival time, and `capture_delay`, the
+                seconds between capture (the buffer PTS) and arrival, or None.
+            keep_jpeg (bool): For MJPG, keep the latest camera JPEG available
+                through `get_latest_jpeg`.
+            pacing (str): For stand-in sources, "realtime" or "fast".
+        """
+        self.device_path = device_path
+        self.kind = source_kind(device_path)
+        # Cameras are always live; stand-ins only when paced in real time
+        self.live = self.kind == 'v4l2' or pacing != 'fast'
+        self.format = (w, h, pixel_format, framerate)
+        self.on_sample = on_sample
+        self.active = False
+        self.first_sample = threading.Event()
+        self.start_time = None
+        self.first_sample_time = None
+        self.still_sink = None
+        self._latest_jpeg = None
+        self._last_sequence = None
+        self._appsink_buffers = 0
+        self._appsink_pulled = 0
+
+        self.pipeline = Gst.Pipeline.new("camera-pipeline")
+        if self.kind == 'v4l2':
+            source = Gst.ElementFactory.make("v4l2src", "source")
+            source.set_property("device", device_path)
+        else:
+            source = Gst.parse_bin_from_description(
+                stand_in_description(device_path, w, h, pixel_format, framerate, self.live), True
+            )
+
+        if pixel_format == 'MJPG':
+            caps_str = f"image/jpeg,width={w},height={h},framerate={framerate}/1"
+            self.decoder_mode, decoder_name = select_mjpg_decoder()
+        else:
+            caps_str = f"video/x-raw,format={pixel_format},width={w},height={h},framerate={framerate}/1"
+            self.decoder_mode, decoder_name = 'raw', None
+
+        caps = Gst.Caps.from_string(caps_str)
+        caps_filter = Gst.ElementFactory.make("capsfilter", "caps_filter")
+        caps_filter.set_property("caps", caps)
+
+        self.sink = Gst.ElementFactory.make("appsink", "sink")
+        self.sink.set_property("emit-signals", True)
+        self.sink.set_property("max-buffers", 1)
+        self.sink.set_property("drop", True)
+        if not self.live:
+            self.sink.set_property("sync", False)
+        self.sink.connect("new-sample", self._on_new_sample)
+
+        elements = [source, caps_filter]
+        if decoder_name:
+            elements.append(Gst.ElementFactory.make(decoder_name, "decoder"))
+        if self.decoder_mode != 'libjpeg':
+            videoconvert = Gst.ElementFactory.make("videoconvert", "videoconvert")
+            if videoconvert.find_property("n-threads"):
+                videoconvert.set_property("n-threads", CONVERT_THREADS)
+            final_caps = Gst.Caps.from_string("video/x-raw,format=BGR")
+            final_caps_filter = Gst.ElementFactory.make("capsfilter", "final_caps_filter")
+            final_caps_filter.set_property("caps", final_caps)
+            elements += [videoconvert, final_caps_filter]
+        elements.append(self.sink)
+
+        if keep_jpeg and decoder_name:
+            # Split the camera JPEGs off before decoding. The branch holds only
+            # the newest frame and is pulled from when a photo is taken.
+            tee = Gst.ElementFactory.make("tee", "jpeg_tee")
+            elements.insert(2, tee)
+            still_queue = Gst.ElementFactory.make("queue", "still_queue")
+            still_queue.set_property("leaky", 2)  # downstream
+            still_queue.set_property("max-size-buffers", 1)
+            self.still_sink = Gst.ElementFactory.make("appsink", "still_sink")
+            self.still_sink.set_property("max-buffers", 1)
+            self.still_sink.set_property("drop", True)
+            self.still_sink.set_property("sync", False)
+            for el in (still_queue, self.still_sink):
+                self.pipeline.add(el)
+            still_queue.link(self.still_sink)
+
+        for el in elements:
+            self.pipeline.add(el)
+        for upstream, downstream in zip(elements, elements[1:]):
+            upstream.link(downstream)
+        if self.still_sink:
+            tee.link(still_queue)
+
+        # Count frames lost before the appsink (v4l2src numbers buffers with
+        # the driver's sequence counter) and frames dropped by the appsink.
+        source.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_camera_buffer)
+        self.sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_appsink_buffer)
+
+        self._bus = None
+        if self.kind == 'file':
+            # Loop the video, like a camera that never stops
+            self._bus = self.pipeline.get_bus()
+            self._bus.add_signal_watch()
+            self._bus.connect("message::eos", self._on_eos)
+
+        logging.info(f"Built pipeline for {device_path} with decode path '{self.decoder_mode}'"
+                     f"{f' ({decoder_name})' if decoder_name else ''}.")
+        if profiler:
+            profiler.attach(self.pipeline)
+
+    def _on_camera_buffer(self, pad, info):
+        sequence = info.get_buffer().offset
+        if sequence != Gst.BUFFER_OFFSET_NONE and self.kind == 'v4l2':
+            if self._last_sequence is not None and sequence > self._last_sequence + 1:
+                metrics.inc('dropped_camera', sequence - self._last_sequence - 1)
+            self._last_sequence = sequence
+        metrics.inc('frames_captured')
+        return Gst.PadProbeReturn.OK
+
+    def _on_eos(self, bus, message):
+        self.pipeline.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT, 0)
+
+    def _on_appsink_buffer(self, pad, info):
+        self._appsink_buffers += 1
+        return Gst.PadProbeReturn.OK
+
+    def running_time(self):
+        """Returns the pipeline's current running time in nanoseconds, or None."""
+        clock = self.pipeline.get_clock()
+        if clock is None:
+            return None
+        return clock.get_time() - self.pipeline.get_base_time()
+
+    def _on_new_sample(self, sink):
+        sample = sink.emit("pull-sample")
+        if sample:
+            stamps = {'t_appsink': time.monotonic(), 'capture_delay': None}
+            self._appsink_pulled += 1
+            # The probe and this signal both run on the streaming thread
+            dropped = self._appsink_buffers - self._appsink_pulled
+            if dropped > 0:
+                metrics.inc('dropped_appsink', dropped)
+                self._appsink_pulled = self._appsink_buffers
+
+            pts = sample.get_buffer().pts
+            running_time = self.running_time()
+            if pts != Gst.CLOCK_TIME_NONE and running_time is not None and self.live:
+                stamps['capture_delay'] = max(running_time - pts, 0) / Gst.SECOND
+                metrics.observe('capture_to_appsink', stamps['capture_delay'])
+
+            if not self.first_sample.is_set():
+                self.first_sample_time = time.monotonic()
+                self.first_sample.set()
+            if self.active:
+                self.on_sample(sample, stamps)
+        return Gst.FlowReturn.OK
+
+    def get_latest_jpeg(self):
+        """
+        Returns the newest camera JPEG from the side branch as bytes, or None.
+        """
+        if self.still_sink is None:
+            return None
+        sample = self.still_sink.emit("try-pull-sample", 0)
+        if sample:
+            buf = sample.get_buffer()
+            self._latest_jpeg = buf.extract_dup(0, buf.get_size())
+        return self._latest_jpeg
+
+    def start(self):
+        """
+        Sets the pipeline to PLAYING.
+
+        Returns:
+            bool: False if the state change failed outright.
+        """
+        self.start_time = time.monotonic()
+        ret = self.pipeline.set_state(Gst.State.PLAYING)
+        if ret == Gst.StateChangeReturn.FAILURE:
+            logging.error(f"Unable to set the pipeline for {self.device_path} to the playing state.")
+            self.pipeline.set_state(Gst.State.NULL)
+            return False
+        return True
+
+    def wait_for_first_sample(self, timeout):
+        """
+        Blocks until the first frame has reached the appsink.
+
+        Live sources do not preroll in PAUSED, so the first delivered frame is
+        what tells us the camera has finished negotiating and is streaming.
+
+        Args:
+            timeout (float): Seconds to wait.
+
+        Returns:
+            bool: True if a frame arrived in time.
+        """
+        return self.first_sample.wait(timeout)
+
+    def stop(self):
+        """Stops the pipeline and releases the device."""
+        self.active = False
+        self.pipeline.set_state(Gst.State.NULL)
+        if self._bus:
+            self._bus.remove_signal_watch()
+            self._bus = None  # Safe to stop twice
@@ -0,0 +1,129 @@
+"""
+Hotplug-aware camera registry backed by GStreamer's device monitor.
+
+The registry keeps a dictionary of cameras in the same form that
+`CameraApp.get_available_cameras` produces and reports cameras being plugged
+in and removed. Bus messages are dispatched on the default GLib main context,
+which is run by the app's `GlibMainLoopWorker`, so the callbacks are invoked
+on that thread.
+"""
+import logging
+import re
+import threading
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+# Properties the v4l2 device provider uses for the device node, newest first
+DEVICE_PATH_PROPERTIES = ('api.v4l2.path', 'device.path')
+
+
+def _device_path(device):
+    props = device.get_properties()
+    if props is None:
+        return None
+    for key in DEVICE_PATH_PROPERTIES:
+        if props.has_field(key):
+            path = props.get_string(key)
+            if path and path.startswith('/dev/video'):
+                return path
+    return None
+
+
+class CameraRegistry:
+    """
+    Tracks V4L2 capture devices using `Gst.DeviceMonitor` events.
+
+    Cameras are named "Camera <n>" after their /dev/video<n> node, matching
+    the names used by the one-off scan in `CameraApp.get_available_cameras`.
+    """
+    def __init__(self, on_added=None, on_removed=None):
+        """
+        Initializes the CameraRegistry.
+
+        Args:
+            on_added: Called with (name, info) when a camera appears.
+            on_removed: Called with (name, info) when a camera disappears.
+        """
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.monitor = Gst.DeviceMonitor.new()
+        self.monitor.add_filter("Video/Source", None)
+        self._cameras = {}
+        self._lock = threading.Lock()
+        self._watch_id = None
+
+    def _camera_from_device(self, device):
+        path = _device_path(device)
+        if path is None:
+            return None, None
+        match = re.search(r'\d+$', path)
+        if not match:
+            return None, None
+        index = int(match.group(0))
+        return f"Camera {index}", {'index': index, 'type': 'v4l2', 'card': device.get_display_name()}
+
+    def _add_device(self, device):
+        name, info = self._camera_from_device(device)
+        if name is None:
+            return None, None
+        with self._lock:
+            if self._cameras.get(name) == info:
+                return None, None
+            self._cameras[name] = info
+        logging.info(f"Camera added: {name} ({info['card']})")
+        return name, info
+
+    def _remove_device(self, device):
+        name, _ = self._camera_from_device(device)
+        if name is None:
+            return None, None
+        with self._lock:
+            info = self._cameras.pop(name, None)
+        if info is None:
+            return None, None
+        logging.info(f"Camera removed: {name} ({info['card']})")
+        return name, info
+
+    def _on_bus_message(self, bus, message):
+        if message.type == Gst.MessageType.DEVICE_ADDED:
+            name, info = self._add_device(message.parse_device_added())
+            if name and self.on_added:
+                self.on_added(name, info)
+        elif message.type == Gst.MessageType.DEVICE_REMOVED:
+            name, info = self._remove_device(message.parse_device_removed())
+            if name and self.on_removed:
+                self.on_removed(name, info)
+        return True
+
+    def start(self):
+        """
+        Starts monitoring and records the cameras that are already present.
+
+        Returns:
+            bool: True if the device monitor started.
+        """
+        self._watch_id = self.monitor.get_bus().add_watch(GLib.PRIORITY_DEFAULT, self._on_bus_message)
+        if not self.monitor.start():
+            logging.error("Failed to start the GStreamer device monitor.")
+            GLib.source_remove(self._watch_id)
+            self._watch_id = None
+            return False
+
+        for device in self.monitor.get_devices() or []:
+            self._add_device(device)
+        logging.info(f"Device monitor started with cameras: {self.get_cameras()}")
+        return True
+
+    def stop(self):
+        """Stops monitoring."""
+        if self._watch_id is not None:
+            self.monitor.stop()
+            GLib.source_remove(self._watch_id)
+            self._watch_id = None
+
+    def get_cameras(self):
+        """Returns a snapshot of the known cameras, ordered by device index."""
+        with self._lock:
+            return dict(sorted(self._cameras.items(), key=lambda item: item[1]['index']))
@@ -0,0 +1,265 @@
+"""
+Short animated clip capture ("boomerang") for the photobooth.
+
+A `ClipRecorder` is fed processed preview frames by the frame processor
+worker. Frames are taken at the clip framerate, scaled down on the
+recorder's own thread and pushed straight into a GStreamer encoding
+pipeline (`appsrc ! videoconvert ! <encoder> ! filesink`), so the clip is
+encoded while it is being recorded rather than collected first.
+
+Frames from a `frame_pool` slot keep the slot until the recorder thread has
+scaled them down, so the worker never copies a full frame for the clip.
+
+Memory is bounded by a small hand-off queue and, for boomerang clips, a ring
+of the scaled frames that is played back in reverse once the forward pass is
+done. Both are sized from `CLIP_SECONDS`, `CLIP_FPS` and `CLIP_WIDTH`.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from metrics import metrics
+
+# --- CONFIGURATION ---
+CLIP_FORMAT = os.environ.get('CLIP_FORMAT', 'gif').lower()  # gif, webp or mp4
+CLIP_SECONDS = float(os.environ.get('CLIP_SECONDS', '3'))
+CLIP_FPS = int(os.environ.get('CLIP_FPS', '10'))
+CLIP_WIDTH = int(os.environ.get('CLIP_WIDTH', '480'))       # Clip frame width in pixels
+CLIP_BOOMERANG = os.environ.get('CLIP_BOOMERANG', '1') != '0'  # Play the clip forwards then backwards
+# --- END CONFIGURATION ---
+
+CLIP_QUEUE_FRAMES = 4  # Frames waiting to be scaled and encoded
+
+# Clip format -> (file extension, candidate encoder branches in order of preference)
+CLIP_FORMATS = {
+    'gif': ('.gif', [
+        ('gifenc', 'gifenc'),
+        ('avenc_gif', 'avenc_gif ! avmux_gif'),
+    ]),
+    'webp': ('.webp', [
+        ('webpenc', 'webpenc animated=true'),
+    ]),
+    'mp4': ('.mp4', [
+        ('x264enc', 'x264enc speed-preset=ultrafast tune=zerolatency ! h264parse ! mp4mux'),
+        ('openh264enc', 'openh264enc ! h264parse ! mp4mux'),
+    ]),
+}
+
+if CLIP_FORMAT not in CLIP_FORMATS:
+    logging.warning(f"Unknown CLIP_FORMAT '{CLIP_FORMAT}'; recording GIF clips.")
+    CLIP_FORMAT = 'gif'
+
+
+def clip_extension(clip_format):
+    """Returns the file extension for a clip format, e.g. ".gif"."""
+    return CLIP_FORMATS[clip_format][0]
+
+
+def select_clip_encoder(clip_format):
+    """
+    Returns the encoder branch description for a clip format, or None if no
+    suitable GStreamer encoder is installed.
+    """
+    for element, description in CLIP_FORMATS[clip_format][1]:
+        if Gst.ElementFactory.find(element):
+            return description
+    return None
+
+
+class ClipRecorder(threading.Thread):
+    """
+    A worker thread that records one clip.
+
+    Call `push` with each processed frame; frames are accepted until the clip
+    is full. `on_done` is called from the recorder thread with the filename
+    once the file is complete, or None if encoding failed.
+    """
+    def __init__(self, filename, on_done=None, clip_format=CLIP_FORMAT, seconds=CLIP_SECONDS,
+                 fps=CLIP_FPS, width=CLIP_WIDTH, boomerang=CLIP_BOOMERANG, **kwargs):
+        super(ClipRecorder, self).__init__(daemon=True, **kwargs)
+        self.filename = filename
+        self.on_done = on_done
+        self.clip_format = clip_format
+        self.fps = fps
+        self.width = width
+        self.boomerang = boomerang
+        self.frame_count = max(int(seconds * fps), 1)
+        self.recording = True
+        self.frames = queue.Queue(maxsize=CLIP_QUEUE_FRAMES)
+        self._accepted = 0
+        self._lock = threading.Lock()  # Keeps push from queueing a frame after the last one is taken
+        self._next_frame_time = None
+        self._pipeline = None
+        self._appsrc = None
+        self._pushed = 0
+
+    def push(self, frame, release=None):
+        """
+        Offers a frame to the clip. Only frames on the clip's frame clock are kept.
+
+        Called from the frame processor worker, so it never blocks. For a
+        frame whose memory is reused (see `frame_pool`), `release` is called
+        once the recorder no longer needs it: after the recorder thread has
+        scaled it down, or straight away if the frame is not kept.
+        """
+        with self._lock:
+            kept = self._offer(frame, release)
+        if not kept and release:
+            release()
+
+    def _offer(self, frame, release):
+        if not self.recording:
+            return False
+        now = time.monotonic()
+        if self._next_frame_time is None:
+            self._next_frame_time = now
+        if now < self._next_frame_time:
+            return False
+        self._next_frame_time += 1.0 / self.fps
+        try:
+            self.frames.put_nowait((frame, release))
+        except queue.Full:
+            metrics.inc('dropped_clip') # Encoder is lagging
+            return False
+        self._accepted += 1
+        if self._accepted >= self.frame_count:
+            self.recording = False
+        return True
+
+    def _build_pipeline(self, w, h):
+        encoder = select_clip_encoder(self.clip_format)
+        if encoder is None:
+            logging.error(f"No GStreamer encoder found for {self.clip_format} clips.")
+            return False
+        try:
+            self._pipeline = Gst.parse_launch(
+                f"appsrc name=src format=time block=true "
+                f"caps=video/x-raw,format=BGR,width={w},height={h},framerate={self.fps}/1 ! "
+                f"videoconvert ! {encoder} ! filesink name=sink"
+            )
+        except GLib.Error as e:
+            logging.error(f"Failed to build the {self.clip_format} clip encoder: {e}")
+            return False
+        self._pipeline.get_by_name('sink').set_property('location', self.filename)
+        self._appsrc = self._pipeline.get_by_name('src')
+        # Bound what GStreamer itself may queue in front of the encoder
+        self._appsrc.set_property('max-bytes', w * h * 3 * CLIP_QUEUE_FRAMES)
+        if self._pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            logging.error(f"Unable to start the {self.clip_format} clip encoder.")
+            return False
+        return True
+
+    def _push_to_encoder(self, frame):
+        buf = Gst.Buffer.new_wrapped(frame.tobytes())
+        buf.pts = self._pushed * Gst.SECOND // self.fps
+        buf.duration = Gst.SECOND // self.fps
+        self._pushed += 1
+        return self._appsrc.emit('push-buffer', buf) == Gst.FlowReturn.OK
+
+    def _scale(self, frame, release=None):
+        """Returns the frame at the clip width, as a frame of its own if `release` is set."""
+        h, w = frame.shape[:2]
+        if w <= self.width:
+            scaled = frame.copy() if release else frame
+        else:
+            height = round(h * self.width / w) // 2 * 2  # Even sizes keep the video encoders happy
+            scaled = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if release:
+            release()
+        return scaled
+
+    def _drain(self):
+        """Releases the frames left in the queue once recording is over."""
+        with self._lock:
+            self.recording = False
+        while True:
+            try:
+                _, release = self.frames.get_nowait()
+            except queue.Empty:
+                return
+            if release:
+                release()
+
+    def run(self):
+        start = time.perf_counter()
+        ring = []  # Scaled frames kept for the reverse pass
+        ring_shape = None
+        ok = True
+        received = 0
+        while received < self.frame_count and ok:
+            try:
+                frame, release = self.frames.get(timeout=1.0)
+            except queue.Empty:
+                if not self.recording:
+                    break
+                continue
+            received += 1
+            frame = self._scale(frame, release)
+            if self._pipeline is None:
+                h, w = frame.shape[:2]
+                if not self._build_pipeline(w, h):
+                    ok = False
+                    break
+                if self.boomerang:
+                    logging.info(f"Clip ring holds up to {self.frame_count} frames "
+                                 f"({self.frame_count * w * h * 3 / 1e6:.1f}MB).")
+            elif frame.shape[:2] != ring_shape:
+                # The camera format changed mid-clip; keep the encoder's size
+                frame = cv2.resize(frame, (ring_shape[1], ring_shape[0]), interpolation=cv2.INTER_AREA)
+            ring_shape = frame.shape[:2]
+            ok = self._push_to_encoder(frame)
+            if self.boomerang:
+                ring.append(frame)
+
+        recorded = time.perf_counter()
+        self._drain()
+        if ok and self.boomerang:
+            # Skip the end frames so they are not shown twice at the turn-around
+            for frame in reversed(ring[1:-1]):
+                if not self._push_to_encoder(frame):
+                    ok = False
+                    break
+        ring.clear()
+
+        ok = ok and self._pipeline is not None and self._finish()
+        if self._pipeline is not None:
+            self._pipeline.set_state(Gst.State.NULL)
+        end = time.perf_counter()
+
+        if ok:
+            metrics.observe('clip_encode', end - start)
+            metrics.observe('clip_finish', end - recorded)
+            size = os.path.getsize(self.filename)
+            logging.info(f"Clip saved as {self.filename} ({self._pushed} frames, {size / 1024:.0f}KB, "
+                         f"{end - start:.2f}s total, {(end - recorded) * 1000:.0f}ms after recording)")
+        else:
+            logging.error(f"Failed to record clip {self.filename}.")
+        if self.on_done:
+            self.on_done(self.filename if ok else None)
+
+    def _finish(self):
+        """Sends end-of-stream and waits for the file to be completed."""
+        self._appsrc.emit('end-of-stream')
+        message = self._pipeline.get_bus().timed_pop_filtered(
+            10 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR
+        )
+        if message is None:
+            logging.error("Timed out finishing the clip.")
+            return False
+        if message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            logging.error(f"Clip encoder error: {err}, {debug}")
+            return False
+        return True
+
+    def stop(self):
+        """Stops accepting frames; the clip is finished with what was recorded."""
+        self.recording = False
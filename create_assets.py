@@ -1,7 +1,17 @@
+import argparse
+import glob
+import io
+import math
 import os
 import random
 import logging
-from PIL import Image as PILImage, ImageDraw
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image as PILImage, ImageColor, ImageDraw
 
 logging.basicConfig(level=logging.INFO)
 
@@ -9,6 +19,19 @@ logging.basicConfig(level=logging.INFO)
 DEFAULT_BANNER_PATH = 'assets/default_banner.png'
 # --- END CONFIGURATION ---
 
+FRAMES_DIR = 'assets/frames'
+BASE_FRAME_SIZE = (800, 600)  # Shape counts and sizes are defined at this size
+BENCHMARK_RESOLUTIONS = '800x600,1920x1080,3840x2160'
+BACKGROUNDS_DIR = 'assets/backgrounds'
+BACKGROUND_SIZE = (1920, 1080)
+
+# Frame themes: shape count and size range at BASE_FRAME_SIZE, and colours
+FRAME_THEMES = {
+    'confetti': {'count': 500, 'sizes': (3, 8), 'colors': ["#FFD700", "#FF6347", "#00CED1", "#9370DB", "#32CD32"]},
+    'balloons': {'count': 25, 'sizes': (20, 50), 'colors': ["#FF69B4", "#1E90FF", "#FFA500", "#FF4500"]},
+    'stars': {'count': 150, 'sizes': (8, 25), 'colors': ["yellow"]},
+}
+
 def create_default_banner_if_needed():
     """
     Checks if a default banner image exists and creates one if it does not.
@@ -60,59 +83,284 @@ def create_birthday_frames_if_needed():
 
     The frames are simple images with birthday-themed decorations, saved as
     PNG files in the `assets/frames/` directory. All frames only use the
-    outer 20% of the image area.
+    outer 20% of the image area. They are drawn with the same seeded
+    renderer as the `WxH` variants, so every size has the same layout.
     """
     frames_dir = 'assets/frames'
     if not os.path.exists(frames_dir):
         os.makedirs(frames_dir)
 
-    frame_paths = [os.path.join(frames_dir, f) for f in [
-        'frame_confetti.png', 'frame_balloons.png', 'frame_stars.png'
-    ]]
-    width, height = 800, 600
+    for theme in FRAME_THEMES:
+        frame_path = os.path.join(frames_dir, f'frame_{theme}.png')
+        if not os.path.exists(frame_path):
+            logging.info(f"Creating {theme} frame at {frame_path}")
+            _render_variant(theme, *BASE_FRAME_SIZE, frame_path)
 
-    # Frame 1: Confetti
-    if not os.path.exists(frame_paths[0]):
-        logging.info(f"Creating confetti frame at {frame_paths[0]}")
-        img = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        colors = ["#FFD700", "#FF6347", "#00CED1", "#9370DB", "#32CD32"]
-        for _ in range(500):
-            x, y = _get_random_point_in_border(width, height)
-            size = random.randint(3, 8)
-            draw.ellipse([x, y, x + size, y + size], fill=random.choice(colors))
-        img.save(frame_paths[0])
 
-    # Frame 2: Balloons
-    if not os.path.exists(frame_paths[1]):
-        logging.info(f"Creating balloons frame at {frame_paths[1]}")
-        img = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        colors = ["#FF69B4", "#1E90FF", "#FFA500", "#FF4500"]
-        for _ in range(25):
-            x, y = _get_random_point_in_border(width, height)
-            size = random.randint(20, 50)
+def _theme_scale(width, height):
+    """Returns (size scale, count scale) for a frame size relative to BASE_FRAME_SIZE."""
+    area_ratio = width * height / (BASE_FRAME_SIZE[0] * BASE_FRAME_SIZE[1])
+    return math.sqrt(area_ratio), area_ratio
+
+
+def draw_frame_pillow(theme, width, height):
+    """
+    Draws a themed frame one shape at a time with Pillow's ImageDraw.
+
+    Shape counts and sizes are scaled from BASE_FRAME_SIZE so that the frame
+    looks the same at any size.
+
+    Returns:
+        PIL.Image.Image: The RGBA frame.
+    """
+    spec = FRAME_THEMES[theme]
+    scale, count_scale = _theme_scale(width, height)
+    min_size, max_size = (round(size * scale) for size in spec['sizes'])
+    colors = spec['colors']
+    img = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for _ in range(round(spec['count'] * count_scale)):
+        x, y = _get_random_point_in_border(width, height)
+        size = random.randint(min_size, max_size)
+        if theme == 'confetti':
+            draw.ellipse([x, y, x + size, y + size], fill=random.choice(colors))
+        elif theme == 'balloons':
             # Balloon shape
             draw.ellipse([x, y, x + size, y + size * 1.2], fill=random.choice(colors))
             # String
-            draw.line([x + size / 2, y + size * 1.2, x + size / 2, y + size * 1.2 + 20], fill="grey")
-        img.save(frame_paths[1])
-
-    # Frame 3: Stars
-    if not os.path.exists(frame_paths[2]):
-        logging.info(f"Creating stars frame at {frame_paths[2]}")
-        img = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        for _ in range(150):
-            x, y = _get_random_point_in_border(width, height)
-            size = random.randint(8, 25)
+            draw.line([x + size / 2, y + size * 1.2, x + size / 2, y + size * 1.2 + 20 * scale], fill="grey")
+        else:
             # Simple star polygon
             draw.polygon([
                 (x, y - size), (x + size * 0.3, y - size * 0.3), (x + size, y),
                 (x + size * 0.3, y + size * 0.3), (x, y + size), (x - size * 0.3, y + size * 0.3),
                 (x - size, y), (x - size * 0.3, y - size * 0.3)
-            ], fill="yellow")
-        img.save(frame_paths[2])
+            ], fill=random.choice(colors))
+    return img
+
+
+def _random_border_points(rng, count, width, height):
+    """Vectorised `_get_random_point_in_border`: returns arrays of x and y."""
+    border_w, border_h = int(width * 0.15), int(height * 0.15)
+    side = rng.integers(0, 4, count)
+    x = rng.integers(0, width + 1, count)
+    y = rng.integers(0, height + 1, count)
+    y = np.where(side == 0, rng.integers(0, border_h + 1, count), y)
+    y = np.where(side == 1, rng.integers(height - border_h, height + 1, count), y)
+    x = np.where(side == 2, rng.integers(0, border_w + 1, count), x)
+    x = np.where(side == 3, rng.integers(width - border_w, width + 1, count), x)
+    return x, y
+
+
+SUBPIXEL_SHIFT = 4  # Polygon vertices are in 1/16 pixel units
+ELLIPSE_POINTS = 32
+
+
+def _ellipse_polygons(xs, ys, ws, hs):
+    """
+    Returns polygons approximating the ellipses in the boxes (x, y, x + w, y + h),
+    as ImageDraw.ellipse draws them, for all shapes at once.
+    """
+    theta = np.linspace(0, 2 * np.pi, ELLIPSE_POINTS, endpoint=False)
+    rx, ry = ws[:, None] / 2, hs[:, None] / 2
+    px = xs[:, None] + rx + rx * np.cos(theta)
+    py = ys[:, None] + ry + ry * np.sin(theta)
+    return np.round(np.stack([px, py], axis=-1) * (1 << SUBPIXEL_SHIFT)).astype(np.int32)
+
+
+def _star_polygons(xs, ys, sizes):
+    """Returns the star polygons centred on (x, y) for all shapes at once."""
+    unit = np.array([
+        (0, -1), (0.3, -0.3), (1, 0), (0.3, 0.3), (0, 1), (-0.3, 0.3), (-1, 0), (-0.3, -0.3)
+    ])
+    points = np.stack([xs, ys], axis=-1)[:, None, :] + sizes[:, None, None] * unit[None, :, :]
+    return np.round(points * (1 << SUBPIXEL_SHIFT)).astype(np.int32)
+
+
+def _fill_layers(polygons):
+    """
+    Splits polygons into layers in which no two of them overlap, so each
+    layer can be filled with one `cv2.fillPoly` call without even-odd holes.
+
+    Each polygon is put in a grid cell wider than any polygon (plus a pixel
+    of rounding), by the corner of its bounding box. A polygon then only
+    reaches into the next cell, so polygons in different cells of the same
+    parity never touch. Polygons sharing a cell go into successive layers.
+
+    Returns:
+        numpy.ndarray: The layer of each polygon.
+    """
+    lower = polygons.min(axis=1)
+    cell = (polygons.max(axis=1) - lower).max() + (2 << SUBPIXEL_SHIFT)
+    cells = lower // cell
+    parity = (cells[:, 0] % 2) * 2 + cells[:, 1] % 2
+    cell_ids = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    order = np.argsort(cell_ids, kind='stable')
+    sorted_ids = cell_ids[order]
+    starts = np.searchsorted(sorted_ids, sorted_ids)
+    rank = np.empty(len(polygons), dtype=np.int64)
+    rank[order] = np.arange(len(polygons)) - starts
+    return rank * 4 + parity
+
+
+def _fill_batched(img, polygons, color_indices, palette):
+    """Fills polygons with one `cv2.fillPoly` call per colour and layer."""
+    if len(polygons) == 0:
+        return
+    groups = color_indices * (len(polygons) * 4) + _fill_layers(polygons)
+    for group in np.unique(groups):
+        members = polygons[groups == group]
+        cv2.fillPoly(img, list(members), palette[group // (len(polygons) * 4)], shift=SUBPIXEL_SHIFT)
+
+
+def _bgra(color):
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return (b, g, r, 255)
+
+
+def draw_frame_vectorised(theme, width, height, seed=None):
+    """
+    Draws a themed frame from shape geometry computed in NumPy batches.
+
+    Produces the same kind of frame as `draw_frame_pillow`. All positions,
+    sizes, colours and polygon vertices are generated as arrays in one go,
+    and the shapes are filled with one `cv2.fillPoly` call per colour and
+    layer of non-overlapping shapes (see `_fill_layers`): a single call over
+    overlapping polygons would fill them even-odd and punch holes. String
+    lines have no such problem and are drawn in one call.
+
+    Returns:
+        numpy.ndarray: The BGRA frame.
+    """
+    spec = FRAME_THEMES[theme]
+    rng = np.random.default_rng(seed)
+    scale, count_scale = _theme_scale(width, height)
+    min_size, max_size = (round(size * scale) for size in spec['sizes'])
+    count = round(spec['count'] * count_scale)
+
+    xs, ys = _random_border_points(rng, count, width, height)
+    sizes = rng.integers(min_size, max_size + 1, count)
+    palette = [_bgra(color) for color in spec['colors']]
+    color_indices = rng.integers(0, len(palette), count)
+
+    img = np.zeros((height, width, 4), dtype=np.uint8)
+    if theme == 'stars':
+        _fill_batched(img, _star_polygons(xs, ys, sizes), color_indices, palette)
+        return img
+
+    body_heights = sizes * 1.2 if theme == 'balloons' else sizes
+    _fill_batched(img, _ellipse_polygons(xs, ys, sizes, body_heights), color_indices, palette)
+    if theme == 'balloons':
+        string_x = xs + sizes / 2
+        string_top = ys + body_heights
+        strings = np.stack([
+            np.stack([string_x, string_top], axis=-1),
+            np.stack([string_x, string_top + 20 * scale], axis=-1),
+        ], axis=1)
+        strings = np.round(strings * (1 << SUBPIXEL_SHIFT)).astype(np.int32)
+        cv2.polylines(img, list(strings), False, _bgra("grey"), shift=SUBPIXEL_SHIFT)
+    return img
+
+
+def _theme_seed(theme):
+    # The same theme gets the same layout at every resolution and on every run
+    return zlib.crc32(theme.encode())
+
+
+def _encode_png(img):
+    # Run-length strategy: frames are mostly transparent, with flat-coloured shapes
+    success, encoded = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE])
+    return encoded.tobytes() if success else None
+
+
+def _render_variant(theme, width, height, path=None):
+    """Renders and encodes one frame, writing it to `path` if given."""
+    start = time.perf_counter()
+    data = _encode_png(draw_frame_vectorised(theme, width, height, seed=_theme_seed(theme)))
+    if data is None:
+        raise RuntimeError(f"Failed to encode the {theme} frame at {width}x{height} as PNG")
+    if path:
+        with open(path, 'wb') as f:
+            f.write(data)
+    return path, time.perf_counter() - start
+
+
+def create_frame_variants(resolutions, themes, workers=None, force=False):
+    """
+    Renders each theme at each resolution into assets/frames/WxH/.
+
+    The app uses these instead of resizing the base frames when the preview
+    has one of these sizes. Variants newer than this script are skipped
+    unless `force` is set. Each variant is rendered in its own process.
+    """
+    script_mtime = os.path.getmtime(__file__)
+    jobs = []
+    for width, height in resolutions:
+        out_dir = os.path.join(FRAMES_DIR, f"{width}x{height}")
+        os.makedirs(out_dir, exist_ok=True)
+        for theme in themes:
+            path = os.path.join(out_dir, f'frame_{theme}.png')
+            if not force and os.path.exists(path) and os.path.getmtime(path) >= script_mtime:
+                logging.info(f"{path} is up to date.")
+                continue
+            jobs.append((theme, width, height, path))
+
+    if not jobs:
+        return
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_render_variant, *job) for job in jobs]
+        for future in futures:
+            path, elapsed = future.result()
+            logging.info(f"Created {path} in {elapsed * 1000:.0f}ms")
+    logging.info(f"Created {len(jobs)} frames in {time.perf_counter() - start:.2f}s.")
+
+
+def _best_time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _pillow_png(theme, width, height):
+    buf = io.BytesIO()
+    draw_frame_pillow(theme, width, height).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def benchmark(resolutions, themes, workers=None, repeat=3):
+    """
+    Compares the Pillow renderer with the vectorised one.
+
+    Prints the best-of-`repeat` time for each theme and size, for drawing
+    alone and with PNG encoding, then the wall time to produce the whole set
+    serially with Pillow and in parallel with the vectorised renderer.
+    """
+    print(f"{'theme':<10} {'size':>10} {'draw: pillow':>13} {'vectorised':>11} "
+          f"{'draw+png: pillow':>17} {'vectorised':>11}")
+    for width, height in resolutions:
+        for theme in themes:
+            draw_pillow = _best_time(lambda: draw_frame_pillow(theme, width, height), repeat)
+            draw_vector = _best_time(lambda: draw_frame_vectorised(theme, width, height), repeat)
+            png_pillow = _best_time(lambda: _pillow_png(theme, width, height), repeat)
+            png_vector = _best_time(lambda: _render_variant(theme, width, height), repeat)
+            print(f"{theme:<10} {f'{width}x{height}':>10} {draw_pillow * 1000:11.1f}ms {draw_vector * 1000:9.1f}ms "
+                  f"{png_pillow * 1000:15.1f}ms {png_vector * 1000:9.1f}ms")
+
+    jobs = [(theme, width, height) for width, height in resolutions for theme in themes]
+    start = time.perf_counter()
+    for job in jobs:
+        _pillow_png(*job)
+    serial = time.perf_counter() - start
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_render_variant, *zip(*jobs)))
+    parallel = time.perf_counter() - start
+    print(f"\nAll {len(jobs)} frames: Pillow serial {serial:.2f}s, vectorised parallel {parallel:.2f}s "
+          f"({serial / parallel:.1f}x)")
 
 
 def create_change_frame_icon_if_needed():
@@ -132,8 +380,108 @@ def create_change_frame_icon_if_needed():
         draw.rectangle([34, 22, 54, 42], fill=colors[2])
         img.save(icon_path)
 
+def create_filter_icon_if_needed():
+    """
+    Creates a simple icon for the effect-changing button if it doesn't exist.
+    """
+    icon_path = 'assets/filter-icon.png'
+    if not os.path.exists(icon_path):
+        logging.info(f"Creating filter icon at {icon_path}")
+        width, height = 64, 64
+        img = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
+        # A simple design: three overlapping translucent discs, like colour filters
+        for color, box in (((255, 87, 51, 170), [6, 20, 40, 54]),
+                           ((51, 255, 87, 170), [15, 6, 49, 40]),
+                           ((51, 87, 255, 170), [24, 20, 58, 54])):
+            layer = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
+            ImageDraw.Draw(layer).ellipse(box, fill=color)
+            img = PILImage.alpha_composite(img, layer)
+        img.save(icon_path)
+
+def create_background_icon_if_needed():
+    """
+    Creates a simple icon for the background-changing button if it doesn't exist.
+    """
+    icon_path = 'assets/background-icon.png'
+    if not os.path.exists(icon_path):
+        logging.info(f"Creating background icon at {icon_path}")
+        width, height = 64, 64
+        img = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        # A simple design: a landscape picture with a sun and mountains
+        draw.rectangle([6, 12, 58, 52], fill="#87CEEB", outline="#FFFFFF", width=3)
+        draw.ellipse([38, 18, 50, 30], fill="#FFD700")
+        draw.polygon([(9, 49), (24, 28), (36, 49)], fill="#2E8B57")
+        draw.polygon([(26, 49), (42, 34), (55, 49)], fill="#3CB371")
+        img.save(icon_path)
+
+
+def _gradient(top, bottom, width, height):
+    """Returns a vertical BGR gradient between two RGB colours."""
+    t = np.linspace(0.0, 1.0, height)[:, None, None]
+    top, bottom = np.array(top[::-1], dtype=np.float64), np.array(bottom[::-1], dtype=np.float64)
+    column = (1 - t) * top + t * bottom
+    return np.repeat(column, width, axis=1).astype(np.uint8)
+
+
+def create_backgrounds_if_needed():
+    """
+    Creates two example green screen backgrounds in BACKGROUNDS_DIR if the
+    directory is empty.
+    """
+    os.makedirs(BACKGROUNDS_DIR, exist_ok=True)
+    if glob.glob(os.path.join(BACKGROUNDS_DIR, '*.png')):
+        return
+    width, height = BACKGROUND_SIZE
+    logging.info(f"Creating example backgrounds in {BACKGROUNDS_DIR}")
+
+    sunset = _gradient((255, 170, 60), (120, 40, 130), width, height)
+    cv2.circle(sunset, (width // 2, height * 2 // 3), height // 6, (90, 220, 255), -1, cv2.LINE_AA)
+    cv2.rectangle(sunset, (0, height * 3 // 4), (width, height), (60, 30, 40), -1)
+    cv2.imwrite(os.path.join(BACKGROUNDS_DIR, 'sunset.png'), sunset)
+
+    night = _gradient((10, 15, 50), (40, 60, 120), width, height)
+    rng = np.random.default_rng(7)
+    for x, y, r in zip(rng.integers(0, width, 300), rng.integers(0, height * 3 // 4, 300), rng.integers(1, 4, 300)):
+        cv2.circle(night, (int(x), int(y)), int(r), (255, 255, 255), -1, cv2.LINE_AA)
+    cv2.circle(night, (width * 4 // 5, height // 5), height // 10, (200, 240, 250), -1, cv2.LINE_AA)
+    cv2.imwrite(os.path.join(BACKGROUNDS_DIR, 'night.png'), night)
+
+
+def _parse_resolutions(value):
+    resolutions = []
+    for item in value.split(','):
+        w, h = item.lower().split('x')
+        resolutions.append((int(w), int(h)))
+    return resolutions
+
+
 if __name__ == '__main__':
-    create_default_banner_if_needed()
-    create_birthday_frames_if_needed()
-    create_change_frame_icon_if_needed()
-    logging.info("All assets created successfully.")
+    parser = argparse.ArgumentParser(description="Create the photobooth's default assets.")
+    parser.add_argument('--resolutions',
+                        help='Also render the frames at these WxH sizes into assets/frames/WxH/, e.g. 1920x1080,3840x2160')
+    parser.add_argument('--themes', default=','.join(FRAME_THEMES),
+                        help=f"Comma-separated frame themes (default: {','.join(FRAME_THEMES)})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes for --resolutions')
+    parser.add_argument('--force', action='store_true', help='Re-render frames that are up to date')
+    parser.add_argument('--benchmark', action='store_true',
+                        help=f'Compare the Pillow and vectorised renderers (sizes from --resolutions, '
+                             f'default {BENCHMARK_RESOLUTIONS})')
+    args = parser.parse_args()
+    themes = args.themes.split(',')
+    for theme in themes:
+        if theme not in FRAME_THEMES:
+            parser.error(f"Unknown theme '{theme}'")
+
+    if args.benchmark:
+        benchmark(_parse_resolutions(args.resolutions or BENCHMARK_RESOLUTIONS), themes, args.workers)
+    else:
+        create_default_banner_if_needed()
+        create_birthday_frames_if_needed()
+        create_change_frame_icon_if_needed()
+        create_filter_icon_if_needed()
+        create_background_icon_if_needed()
+        create_backgrounds_if_needed()
+        if args.resolutions:
+            create_frame_variants(_parse_resolutions(args.resolutions), themes, args.workers, args.force)
+        logging.info("All assets created successfully.")
@@ -0,0 +1,302 @@
+"""
+Colour effects (black and white, sepia, vintage and so on) for the preview
+and photos.
+
+An effect is a chain of per-pixel colour operations, which is compiled once
+into as few full-frame passes as possible:
+
+* Affine colour operations (saturation, channel mixing, tints, brightness,
+  contrast, fades) are multiplied into a single 3x4 matrix, applied with one
+  `cv2.transform`. A fused matrix skips the clipping between operations, so
+  an operation is fused only if that changes no colour by more than
+  `FUSION_TOLERANCE` levels; otherwise it starts a new pass.
+* Tone curves are composed into one lookup table, applied with one
+  `cv2.LUT`. Per-channel gains and offsets next to a curve are folded into
+  the table. A table shared by all channels takes OpenCV's fast
+  single-table path.
+* A greyscale matrix followed by a curve becomes a greyscale conversion and
+  a lookup on the single grey channel, which is cheaper than a matrix pass
+  and a lookup over three channels.
+
+Every preset in `EFFECT_PRESETS` compiles to a single pass, except
+"vintage", whose fade would lift clipped highlights and so gets a pass of
+its own, and "noir", which takes the greyscale path. The optional vignette is a multiplicative
+mask cached per frame size; when a birthday frame is drawn,
+`FrameProcessor` folds it into the overlay's inverse alpha, so it costs no
+pass of its own.
+
+Operations are written in RGB order for readability; frames are BGR.
+"""
+import logging
+import os
+
+import cv2
+import numpy as np
+
+# --- CONFIGURATION ---
+EFFECT = os.environ.get('EFFECT', 'none').lower()  # The effect preset at startup
+# --- END CONFIGURATION ---
+
+LUMA = np.array([0.299, 0.587, 0.114])  # RGB weights of perceived brightness
+RGB_TO_BGR = np.eye(3)[::-1]
+VIGNETTE_START = 0.45  # Normalised distance from the centre where darkening starts
+DIAGONAL_NUDGE = 1e-5
+FUSION_TOLERANCE = 2  # Levels a fused matrix may differ from clipping between operations
+FUSION_SAMPLES = np.stack(np.meshgrid(*[np.linspace(0, 255, 9)] * 3), axis=-1).reshape(-1, 3)
+
+
+def color_matrix(matrix, offset=(0, 0, 0)):
+    """An affine colour operation: out = matrix @ rgb + offset, per pixel."""
+    return ('matrix', np.hstack([np.asarray(matrix, dtype=np.float64),
+                                 np.asarray(offset, dtype=np.float64).reshape(3, 1)]))
+
+
+def saturation(amount):
+    """Scales colour saturation; 0 is greyscale, 1 unchanged."""
+    return color_matrix((1 - amount) * np.tile(LUMA, (3, 1)) + amount * np.eye(3))
+
+
+def sepia():
+    """The classic sepia tone matrix."""
+    return color_matrix([[0.393, 0.769, 0.189],
+                         [0.349, 0.686, 0.168],
+                         [0.272, 0.534, 0.131]])
+
+
+def tint(r, g, b):
+    """Per-channel gains."""
+    return color_matrix(np.diag([r, g, b]))
+
+
+def brightness_contrast(brightness=0.0, contrast=1.0):
+    """Adds `brightness` levels and scales contrast around mid-grey."""
+    return color_matrix(contrast * np.eye(3), [(1 - contrast) * 128 + brightness] * 3)
+
+
+def fade(amount):
+    """Lifts the blacks and lowers the whites, for a washed-out print look."""
+    return color_matrix((1 - amount) * np.eye(3), [255 * amount / 2] * 3)
+
+
+def s_curve(strength):
+    """A tone curve that adds contrast in the midtones without clipping."""
+    x = np.arange(256) / 255.0
+    smooth = x * x * (3 - 2 * x)
+    table = np.clip(np.round(((1 - strength) * x + strength * smooth) * 255), 0, 255)
+    return ('curve', np.repeat(table[:, None], 3, axis=1))
+
+
+# Preset name -> (operations, vignette strength), in button order
+EFFECT_PRESETS = {
+    'none': ([], 0.0),
+    'bw': ([saturation(0.0), brightness_contrast(0, 1.15)], 0.0),
+    'sepia': ([sepia(), brightness_contrast(-8, 1.05)], 0.3),
+    'vintage': ([saturation(0.7), tint(1.08, 1.0, 0.85), fade(0.12)], 0.5),
+    'warm': ([tint(1.08, 1.02, 0.9)], 0.0),
+    'cool': ([tint(0.92, 1.0, 1.1), brightness_contrast(4, 1.0)], 0.0),
+    'punch': ([saturation(1.35), brightness_contrast(0, 1.12)], 0.25),
+    'noir': ([saturation(0.0), s_curve(1.0)], 0.6),
+}
+
+
+def _is_diagonal(affine):
+    return np.count_nonzero(affine[:, :3] - np.diag(np.diag(affine[:, :3]))) == 0
+
+
+def _luma_gain(affine):
+    """Returns k if the matrix maps every channel to k times the luma, else None."""
+    k = affine[0, :3].sum()
+    if np.allclose(affine[:, :3], k * LUMA) and np.allclose(affine[:, 3], affine[0, 3]):
+        return k
+    return None
+
+
+def _affine_table(affine):
+    """Turns a per-channel affine operation into a (256, 3) table."""
+    x = np.arange(256, dtype=np.float64)[:, None]
+    return np.clip(x * np.diag(affine[:, :3]) + affine[:, 3], 0, 255)
+
+
+def _fusion_error(first, second):
+    """
+    Returns the most a colour changes, in levels, when two affine operations
+    are fused instead of clipping between them.
+    """
+    def apply(affine, rgb):
+        return rgb @ affine[:, :3].T + affine[:, 3]
+
+    between = apply(first, FUSION_SAMPLES)
+    fused = np.clip(apply(second, between), 0, 255)
+    clipped = np.clip(apply(second, np.clip(between, 0, 255)), 0, 255)
+    return np.abs(fused - clipped).max()
+
+
+def _compose_tables(first, second):
+    """Returns the table of `second` applied after `first`."""
+    indices = np.round(first).astype(np.int64)
+    return np.stack([second[indices[:, c], c] for c in range(3)], axis=1)
+
+
+def compile_effect(operations):
+    """
+    Fuses a chain of colour operations into full-frame passes.
+
+    Returns:
+        list: ("transform", 3x4 float32 BGR matrix), ("lut", table) and
+              ("gray_lut", table) stages, in order.
+    """
+    stages = []
+    affine = None  # Pending 3x4 RGB matrix
+    table = None   # Pending (256, 3) RGB table
+    gray = False   # The pending table starts from the grey level
+
+    def flush_affine():
+        nonlocal affine
+        if affine is not None:
+            bgr = np.hstack([RGB_TO_BGR @ affine[:, :3] @ RGB_TO_BGR, (RGB_TO_BGR @ affine[:, 3])[:, None]])
+            if _is_diagonal(bgr):
+                # OpenCV sends diagonal matrices down a scalar path about 8x
+                # slower than its vectorised one; this nudge is far below a level
+                bgr[0, 1] += DIAGONAL_NUDGE
+            stages.append(('transform', bgr.astype(np.float32)))
+            affine = None
+
+    def flush_table():
+        nonlocal table, gray
+        if table is not None:
+            bgr = np.round(table[:, ::-1]).astype(np.uint8)
+            if (bgr == bgr[:, :1]).all():
+                bgr = np.ascontiguousarray(bgr[:, 0]).reshape(1, 256)  # Shared, faster path
+            else:
+                bgr = bgr.reshape(1, 256, 3)
+            stages.append(('gray_lut' if gray else 'lut', bgr))
+            table = None
+            gray = False
+
+    for kind, value in operations:
+        if kind == 'matrix':
+            if table is not None and _is_diagonal(value):
+                table = _compose_tables(table, _affine_table(value))  # Fold into the curve
+                continue
+            flush_table()
+            if affine is not None and _fusion_error(affine, value) > FUSION_TOLERANCE:
+                flush_affine()
+            affine = value if affine is None else np.hstack([
+                value[:, :3] @ affine[:, :3], (value[:, :3] @ affine[:, 3] + value[:, 3])[:, None]
+            ])
+        else:
+            if affine is not None and _is_diagonal(affine):
+                table = _affine_table(affine)  # Fold the gains into the curve
+                affine = None
+            elif affine is not None and _luma_gain(affine) is not None:
+                gain = _luma_gain(affine)
+                table = _affine_table(np.hstack([gain * np.eye(3), affine[:, 3:]]))  # From the grey level
+                gray = True
+                affine = None
+            flush_affine()
+            table = value.astype(np.float64) if table is None else _compose_tables(table, value)
+    flush_affine()
+    flush_table()
+    return stages
+
+
+class Effect:
+    """A compiled effect preset."""
+    def __init__(self, name, operations, vignette=0.0):
+        """
+        Initializes the Effect.
+
+        Args:
+            name (str): The preset name.
+            operations (list): Colour operations, see `color_matrix` and `s_curve`.
+            vignette (float): How much the corners are darkened, 0 to 1.
+        """
+        self.name = name
+        self.stages = compile_effect(operations)
+        self.vignette = vignette
+        self._masks = {}           # (h, w) -> vignette mask
+        self._masked_alpha = None  # (inverse_alpha, combined mask)
+
+    def apply_color(self, frame, simple=False, out=None):
+        """
+        Applies the colour stages to a BGR frame.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame. It is not modified, unless
+                it is `out`.
+            simple (bool): Skip tone curves, keeping only the matrix pass or
+                greyscale conversion.
+            out (numpy.ndarray): A frame of the same shape to write into, or
+                None for a new frame.
+
+        Returns:
+            numpy.ndarray: The output frame, or None if there is nothing to apply.
+        """
+        output = None
+        for kind, value in self.stages:
+            source = frame if output is None else output
+            target = out if output is None else output
+            if kind == 'transform':
+                output = cv2.transform(source, value, dst=target)
+            elif kind == 'gray_lut':
+                gray = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+                if simple:
+                    output = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=target)
+                elif value.ndim == 2:
+                    output = cv2.cvtColor(cv2.LUT(gray, value, dst=gray), cv2.COLOR_GRAY2BGR, dst=target)
+                else:
+                    output = cv2.LUT(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=target), value, dst=target)
+            elif not simple:
+                output = cv2.LUT(source, value, dst=target)
+        return output
+
+    def vignette_mask(self, shape):
+        """Returns the BGR vignette mask (255 = unchanged) for a frame shape."""
+        h, w = shape[:2]
+        mask = self._masks.get((h, w))
+        if mask is None:
+            y, x = np.ogrid[-1:1:h * 1j, -1:1:w * 1j]
+            distance = np.sqrt(x * x + y * y) / np.sqrt(2)
+            falloff = np.clip((distance - VIGNETTE_START) / (1 - VIGNETTE_START), 0, 1)
+            gray = np.round(255 * (1 - self.vignette * falloff * falloff)).astype(np.uint8)
+            mask = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+            if len(self._masks) >= 2:
+                self._masks.clear()  # Preview and capture sizes at most
+            self._masks[(h, w)] = mask
+        return mask
+
+    def masked_inverse_alpha(self, inverse_alpha):
+        """Returns an overlay's inverse alpha with the vignette multiplied in, cached."""
+        cached = self._masked_alpha
+        if cached is not None and cached[0] is inverse_alpha:
+            return cached[1]
+        combined = cv2.multiply(inverse_alpha, self.vignette_mask(inverse_alpha.shape), scale=1 / 255.0)
+        self._masked_alpha = (inverse_alpha, combined)
+        return combined
+
+    def apply(self, frame, simple=False):
+        """Returns a new frame with the colour stages and vignette applied."""
+        output = self.apply_color(frame, simple)
+        if self.vignette > 0 and not simple:
+            mask = self.vignette_mask(frame.shape)
+            output = cv2.multiply(frame if output is None else output, mask, scale=1 / 255.0, dst=output)
+        return frame.copy() if output is None else output
+
+
+_effects = {}
+
+
+def get_effect(name):
+    """
+    Returns the compiled Effect for a preset name, or None for "none" or an
+    unknown name.
+    """
+    if name not in EFFECT_PRESETS:
+        logging.warning(f"Unknown effect '{name}'.")
+        return None
+    if name == 'none':
+        return None
+    if name not in _effects:
+        operations, vignette = EFFECT_PRESETS[name]
+        _effects[name] = Effect(name, operations, vignette)
+    return _effects[name]
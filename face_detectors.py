@@ -0,0 +1,191 @@
+"""
+Face detector backends for hat placement.
+
+Every backend takes a BGR frame and returns (x, y, w, h) face boxes in that
+frame's coordinates. Detection runs on a copy of the frame scaled down by
+`scale`, which is the main speed/accuracy trade-off at booth distances, and
+the boxes are scaled back up.
+
+Backends:
+
+* `haar`: OpenCV's frontal face Haar cascade (the original detector).
+* `lbp`: an LBP cascade, usually several times faster than Haar.
+* `yunet`: OpenCV's DNN face detector (`cv2.FaceDetectorYN`) with the YuNet
+  ONNX model, the most accurate on CPU.
+
+The LBP cascade and YuNet model are not shipped with OpenCV's Python wheels;
+put them in `assets/` (see the README) or point the configuration at them.
+"""
+import logging
+import os
+
+import cv2
+import numpy as np
+
+# --- CONFIGURATION ---
+FACE_DETECTOR = os.environ.get('FACE_DETECTOR', 'haar').lower()         # haar, lbp or yunet
+FACE_DETECT_SCALE = float(os.environ.get('FACE_DETECT_SCALE', '1'))     # Detect on frames scaled down by this
+FACE_HAAR_CASCADE_PATH = os.environ.get('FACE_HAAR_CASCADE_PATH', 'assets/haarcascade_frontalface_default.xml')
+FACE_LBP_CASCADE_PATH = os.environ.get('FACE_LBP_CASCADE_PATH', 'assets/lbpcascade_frontalface_improved.xml')
+FACE_YUNET_MODEL_PATH = os.environ.get('FACE_YUNET_MODEL_PATH', 'assets/face_detection_yunet_2023mar.onnx')
+# --- END CONFIGURATION ---
+
+FACE_MIN_SIZE = 100  # Smallest face, in pixels of the full frame
+YUNET_SCORE_THRESHOLD = 0.8
+
+
+class FaceDetector:
+    """
+    Base class for face detector backends.
+
+    Subclasses set `available` and implement `_detect`, which works on the
+    scaled-down frame.
+    """
+    name = None
+
+    def __init__(self, scale=FACE_DETECT_SCALE):
+        """
+        Initializes the FaceDetector.
+
+        Args:
+            scale (float): Downscale factor applied before detection; 1 for
+                full resolution.
+        """
+        self.scale = scale
+        self.available = False
+
+    def detect(self, frame):
+        """
+        Returns the (x, y, w, h) boxes of the faces in a BGR frame.
+
+        Returns:
+            numpy.ndarray: An N x 4 int32 array, empty if detection is unavailable.
+        """
+        if not self.available:
+            return np.empty((0, 4), dtype=np.int32)
+        scale = max(self.scale, 1.0)
+        if scale > 1.0:
+            h, w = frame.shape[:2]
+            frame = cv2.resize(frame, (round(w / scale), round(h / scale)), interpolation=cv2.INTER_AREA)
+        faces = self._detect(frame, max(round(FACE_MIN_SIZE / scale), 1))
+        if len(faces) == 0:
+            return np.empty((0, 4), dtype=np.int32)
+        return np.round(np.asarray(faces, dtype=np.float32)[:, :4] * scale).astype(np.int32)
+
+    def _detect(self, frame, min_size):
+        raise NotImplementedError
+
+
+class HaarFaceDetector(FaceDetector):
+    """Detects faces with a Haar cascade."""
+    name = 'haar'
+    default_path = FACE_HAAR_CASCADE_PATH
+
+    def __init__(self, scale=FACE_DETECT_SCALE, path=None):
+        super(HaarFaceDetector, self).__init__(scale)
+        path = path or self.default_path
+        self.cascade = cv2.CascadeClassifier(path)
+        self.available = not self.cascade.empty()
+        if not self.available:
+            logging.error(f"Failed to load the {self.name} face cascade from {path}.")
+
+    def _detect(self, frame, min_size):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return self.cascade.detectMultiScale(gray, 1.1, 5, minSize=(min_size, min_size))
+
+
+class LbpFaceDetector(HaarFaceDetector):
+    """Detects faces with an LBP cascade; the same API as Haar, with cheaper features."""
+    name = 'lbp'
+    default_path = FACE_LBP_CASCADE_PATH
+
+
+class YuNetFaceDetector(FaceDetector):
+    """Detects faces with OpenCV's YuNet DNN model on the CPU."""
+    name = 'yunet'
+
+    def __init__(self, scale=FACE_DETECT_SCALE, path=FACE_YUNET_MODEL_PATH):
+        super(YuNetFaceDetector, self).__init__(scale)
+        self.model = None
+        self.input_size = None
+        if not os.path.exists(path):
+            logging.error(f"YuNet face model not found at {path}.")
+            return
+        try:
+            self.model = cv2.FaceDetectorYN.create(path, '', (320, 320), YUNET_SCORE_THRESHOLD)
+        except (cv2.error, AttributeError) as e:
+            logging.error(f"Failed to load the YuNet face model from {path}: {e}")
+            return
+        self.available = True
+
+    def _detect(self, frame, min_size):
+        h, w = frame.shape[:2]
+        if self.input_size != (w, h):
+            self.model.setInputSize((w, h))
+            self.input_size = (w, h)
+        _, faces = self.model.detect(frame)
+        if faces is None:
+            return ()
+        return [face[:4] for face in faces if face[2] >= min_size and face[3] >= min_size]
+
+
+DETECTORS = {
+    'haar': HaarFaceDetector,
+    'lbp': LbpFaceDetector,
+    'yunet': YuNetFaceDetector,
+}
+
+
+def create_detector(name=FACE_DETECTOR, scale=FACE_DETECT_SCALE):
+    """
+    Creates a face detector backend, falling back to Haar if the requested
+    one is unknown or cannot be loaded.
+
+    Args:
+        name (str): "haar", "lbp" or "yunet".
+        scale (float): Downscale factor applied before detection.
+
+    Returns:
+        FaceDetector: The detector.
+    """
+    detector_class = DETECTORS.get(name)
+    if detector_class is None:
+        logging.warning(f"Unknown face detector '{name}'; using haar.")
+        detector_class = HaarFaceDetector
+    detector = detector_class(scale)
+    if not detector.available and detector_class is not HaarFaceDetector:
+        logging.warning(f"The {name} face detector is unavailable; using haar.")
+        detector = HaarFaceDetector(scale)
+    logging.info(f"Face detector: {detector.name}, downscale {detector.scale:g}.")
+    return detector
+
+
+def box_iou(a, b):
+    """Returns the intersection over union of two (x, y, w, h) boxes."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_faces(faces, reference, min_iou=0.4):
+    """
+    Counts the faces that match a reference detection one-to-one.
+
+    Args:
+        faces: The (x, y, w, h) boxes to check.
+        reference: The (x, y, w, h) boxes to match against.
+        min_iou (float): The overlap needed to count as the same face.
+
+    Returns:
+        int: The number of matched pairs.
+    """
+    unmatched = list(reference)
+    matched = 0
+    for face in faces:
+        best = max(unmatched, key=lambda ref: box_iou(face, ref), default=None)
+        if best is not None and box_iou(face, best) >= min_iou:
+            unmatched = [ref for ref in unmatched if ref is not best]
+            matched += 1
+    return matched
@@ -0,0 +1,203 @@
+"""
+A fixed memory budget for the live frames, for long events.
+
+By default each stage allocates the frames it produces, and the sample queue
+holds on to GStreamer samples (and with them the camera's buffers) until the
+worker takes them. At 4K that is tens of MB per frame, and over a 12-hour
+event the churn slowly fragments the heap.
+
+With `FRAME_POOL` set, the app allocates that many frame slots instead and
+reuses them for the life of the process. Each slot holds a camera frame and
+its processed frame, allocated once per frame size:
+
+* The appsink callback copies each sample into a free slot straight away,
+  so no GStreamer buffer is held, and the sample queue carries slot indices.
+* The processor writes its output into the slot, the display queue hands
+  the slot to the UI, and the UI uploads it into a texture it reuses.
+* Slots are reference counted. The sample and display queues, the newest
+  frame kept for captures and the best-shot ring each hold a reference, and
+  a slot is free again once the last one is released. Captures copy what
+  they keep. When no slot is free, the pool's `on_exhausted` callback may
+  release some: the frame processor worker gives up the oldest best-shot
+  candidates, so a pool no larger than the ring cannot freeze the preview.
+  Otherwise the camera frame is dropped (counted as `dropped_frame_pool`),
+  so memory cannot grow past the budget.
+
+`MemoryReporter` logs the resident memory every `MEMORY_REPORT_INTERVAL`
+seconds and publishes it as the `rss_mb` gauge. With `MEMORY_TRACE` set it
+also traces Python allocations and logs the lines whose allocations grew
+the most since the last report.
+"""
+import logging
+import os
+import threading
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+from metrics import metrics
+
+# --- CONFIGURATION ---
+FRAME_POOL = int(os.environ.get('FRAME_POOL', '0'))  # Frame slots in the fixed pool, 0 to allocate per frame
+MEMORY_REPORT_INTERVAL = float(os.environ.get('MEMORY_REPORT_INTERVAL', '300' if FRAME_POOL else '0'))
+MEMORY_TRACE = os.environ.get('MEMORY_TRACE')        # Also trace Python allocations (slower)
+# --- END CONFIGURATION ---
+
+MB = 1024 * 1024
+TRACE_TOP = 5  # Allocation sites logged per report
+
+
+def memory_mb():
+    """Returns this process's (resident, peak resident) memory in MB, from /proc."""
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(value.split()[0]) / 1024
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+class FramePool:
+    """
+    A fixed number of reference-counted frame slots, handed out by index.
+
+    All methods are thread-safe. `lock` can be held to read a slot's frames
+    without them being released and reused meanwhile.
+    """
+    def __init__(self, size):
+        """
+        Initializes the FramePool.
+
+        Args:
+            size (int): The number of slots.
+        """
+        self.size = size
+        self.lock = threading.RLock()
+        self.jpegs = [None] * size            # The camera JPEG of each slot, on the libjpeg path
+        self._refs = [0] * size
+        self._free = deque(range(size))
+        self._buffers = [{} for _ in range(size)]  # Per slot: name -> frame
+        self._held = {}                        # Holder name -> slot
+        self.on_exhausted = None               # Called under the lock when no slot is free, to release some
+        metrics.set_gauge('frame_pool_free', size)
+
+    def acquire(self):
+        """
+        Takes a free slot, with one reference.
+
+        Returns:
+            int: The slot index, or None if every slot is in use.
+        """
+        with self.lock:
+            if not self._free and self.on_exhausted:
+                self.on_exhausted()
+            if not self._free:
+                return None
+            index = self._free.popleft()
+            self._refs[index] = 1
+            metrics.set_gauge('frame_pool_free', len(self._free))
+            return index
+
+    def retain(self, index):
+        """Adds a reference to a slot."""
+        with self.lock:
+            self._refs[index] += 1
+
+    def release(self, index):
+        """Drops a reference to a slot, freeing it after the last one."""
+        with self.lock:
+            self._refs[index] -= 1
+            if self._refs[index] == 0:
+                self.jpegs[index] = None
+                self._free.append(index)
+                metrics.set_gauge('frame_pool_free', len(self._free))
+
+    def hold(self, name, index):
+        """
+        Keeps a reference to a slot under a name, such as the newest frame,
+        releasing the slot previously held under that name.
+        """
+        with self.lock:
+            self.retain(index)
+            previous = self._held.get(name)
+            self._held[name] = index
+            if previous is not None:
+                self.release(previous)
+
+    def buffer(self, index, name, shape=None):
+        """
+        Returns one of a slot's frames.
+
+        Args:
+            index (int): The slot.
+            name (str): "raw" for the camera frame, "processed" for the output.
+            shape (tuple): The frame shape; the frame is (re)allocated if it
+                has none yet or a different one. None to take it as it is.
+        """
+        frame = self._buffers[index].get(name)
+        if shape is not None and (frame is None or frame.shape != shape):
+            frame = self._buffers[index][name] = np.empty(shape, dtype=np.uint8)
+            metrics.inc('frame_pool_allocations')
+        return frame
+
+    def in_use(self):
+        """Returns the number of slots with references."""
+        with self.lock:
+            return self.size - len(self._free)
+
+    def allocated_mb(self):
+        """Returns the memory held by the slots' frames in MB."""
+        return sum(frame.nbytes for buffers in self._buffers for frame in list(buffers.values())) / MB
+
+
+class MemoryReporter(threading.Thread):
+    """A worker thread that periodically logs the process's memory use."""
+    def __init__(self, pool=None, interval=MEMORY_REPORT_INTERVAL, trace=MEMORY_TRACE, **kwargs):
+        """
+        Initializes the MemoryReporter.
+
+        Args:
+            pool (FramePool): The frame pool to report on, if any.
+            interval (float): Seconds between reports.
+            trace (bool): Trace Python allocations with tracemalloc.
+        """
+        super(MemoryReporter, self).__init__(daemon=True, **kwargs)
+        self.pool = pool
+        self.interval = interval
+        self.trace = trace
+        self.stop_event = threading.Event()
+        self.start_rss = None
+        self._snapshot = None
+
+    def run(self):
+        if self.trace:
+            tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+        self.start_rss, _ = memory_mb()
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def report(self):
+        """Logs and publishes the current memory use."""
+        rss, peak = memory_mb()
+        metrics.set_gauge('rss_mb', round(rss, 1))
+        line = f"Memory: RSS {rss:.0f}MB ({rss - (self.start_rss or rss):+.0f}MB since start), peak {peak:.0f}MB"
+        if self.pool:
+            line += (f"; frame pool {self.pool.in_use()}/{self.pool.size} slots in use, "
+                     f"{self.pool.allocated_mb():.0f}MB, {metrics.counter('frame_pool_allocations')} allocations")
+        if tracemalloc.is_tracing():
+            current, _ = tracemalloc.get_traced_memory()
+            line += f"; Python allocations {current / MB:.1f}MB"
+        logging.info(line)
+
+        if self._snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            for stat in snapshot.compare_to(self._snapshot, 'lineno')[:TRACE_TOP]:
+                if stat.size_diff >= 1024:
+                    logging.info(f"  {stat.size_diff / 1024:+.0f}KB in {stat.count_diff:+d} blocks at {stat.traceback}")
+            self._snapshot = snapshot
+
+    def stop(self):
+        self.stop_event.set()
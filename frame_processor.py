@@ -0,0 +1,707 @@
+"""
+Frame processing for the photobooth preview and captures.
+
+`FrameProcessor` replaces the green screen backdrop, applies the colour
+effect and composites the birthday frame and hats onto camera frames.
+It only depends on OpenCV and NumPy, so the same code path can be driven
+without Kivy or a camera (see `benchmark.py`).
+
+`FrameProcessorWorker` is the thread that takes GStreamer samples from the
+app's `sample_queue`, turns them into BGR frames, runs them through the
+processor and hands the results to the UI through `display_queue`. It can
+also keep a scored ring of recent frames so a capture can pick the best one
+(see `pick_best_shot`). With a `frame_pool.FramePool`, the queues carry
+pool slots filled by `store_sample` instead of samples.
+"""
+import logging
+import queue
+from collections import Counter
+from contextlib import nullcontext
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+
+    import camera_pipeline
+except (ImportError, ValueError):
+    # FrameProcessor only needs OpenCV; turning samples into frames needs GStreamer
+    Gst = camera_pipeline = None
+from chroma_key import ChromaKeyer, CHROMA_KEY
+from face_detectors import create_detector
+from idle_mode import IDLE_PREVIEW_SCALE
+from metrics import metrics
+
+# OpenCV decode flags for the "libjpeg" MJPG path, by preview downscale factor.
+# The reduced modes use libjpeg's DCT scaling rather than decoding and resizing.
+JPEG_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def prepare_overlay(overlay, size):
+    """
+    Resizes a BGRA overlay and splits it for blending.
+
+    Args:
+        overlay (numpy.ndarray): The BGRA image.
+        size (tuple): The (w, h) to prepare it for.
+
+    Returns:
+        tuple: (premultiplied, inverse_alpha), two BGR images: the colour
+               premultiplied by alpha, and 255 - alpha in every channel.
+    """
+    w, h = size
+    resized = cv2.resize(overlay, (w, h), interpolation=cv2.INTER_AREA)
+    alpha = cv2.cvtColor(resized[:, :, 3], cv2.COLOR_GRAY2BGR)
+    premultiplied = cv2.multiply(resized[:, :, :3], alpha, scale=1 / 255.0)
+    return premultiplied, cv2.bitwise_not(alpha)
+
+
+SHARPNESS_WIDTH = 320  # Frames are scored at this width to keep scoring cheap
+
+
+def sharpness(frame):
+    """
+    Returns the variance of the Laplacian of a BGR frame; higher is sharper.
+
+    The frame is scaled down first, which is plenty to tell motion blur apart.
+    """
+    h, w = frame.shape[:2]
+    if w > SHARPNESS_WIDTH:
+        frame = cv2.resize(frame, (SHARPNESS_WIDTH, h * SHARPNESS_WIDTH // w), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return float(stddev[0][0]) ** 2
+
+
+def pick_best_shot(candidates):
+    """
+    Picks the best frame from a ring of scored candidates.
+
+    Frames where the face count matches the most common count in the ring
+    (nobody turned away or was missed by the detector) are preferred, then
+    the sharpest; ties go to the most recent frame.
+
+    Args:
+        candidates (list): Dicts with `sharpness` and `face_count` (None when
+            detection was not run), oldest first.
+
+    Returns:
+        dict: The chosen candidate, or None if there are none.
+    """
+    if not candidates:
+        return None
+    max_sharpness = max(c['sharpness'] for c in candidates) or 1.0
+    counts = [c['face_count'] for c in candidates if c['face_count'] is not None]
+    usual_count = Counter(counts).most_common(1)[0][0] if counts else None
+
+    best, best_score = None, -1.0
+    for candidate in candidates:
+        score = candidate['sharpness'] / max_sharpness
+        if usual_count is not None and candidate['face_count'] == usual_count:
+            score += 1.0
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def store_sample(pool, sample):
+    """
+    Copies a `Gst.Sample` into a free slot of a `FramePool`, so the sample
+    and the camera buffer behind it can be released straight away.
+
+    Raw frames are copied into the slot's "raw" frame. On the libjpeg path
+    the JPEG is kept in `pool.jpegs` and decoded later by the worker.
+
+    Returns:
+        int: The slot, holding one reference, or None if no slot was free
+             or the sample could not be read.
+    """
+    index = pool.acquire()
+    if index is None:
+        metrics.inc('dropped_frame_pool')
+        return None
+    buf = sample.get_buffer()
+    structure = sample.get_caps().get_structure(0)
+    h = structure.get_value("height")
+    w = structure.get_value("width")
+
+    success, map_info = buf.map(Gst.MapFlags.READ)
+    if not success:
+        pool.release(index)
+        return None
+    if structure.get_name() == 'image/jpeg':
+        pool.jpegs[index] = np.frombuffer(map_info.data, dtype=np.uint8).copy()
+    else:
+        frame = pool.buffer(index, 'raw', (h, w, 3))
+        np.copyto(frame, np.ndarray((h, w, 3), buffer=map_info.data, dtype=np.uint8))
+    buf.unmap(map_info)
+    return index
+
+
+class FrameProcessor:
+    """
+    Applies the background, colour effect, birthday frame overlay and
+    face-tracked hats to BGR frames.
+
+    If `stage_timer` is set, it is called with (stage_name, seconds) for each
+    processing stage: the chroma key stages (see `chroma_key.ChromaKeyer`),
+    "effects", "frame_overlay", "detect" and "hats".
+
+    `background` is a BGR(A) image composited over the green screen by
+    `chroma_keyer`, which is created when `CHROMA_KEY` is set. `effect` is an
+    `effects.Effect` or None. With `simple_effects` set, the effect's tone
+    curves and vignette are skipped and the background gets a hard edge.
+
+    With `detect_interval` above 1, faces are only detected on every Nth
+    frame and the last boxes are reused in between. Faces are only detected
+    while a hat is drawn, or always with `detect_always` set (for the smile
+    trigger).
+    """
+    def __init__(self, detector=None):
+        """
+        Initializes the FrameProcessor.
+
+        Args:
+            detector (FaceDetector): The face detector backend, by default the
+                one chosen by `FACE_DETECTOR` (see `face_detectors`).
+        """
+        self.birthday_frame = None
+        self.resized_overlay = None
+        self.hat = None
+        self.effect = None
+        self.simple_effects = False
+        self.background = None
+        self.chroma_keyer = ChromaKeyer() if CHROMA_KEY else None
+        self.stage_timer = None
+        self.detector = detector or create_detector()
+        self.detect_interval = 1
+        self.detect_always = False
+        self._frames_since_detect = 0
+        self._last_faces = None  # (frame shape, faces) from the last detection
+
+    def set_birthday_frame(self, birthday_frame, prepared=None):
+        """
+        Sets the BGRA frame overlay, or None for no frame.
+
+        Args:
+            birthday_frame (numpy.ndarray): The BGRA overlay.
+            prepared (tuple): The overlay already prepared for the frame size
+                with `prepare_overlay`, if available.
+        """
+        if birthday_frame is self.birthday_frame and prepared is None:
+            return  # Keep the prepared cache
+        self.birthday_frame = birthday_frame
+        self.resized_overlay = prepared
+
+    def overlay_active(self):
+        """Returns True if a background, effect, frame or hat changes the camera image."""
+        return (self.birthday_frame is not None or self.hat is not None or self.effect is not None
+                or self.keying_active())
+
+    def keying_active(self):
+        """Returns True if a background replaces the green screen."""
+        return self.background is not None and self.chroma_keyer is not None
+
+    def _record(self, stage, start):
+        if self.stage_timer:
+            self.stage_timer(stage, time.perf_counter() - start)
+
+    def apply_frame_overlay(self, frame, out=None):
+        """
+        Returns a copy of the frame with the background replaced, the colour
+        effect applied and the birthday frame drawn on top.
+
+        The vignette is multiplied into the overlay's inverse alpha, so with a
+        birthday frame it needs no pass of its own. If `out` is given, the
+        copy is written into it instead of a new frame.
+        """
+        owned = None  # A new frame of our own that later stages can write into
+        background = self.background
+        if background is not None and self.chroma_keyer is not None:
+            frame = owned = self.chroma_keyer.apply(frame, background, self.simple_effects, self._record, out=out)
+
+        effect = self.effect
+        output_frame = None
+        vignette = False
+        if effect is not None:
+            start = time.perf_counter()
+            output_frame = effect.apply_color(frame, self.simple_effects, out=out)
+            vignette = effect.vignette > 0 and not self.simple_effects
+            self._record('effects', start)
+        source = frame if output_frame is None else output_frame
+        if output_frame is None:
+            output_frame = owned
+        target = out if output_frame is None else output_frame
+
+        start = time.perf_counter()
+        birthday_frame = self.birthday_frame
+        if birthday_frame is None:
+            if vignette:
+                mask = effect.vignette_mask(frame.shape)
+                output_frame = cv2.multiply(source, mask, scale=1 / 255.0, dst=target)
+            elif output_frame is None and out is not None:
+                output_frame = out
+                np.copyto(output_frame, frame)
+            elif output_frame is None:
+                output_frame = frame.copy()
+            self._record('frame_overlay', start)
+            return output_frame
+
+        h, w, _ = frame.shape
+        # Work on a local reference; the UI thread can switch the overlay meanwhile
+        resized_overlay = self.resized_overlay
+        if resized_overlay is None or resized_overlay[0].shape[:2] != (h, w):
+            logging.info(f"Creating new birthday frame cache for resolution {w}x{h}.")
+            resized_overlay = prepare_overlay(birthday_frame, (w, h))
+            self.resized_overlay = resized_overlay
+
+        premultiplied, inverse_alpha = resized_overlay
+        if vignette:
+            inverse_alpha = effect.masked_inverse_alpha(inverse_alpha)
+        output_frame = cv2.multiply(source, inverse_alpha, scale=1 / 255.0, dst=target)
+        output_frame = cv2.add(output_frame, premultiplied, dst=output_frame)
+        self._record('frame_overlay', start)
+        return output_frame
+
+    def detect_faces(self, frame):
+        """
+        Returns the (x, y, w, h) boxes of the faces in a BGR frame.
+        """
+        return self.detector.detect(frame)
+
+    def _detect_or_reuse(self, frame):
+        last = self._last_faces
+        self._frames_since_detect += 1
+        if (last is not None and last[0] == frame.shape
+                and self._frames_since_detect < self.detect_interval):
+            return last[1]
+        start = time.perf_counter()
+        faces = self.detect_faces(frame)
+        self._record('detect', start)
+        self._frames_since_detect = 0
+        self._last_faces = (frame.shape, faces)
+        return faces
+
+    def apply_hats(self, output_frame, faces, hat):
+        """
+        Draws a hat above each face, modifying the frame in place.
+        """
+        for (x, y, w, h) in faces:
+            # Adjust hat size and position
+            hat_w = int(w * 1.1)
+            hat_h = int(hat.shape[0] * (hat_w / hat.shape[1]))
+
+            hat_x = x - int((hat_w - w) / 2)
+            hat_y = y - int(hat_h * 0.85)  # Position hat above the face
+
+            # Resize hat
+            try:
+                resized_hat = cv2.resize(hat, (hat_w, hat_h))
+            except cv2.error:
+                continue  # Skip if resizing fails
+
+            # Define ROI, handling boundaries
+            frame_h, frame_w, _ = output_frame.shape
+
+            # Top-left corner of where the hat will be placed
+            roi_y1 = max(hat_y, 0)
+            roi_x1 = max(hat_x, 0)
+
+            # Bottom-right corner
+            roi_y2 = min(hat_y + hat_h, frame_h)
+            roi_x2 = min(hat_x + hat_w, frame_w)
+
+            # Calculate the part of the hat that is visible
+            hat_roi_y1 = max(0, -hat_y)
+            hat_roi_x1 = max(0, -hat_x)
+
+            hat_roi_y2 = hat_roi_y1 + (roi_y2 - roi_y1)
+            hat_roi_x2 = hat_roi_x1 + (roi_x2 - roi_x1)
+
+            if (hat_roi_y2 - hat_roi_y1) <= 0 or (hat_roi_x2 - hat_roi_x1) <= 0:
+                continue
+
+            hat_part = resized_hat[hat_roi_y1:hat_roi_y2, hat_roi_x1:hat_roi_x2]
+
+            # ROI on the main frame
+            roi = output_frame[roi_y1:roi_y2, roi_x1:roi_x2]
+
+            if roi.shape[:2] != hat_part.shape[:2]:
+                continue
+
+            # Create mask and inverse mask
+            hat_alpha = hat_part[:, :, 3]
+            hat_rgb = hat_part[:, :, :3]
+
+            # Black-out the area of hat in ROI
+            roi_bg = cv2.bitwise_and(roi, roi, mask=cv2.bitwise_not(hat_alpha))
+
+            # Take only region of hat from hat image.
+            hat_fg = cv2.bitwise_and(hat_rgb, hat_rgb, mask=hat_alpha)
+
+            # Put hat in ROI and modify the main image
+            dst = cv2.add(roi_bg, hat_fg)
+            output_frame[roi_y1:roi_y2, roi_x1:roi_x2] = dst
+
+    def process(self, frame, faces=None, out=None):
+        """
+        Applies the background, colour effect, birthday frame and hats to a frame.
+
+        Args:
+            frame (numpy.ndarray): The BGR camera frame. It is not modified.
+            faces: Face boxes to use instead of running detection.
+            out (numpy.ndarray): A frame of the same shape to write the output
+                into, or None for a new frame.
+
+        Returns:
+            tuple: (output_frame, faces), where faces are the boxes the hats
+                   were placed on, or None if no hat is active and detection
+                   was skipped.
+        """
+        output_frame = self.apply_frame_overlay(frame, out)
+
+        # Apply hats on faces
+        hat = self.hat
+        if hat is None and not self.detect_always:
+            return output_frame, faces
+
+        if faces is None:
+            faces = self._detect_or_reuse(frame)
+
+        if hat is not None and len(faces) > 0:
+            start = time.perf_counter()
+            self.apply_hats(output_frame, faces, hat)
+            self._record('hats', start)
+
+        return output_frame, faces
+
+    def apply_overlay(self, frame, faces=None):
+        """
+        Returns a new frame with the background, colour effect, birthday frame and hats applied.
+
+        Args:
+            frame (numpy.ndarray): The BGR camera frame. It is not modified.
+            faces: Face boxes to use instead of running detection.
+        """
+        return self.process(frame, faces)[0]
+
+
+class FrameProcessorWorker(threading.Thread):
+    """
+    A worker thread to process GStreamer frames.
+
+    The `app` must provide `sample_queue`, `display_queue`, `processor`,
+    `process_pool`, `idle_monitor` and `keep_raw`, and receives the `latest_processed_frame`
+    and `latest_jpeg` attributes, plus `latest_raw` (the unprocessed frame and its face boxes)
+    when `keep_raw` is set.
+    `sample_queue` carries (sample, stamps) pairs from `CameraPipeline`, and
+    `display_queue` receives (frame, stamps) pairs, with `t_dequeued` and
+    `t_processed` added to the stamps. If the stamps have a `slot`, the
+    sample is that slot of the app's `frame_pool` (see `store_sample`): the
+    frames are read from and processed into the slot, and the reference the
+    stamps hold passes to the display queue, whose consumer releases it.
+    The newest frame and each shot ring entry hold a reference of their own;
+    when the pool runs out, the oldest ring entries give theirs up. If the app's `frame_ready` is set, it
+    is called after each frame is queued for display. While the app's
+    `clip_recorder` is set, processed frames are also offered to it. If the
+    app's `shot_ring` is a deque, each frame is scored and added to it for
+    `pick_best_shot`. If the app's `process_pool` is set, the processing
+    itself runs on that `FrameProcessPool` and results are published from
+    its collector thread, in order. While the app's `idle_monitor` reports
+    the booth idle, frames are only scaled down for display and checked for
+    motion.
+    """
+    def __init__(self, app, **kwargs):
+        super(FrameProcessorWorker, self).__init__(**kwargs)
+        self.app = app
+        self.stop_event = threading.Event()
+
+    def run(self):
+        logging.info("Frame processor worker started.")
+        pool = self.app.process_pool
+        if pool is not None:
+            pool.on_result = self._pool_result
+        if self.app.frame_pool is not None:
+            self.app.frame_pool.on_exhausted = self.release_shot_slots
+        while not self.stop_event.is_set():
+            try:
+                sample, stamps = self.app.sample_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if sample is not None:
+                stamps['t_dequeued'] = time.monotonic()
+                metrics.observe('sample_queue_wait', stamps['t_dequeued'] - stamps['t_appsink'])
+                idle = self.app.idle_monitor
+                frame = None
+                if idle is not None and idle.idle:
+                    frame = self.process_idle_sample(idle, sample, stamps)
+                    if frame is None:
+                        self.release_slot(stamps)
+                        continue
+                start = time.perf_counter()
+                if pool is not None and pool.failed:
+                    pool = None  # Keep going on this thread
+                if pool is not None:
+                    self.submit_sample(pool, sample, stamps, start, frame)
+                    continue
+                frame, processed_frame, faces = self.process_sample(sample, stamps, frame)
+                if processed_frame is None:
+                    self.release_slot(stamps)
+                    continue
+                metrics.observe('process', time.perf_counter() - start)
+                self.publish(frame, processed_frame, faces, stamps)
+        logging.info("Frame processor worker stopped.")
+
+    def process_idle_sample(self, idle, sample, stamps):
+        """
+        Shows a scaled-down frame while the booth is idle, at the idle framerate.
+
+        Frames are scaled to the width of the first idle frame divided by
+        `IDLE_PREVIEW_SCALE`; once the camera runs in its idle format, they
+        are about that size already.
+
+        Returns:
+            numpy.ndarray: The decoded frame if it showed motion and woke the
+                           booth, so it should be processed normally, or None.
+        """
+        if not idle.take_frame():
+            return None
+        frame = self.frame_for(sample, stamps)
+        if frame is None:
+            return None
+        if idle.detect_motion(frame):
+            stamps['t_wake'] = time.monotonic()
+            idle.note_activity('motion')
+            return frame
+        h, w = frame.shape[:2]
+        if idle.preview_width is None:
+            idle.preview_width = max(w // IDLE_PREVIEW_SCALE, 1)
+        if w > idle.preview_width:
+            size = (idle.preview_width, max(h * idle.preview_width // w, 1))
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+        self.release_slot(stamps)  # The small copy is all that is shown
+        stamps['t_processed'] = time.monotonic()
+        try:
+            self.app.display_queue.put_nowait((small, stamps))
+        except queue.Full:
+            return None
+        if self.app.frame_ready:
+            self.app.frame_ready()
+        return None
+
+    def submit_sample(self, pool, sample, stamps, start, frame=None):
+        """
+        Converts a sample to BGR, unless `frame` is the sample already
+        decoded, and queues it on the process pool.
+        """
+        if frame is None:
+            frame = self.frame_for(sample, stamps)
+        if frame is None:
+            self.release_slot(stamps)
+            return
+        metrics.observe('map', time.perf_counter() - start)
+        context = (frame, stamps, start, self.app.latest_jpeg)
+        out = self.slot_buffer(stamps, 'processed', frame.shape)
+        if pool.submit(frame, context, timeout=0.1, out=out) is None:
+            metrics.inc('dropped_process_pool') # Every worker is busy
+            self.release_slot(stamps)
+
+    def _pool_result(self, context, processed_frame, faces):
+        frame, stamps, start, jpeg = context
+        if processed_frame is None or self.stop_event.is_set():
+            self.release_slot(stamps)
+            return
+        metrics.observe('process', time.perf_counter() - start)
+        self.app.latest_jpeg = jpeg  # Decoding runs ahead of the pool
+        self.publish(frame, processed_frame, faces, stamps)
+
+    def publish(self, frame, processed_frame, faces, stamps):
+        """Hands a processed frame to the UI, the capture state and the clip recorder."""
+        stamps['t_processed'] = time.monotonic()
+        metrics.inc('frames_processed')
+        idle = self.app.idle_monitor
+        if idle is not None:
+            if 't_wake' in stamps:
+                metrics.observe('idle_wake', stamps['t_processed'] - stamps['t_appsink'])
+            if faces is not None and len(faces) > 0:
+                idle.note_activity('face')
+            idle.check()
+        smile_trigger = self.app.smile_trigger
+        if smile_trigger is not None and not self.app.countdown_active:
+            smile_trigger.update(frame, faces)
+        slot = stamps.get('slot')
+        frame_pool = self.app.frame_pool if slot is not None else None
+        # Captures read the newest frame under the pool's lock, so it is not reused meanwhile
+        with frame_pool.lock if frame_pool else nullcontext():
+            if frame_pool:
+                frame_pool.hold('latest', slot)
+            if self.app.keep_raw:
+                self.app.latest_raw = (frame, faces)
+            self.app.latest_processed_frame = processed_frame
+        clip_recorder = self.app.clip_recorder
+        if clip_recorder:
+            if frame_pool:
+                # The recorder scales the frame down on its own thread, then gives the slot back
+                frame_pool.retain(slot)
+                clip_recorder.push(processed_frame, release=lambda: frame_pool.release(slot))
+            else:
+                clip_recorder.push(processed_frame)
+        if self.app.shot_ring is not None:
+            self.add_shot_candidate(frame, processed_frame, faces, slot)
+
+        try:
+            self.app.display_queue.put_nowait((processed_frame, stamps))
+        except queue.Full:
+            metrics.inc('dropped_display_queue') # UI is lagging
+            self.release_slot(stamps)
+            return
+        if self.app.frame_ready:
+            self.app.frame_ready()
+
+    def add_shot_candidate(self, frame, processed_frame, faces, slot=None):
+        """
+        Scores a frame and adds it to the app's shot ring. A frame in a pool
+        `slot` keeps it until the entry drops out of the ring.
+        """
+        start = time.perf_counter()
+        candidate = {
+            'processed': processed_frame,
+            'raw': (frame, faces) if self.app.keep_raw else None,
+            'jpeg': self.app.latest_jpeg,
+            'sharpness': sharpness(frame),
+            'face_count': None if faces is None else len(faces),
+            'slot': slot,
+        }
+        shot_ring = self.app.shot_ring
+        if slot is None:
+            shot_ring.append(candidate)
+        else:
+            frame_pool = self.app.frame_pool
+            with frame_pool.lock:
+                frame_pool.retain(slot)
+                if len(shot_ring) == shot_ring.maxlen:
+                    frame_pool.release(shot_ring[0]['slot'])
+                shot_ring.append(candidate)
+        metrics.observe('score', time.perf_counter() - start)
+
+    def release_shot_slots(self):
+        """
+        Drops the oldest pool-backed shot ring entries until a pool slot is
+        free, so the ring can never hold every slot. Called by the pool when
+        it runs out.
+        """
+        shot_ring = self.app.shot_ring
+        frame_pool = self.app.frame_pool
+        if not shot_ring:
+            return
+        with frame_pool.lock:
+            while shot_ring and frame_pool.in_use() == frame_pool.size:
+                slot = shot_ring.popleft()['slot']
+                if slot is not None:
+                    frame_pool.release(slot)
+                    metrics.inc('shot_ring_reclaimed')
+
+    def frame_for(self, sample, stamps):
+        """Returns the BGR frame for a queued sample or pool slot, or None."""
+        slot = stamps.get('slot') if stamps else None
+        if slot is None:
+            return self.sample_to_frame(sample)
+        frame_pool = self.app.frame_pool
+        jpeg = frame_pool.jpegs[slot]
+        if jpeg is None:
+            return frame_pool.buffer(slot, 'raw')
+        decoded = self._decode_jpeg(jpeg)
+        if decoded is None:
+            return None
+        # imdecode cannot decode into the slot, so the decoded frame is copied into it
+        frame = frame_pool.buffer(slot, 'raw', decoded.shape)
+        np.copyto(frame, decoded)
+        self.app.latest_jpeg = jpeg
+        return frame
+
+    def slot_buffer(self, stamps, name, shape):
+        """Returns a frame of the stamps' pool slot to write into, or None without one."""
+        slot = stamps.get('slot') if stamps else None
+        if slot is None:
+            return None
+        return self.app.frame_pool.buffer(slot, name, shape)
+
+    def release_slot(self, stamps):
+        """Releases the pool slot the stamps hold, if any. Safe to call more than once."""
+        slot = stamps.pop('slot', None)
+        if slot is not None:
+            self.app.frame_pool.release(slot)
+
+    def sample_to_frame(self, sample):
+        """
+        Returns a BGR frame that owns its memory for a `Gst.Sample`, or None.
+        """
+        buf = sample.get_buffer()
+        structure = sample.get_caps().get_structure(0)
+        h = structure.get_value("height")
+        w = structure.get_value("width")
+
+        success, map_info = buf.map(Gst.MapFlags.READ)
+        if not success:
+            return None
+
+        if structure.get_name() == 'image/jpeg':
+            # Keep the camera's JPEG so captures can be decoded at full size
+            jpeg = np.frombuffer(map_info.data, dtype=np.uint8).copy()
+            buf.unmap(map_info)
+            frame = self._decode_jpeg(jpeg)
+            if frame is not None:
+                self.app.latest_jpeg = jpeg
+            return frame
+
+        frame = np.ndarray((h, w, 3), buffer=map_info.data, dtype=np.uint8).copy()
+        buf.unmap(map_info)
+        return frame
+
+    def process_sample(self, sample, stamps=None, frame=None):
+        """
+        Converts a sample (or the pool slot in its stamps) to BGR and applies the overlays.
+
+        `frame` is the sample already converted, e.g. by the idle motion check.
+
+        Returns:
+            tuple: (frame, processed_frame, faces) as described by
+                   `FrameProcessor.process`, or (None, None, None) if the
+                   sample could not be read.
+        """
+        start = time.perf_counter()
+        if frame is None:
+            frame = self.frame_for(sample, stamps)
+        if frame is None:
+            return None, None, None
+        metrics.observe('map', time.perf_counter() - start)
+        # The frame is BGR. process expects BGR.
+        out = self.slot_buffer(stamps, 'processed', frame.shape)
+        processed_frame, faces = self.app.processor.process(frame, out=out)
+        return frame, processed_frame, faces
+
+    def _decode_jpeg(self, jpeg):
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
+        frame = cv2.imdecode(jpeg, JPEG_DECODE_FLAGS.get(camera_pipeline.PREVIEW_SCALE, cv2.IMREAD_COLOR))
+        if camera_pipeline.profiler:
+            camera_pipeline.profiler.record(
+                'libjpeg-decode', time.perf_counter() - start_wall, time.thread_time() - start_cpu
+            )
+        if frame is None:
+            logging.warning("Failed to decode a JPEG frame from the camera.")
+        return frame
+
+    def stop(self):
+        self.stop_event.set()
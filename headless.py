@@ -0,0 +1,282 @@
+"""
+Runs the booth's capture and processing path without the Kivy window.
+
+The frames go through the same path as in the app: a `CameraPipeline`,
+the sample queue, `FrameProcessorWorker` (and the `FrameProcessPool` with
+`PROCESS_WORKERS`), and the display queue, which is drained here in place of
+the UI. Only the texture upload is missing. Combined with a stand-in source
+(see `camera_pipeline.source_kind`), this profiles or load-tests the whole
+pipeline on any Linux machine, with or without a camera or display.
+
+The metrics are logged every `--report` seconds and at the end, and can be
+written with `--output` (JSON, or Prometheus text for a ".prom" path). The
+quality governor runs when `QUALITY_GOVERNOR` is set, and the frame pool and
+memory reports with `FRAME_POOL` and `MEMORY_REPORT_INTERVAL`, as in the app;
+idle mode, captures and the smile and voice triggers do not. A long run with
+a frame pool is a memory soak test.
+
+Examples:
+    python headless.py --device videotestsrc --resolution 1920x1080 --duration 60
+    python headless.py --device recording/%05d.jpg --pacing fast --frames 2000 --output run.json
+    python headless.py --device event.mp4 --frame assets/frames/frame_balloons.png --hat none --effect sepia
+    FRAME_POOL=12 MEMORY_REPORT_INTERVAL=600 python headless.py --resolution 3840x2160 --duration 43200
+"""
+import argparse
+import glob
+import logging
+import os
+import queue
+import time
+
+import cv2
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+Gst.init(None)
+
+from camera_pipeline import CameraPipeline, GlibMainLoopWorker, SOURCE_PACING, source_kind
+from chroma_key import BACKGROUNDS_DIR, ChromaKeyer
+from effects import EFFECT, EFFECT_PRESETS, get_effect
+from frame_pool import FramePool, MemoryReporter, FRAME_POOL, MEMORY_REPORT_INTERVAL
+from frame_processor import FrameProcessor, FrameProcessorWorker, store_sample
+from metrics import metrics
+from process_pool import FrameProcessPool, PROCESS_WORKERS
+from quality_governor import QualityGovernor, QUALITY_GOVERNOR
+
+logging.basicConfig(level=logging.INFO)
+
+FIRST_FRAME_TIMEOUT = 10.0  # Seconds; decoding a file can take longer to start than a camera
+REPORT_STAGES = ('map', 'process', 'effects', 'frame_overlay', 'detect', 'hats', 'display_wait')
+REPORT_COUNTERS = ('dropped_appsink', 'dropped_sample_queue', 'dropped_frame_pool', 'dropped_process_pool',
+                   'dropped_display_queue')
+
+
+def load_asset(value, asset_dir):
+    """
+    Loads a --frame/--hat/--background argument as an image.
+
+    Args:
+        value (str): "none", a path, or a file name in `asset_dir`.
+        asset_dir (str): The directory searched for bare file names.
+
+    Returns:
+        numpy.ndarray: The image with its alpha channel, or None for "none".
+    """
+    if value == 'none':
+        return None
+    path = value if os.path.exists(value) else os.path.join(asset_dir, value)
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise SystemExit(f"Could not read asset: {value}")
+    return image
+
+
+class HeadlessBooth:
+    """
+    The parts of `CameraApp` that `FrameProcessorWorker` and `QualityGovernor`
+    use, with the display queue drained by `run` instead of the UI.
+    """
+    def __init__(self, device_path, camera_format, pacing):
+        """
+        Initializes the HeadlessBooth.
+
+        Args:
+            device_path (str): A camera device node or a stand-in source.
+            camera_format (tuple): The (w, h, pixel_format, framerate) to capture.
+            pacing (str): "realtime" or "fast", for a stand-in source.
+        """
+        self.device_path = device_path
+        self.pacing = pacing
+        self.block_samples = source_kind(device_path) != 'v4l2' and pacing == 'fast'
+        self.processor = FrameProcessor()
+        self.processor.stage_timer = metrics.observe
+        # Started first, so the worker processes are forked before the pipeline and worker threads start
+        self.process_pool = FrameProcessPool(self.processor) if PROCESS_WORKERS > 0 else None
+        self.sample_queue = queue.Queue(maxsize=5)
+        self.frame_pool = FramePool(FRAME_POOL) if FRAME_POOL > 0 else None
+        self.display_queue = queue.Queue(maxsize=2)
+        self.current_format = camera_format
+        self.supported_formats = [camera_format]
+        self.pipeline = None
+        self.latest_processed_frame = None
+        self.latest_jpeg = None
+        self.latest_raw = None
+        self.keep_raw = False
+        self.clip_recorder = None
+        self.shot_ring = None
+        self.frame_ready = None
+        self.idle_monitor = None
+        self.smile_trigger = None
+        self.countdown_active = False
+        self.glib_worker = None
+        self.frame_processor_worker = None
+        self.quality_governor = None
+        self.memory_reporter = None
+
+    def on_new_sample(self, sample, stamps):
+        if self.frame_pool is not None:
+            sample = store_sample(self.frame_pool, sample)
+            if sample is None:
+                return
+            stamps['slot'] = sample
+        try:
+            if self.block_samples:
+                self.sample_queue.put((sample, stamps), timeout=1)
+            else:
+                self.sample_queue.put_nowait((sample, stamps))
+        except queue.Full:
+            metrics.inc('dropped_sample_queue')
+            self.release_slot(stamps)
+
+    def release_slot(self, stamps):
+        slot = stamps.pop('slot', None)
+        if slot is not None:
+            self.frame_pool.release(slot)
+
+    def set_quality_format(self, camera_format):
+        """Restarts the pipeline in a format chosen by the quality governor."""
+        self._start_pipeline(camera_format)
+
+    def _start_pipeline(self, camera_format):
+        if self.pipeline:
+            self.pipeline.stop()
+        w, h, pixel_format, framerate = camera_format
+        self.current_format = camera_format
+        self.pipeline = CameraPipeline(
+            self.device_path, w, h, pixel_format, framerate, self.on_new_sample, pacing=self.pacing
+        )
+        if not self.pipeline.start():
+            raise SystemExit(f"Could not start the pipeline for {self.device_path}.")
+        if not self.pipeline.wait_for_first_sample(FIRST_FRAME_TIMEOUT):
+            logging.warning(f"No frame from {self.device_path} within {FIRST_FRAME_TIMEOUT}s.")
+        self.pipeline.active = True
+        logging.info(f"Running {self.device_path} at {w}x{h} ({pixel_format}) @ {framerate}fps, "
+                     f"{'real time' if self.pipeline.live else 'as fast as possible'}.")
+
+    def start(self):
+        self.glib_worker = GlibMainLoopWorker(daemon=True)
+        self.glib_worker.start()
+        self.frame_processor_worker = FrameProcessorWorker(self, daemon=True)
+        self.frame_processor_worker.start()
+        if QUALITY_GOVERNOR:
+            self.quality_governor = QualityGovernor(self)
+            self.quality_governor.start()
+        if MEMORY_REPORT_INTERVAL > 0:
+            self.memory_reporter = MemoryReporter(self.frame_pool)
+            self.memory_reporter.start()
+        self._start_pipeline(self.current_format)
+
+    def run(self, duration=None, frames=None, report_interval=10.0):
+        """
+        Takes processed frames off the display queue, as the UI would, until
+        `duration` seconds or `frames` frames have passed.
+        """
+        start = time.monotonic()
+        end = start + duration if duration else None
+        displayed = 0
+        first_report = last_report = (start, time.process_time(), 0)
+        while (end is None or time.monotonic() < end) and (frames is None or displayed < frames):
+            try:
+                frame, stamps = self.display_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.release_slot(stamps)
+            metrics.observe('display_wait', time.monotonic() - stamps['t_processed'])
+            metrics.inc('frames_displayed')
+            displayed += 1
+            if stamps['capture_delay'] is not None:
+                metrics.observe('glass_to_glass', stamps['capture_delay'] + time.monotonic() - stamps['t_appsink'])
+            if time.monotonic() - last_report[0] >= report_interval:
+                last_report = self.report(last_report, displayed)
+        self.report(first_report, displayed, final=True)
+
+    def report(self, last, displayed, final=False):
+        """Logs the frame rate, CPU use, stage timings and drops since `last`."""
+        now, cpu = time.monotonic(), time.process_time()
+        last_time, last_cpu, last_displayed = last
+        elapsed = max(now - last_time, 1e-9)
+        snapshot = metrics.snapshot()
+        stages = '  '.join(f"{stage} {snapshot['stages'][stage]['p50_ms']:.1f}ms"
+                           for stage in REPORT_STAGES if stage in snapshot['stages'])
+        drops = '  '.join(f"{name[len('dropped_'):]} {snapshot['counters'][name]}"
+                          for name in REPORT_COUNTERS if snapshot['counters'].get(name))
+        logging.info(f"{'Total' if final else 'Last'} {elapsed:.0f}s: "
+                     f"{(displayed - last_displayed) / elapsed:.1f} fps, cpu {(cpu - last_cpu) / elapsed * 100:.0f}%  "
+                     f"p50 {stages}  dropped: {drops or 'none'}")
+        return now, cpu, displayed
+
+    def stop(self):
+        if self.memory_reporter:
+            self.memory_reporter.report()
+            self.memory_reporter.stop()
+        if self.quality_governor:
+            self.quality_governor.stop()
+        if self.frame_processor_worker:
+            self.frame_processor_worker.stop()
+            self.frame_processor_worker.join()
+        if self.process_pool:
+            self.process_pool.close()
+        if self.pipeline:
+            self.pipeline.stop()
+        if self.glib_worker:
+            self.glib_worker.stop()
+            self.glib_worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the photobooth frame pipeline without the UI.")
+    parser.add_argument('--device', default='videotestsrc',
+                        help='A v4l device path, videotestsrc[:PATTERN], a video file or an image '
+                             'sequence such as frames/%%05d.jpg (default: videotestsrc)')
+    parser.add_argument('--resolution', default=os.environ.get('RESOLUTION') or '1920x1080',
+                        help='Capture size, WxH (default: RESOLUTION or 1920x1080)')
+    parser.add_argument('--format', default='MJPG',
+                        help='MJPG, or a raw format such as YUY2 (default: MJPG)')
+    parser.add_argument('--fps', type=int, default=30, help='Capture framerate (default: 30)')
+    parser.add_argument('--pacing', choices=['realtime', 'fast'], default=SOURCE_PACING,
+                        help='Play a --device that is not a camera in real time, or as fast as frames are processed')
+    parser.add_argument('--duration', type=float, help='Seconds to run (default: until interrupted)')
+    parser.add_argument('--frames', type=int, help='Processed frames to run for')
+    parser.add_argument('--frame', default=None,
+                        help='Birthday frame: a path, a name in assets/frames, or "none" (default: the first)')
+    parser.add_argument('--hat', default='none', help='Hat: a path, a name in assets/hats, or "none" (default)')
+    parser.add_argument('--background', default='none',
+                        help=f'Green screen background: a path, a name in {BACKGROUNDS_DIR}, or "none" (default)')
+    parser.add_argument('--effect', default=EFFECT, choices=list(EFFECT_PRESETS),
+                        help='Colour effect (default: EFFECT or none)')
+    parser.add_argument('--report', type=float, default=10.0, help='Seconds between progress reports')
+    parser.add_argument('--output', help='Write the metrics to this path at the end (.json or .prom)')
+    args = parser.parse_args()
+
+    if source_kind(args.device) == 'file' and not os.path.exists(args.device):
+        parser.error(f"No such video file: {args.device}")
+    try:
+        w, h = map(int, args.resolution.split('x'))
+    except ValueError:
+        parser.error(f"Invalid resolution: {args.resolution}")
+
+    booth = HeadlessBooth(args.device, (w, h, args.format, args.fps), args.pacing)
+    frame_arg = args.frame or next(iter(sorted(glob.glob('assets/frames/*.png'))), 'none')
+    booth.processor.set_birthday_frame(load_asset(frame_arg, 'assets/frames'))
+    booth.processor.hat = load_asset(args.hat, 'assets/hats')
+    booth.processor.background = load_asset(args.background, BACKGROUNDS_DIR)
+    if booth.processor.background is not None and booth.processor.chroma_keyer is None:
+        booth.processor.chroma_keyer = ChromaKeyer()
+    booth.processor.effect = get_effect(args.effect)
+
+    booth.start()
+    try:
+        booth.run(args.duration, args.frames, args.report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        booth.stop()
+    if args.output:
+        metrics.write(args.output)
+        logging.info(f"Metrics written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Idle ("attract") mode for when nobody is in front of the booth.
+
+`IdleMonitor` tracks the last sign of activity: a detected face, a touch or
+a capture trigger. After `IDLE_MINUTES` without any, the booth goes idle:
+the app switches the camera to the small, slow format picked by
+`idle_format`, and the frame processor worker stops processing frames, so
+detection, overlays and hats are suspended, and only shows a scaled-down
+camera preview at `IDLE_FPS`. Each of those frames also gets a cheap motion
+check, a difference against the previous frame at a tiny size, and motion
+processes that frame in full and brings the camera back to its format.
+
+With `IDLE_SLIDESHOW` set, the app shows the most recent photos in place of
+the idle preview until the booth wakes.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+from metrics import metrics
+
+# --- CONFIGURATION ---
+IDLE_MINUTES = float(os.environ.get('IDLE_MINUTES', '0'))        # Minutes without activity, 0 to never idle
+IDLE_FPS = float(os.environ.get('IDLE_FPS', '5'))                # Preview framerate while idle
+IDLE_PREVIEW_SCALE = int(os.environ.get('IDLE_PREVIEW_SCALE', '4'))  # Preview downscale while idle
+IDLE_MOTION_THRESHOLD = float(os.environ.get('IDLE_MOTION_THRESHOLD', '0.01'))  # Changed fraction that wakes
+IDLE_SLIDESHOW = os.environ.get('IDLE_SLIDESHOW')                # Show recent photos while idle
+IDLE_SLIDE_SECONDS = float(os.environ.get('IDLE_SLIDE_SECONDS', '5'))
+# --- END CONFIGURATION ---
+
+MOTION_WIDTH = 160        # Frames are compared at this width
+MOTION_PIXEL_DELTA = 25   # Grey-level change that counts a pixel as changed
+IDLE_SLIDESHOW_PHOTOS = 20  # Most recent photos in the attract slideshow
+PHOTO_PATTERNS = ('*.jpg', '*.webp', '*.png')
+
+
+def idle_format(formats, current_format, scale=IDLE_PREVIEW_SCALE, fps=IDLE_FPS):
+    """
+    Picks the camera format to use while idle.
+
+    This is the largest supported size no wider than the idle preview (the
+    current width divided by `scale`), or the smallest size if none is that
+    small, at the lowest framerate of at least `fps`. The current pixel
+    format is preferred.
+
+    Args:
+        formats (list): (w, h, pixel_format, framerate) tuples.
+        current_format (tuple): The (w, h, pixel_format, framerate) in use.
+
+    Returns:
+        tuple: The idle format, or None if no format is smaller or slower
+               than the current one.
+    """
+    w, h, pixel_format, framerate = current_format
+    candidates = [f for f in formats if f[2] == pixel_format] or list(formats)
+    if not candidates:
+        return None
+    small = [f for f in candidates if f[0] <= w // scale]
+    if small:
+        size = max((f[0] * f[1], f[0], f[1]) for f in small)[1:]
+    else:
+        size = min((f[0] * f[1], f[0], f[1]) for f in candidates)[1:]
+    same_size = [f for f in candidates if (f[0], f[1]) == size]
+    fast_enough = [f for f in same_size if f[3] >= fps]
+    chosen = min(fast_enough, key=lambda f: f[3]) if fast_enough else max(same_size, key=lambda f: f[3])
+    if chosen[0] * chosen[1] >= w * h and chosen[3] >= framerate:
+        return None
+    return tuple(chosen)
+
+
+def recent_photos(directory='photos', count=IDLE_SLIDESHOW_PHOTOS):
+    """
+    Returns the paths of the most recent photos in a directory, newest first.
+
+    Photos removed while the directory is listed are left out.
+    """
+    photos = []
+    for pattern in PHOTO_PATTERNS:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            try:
+                photos.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+    photos.sort(reverse=True)
+    return [path for _, path in photos[:count]]
+
+
+class IdleMonitor:
+    """
+    Decides when the booth is idle and when it wakes up.
+
+    `on_change` is called with True when the booth goes idle and False when
+    it wakes, from whichever thread noticed the change.
+    """
+    def __init__(self, timeout=IDLE_MINUTES * 60, fps=IDLE_FPS, on_change=None):
+        """
+        Initializes the IdleMonitor.
+
+        Args:
+            timeout (float): Seconds without activity before going idle.
+            fps (float): Frames per second to show and check for motion while idle.
+            on_change: Called with the new idle state.
+        """
+        self.timeout = timeout
+        self.frame_interval = 1.0 / fps
+        self.on_change = on_change
+        self.idle = False
+        self.preview_width = None  # Idle preview width, from the first idle frame at the full format
+        self._lock = threading.Lock()
+        self._last_activity = time.monotonic()
+        self._next_frame_time = 0.0
+        self._previous = None  # The last small greyscale frame, while idle
+        metrics.set_gauge('idle', 0)
+
+    def note_activity(self, reason):
+        """Records activity, waking the booth if it is idle."""
+        with self._lock:
+            self._last_activity = time.monotonic()
+            if not self.idle:
+                return
+            self.idle = False
+            self._previous = None
+            self.preview_width = None
+        logging.info(f"Leaving idle mode: {reason}.")
+        metrics.set_gauge('idle', 0)
+        metrics.inc('idle_wakeups')
+        if self.on_change:
+            self.on_change(False)
+
+    def check(self):
+        """Puts the booth to sleep if there has been no activity for the timeout."""
+        with self._lock:
+            if self.idle or time.monotonic() - self._last_activity < self.timeout:
+                return
+            self.idle = True
+            self._next_frame_time = 0.0
+            self.preview_width = None
+        logging.info(f"No activity for {self.timeout / 60:g} minutes; entering idle mode.")
+        metrics.set_gauge('idle', 1)
+        if self.on_change:
+            self.on_change(True)
+
+    def take_frame(self):
+        """
+        Returns True if an idle frame is due, False to skip this one.
+        """
+        now = time.monotonic()
+        if now < self._next_frame_time:
+            return False
+        if now - self._next_frame_time < self.frame_interval:
+            self._next_frame_time += self.frame_interval  # Keep to the frame clock
+        else:
+            self._next_frame_time = now + self.frame_interval  # First frame, or after a stall
+        return True
+
+    def detect_motion(self, frame):
+        """
+        Compares a BGR frame with the previous idle frame.
+
+        Returns:
+            bool: True if enough of the picture changed.
+        """
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (MOTION_WIDTH, max(h * MOTION_WIDTH // w, 1)), interpolation=cv2.INTER_NEAREST)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self._previous = self._previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return False
+        _, changed = cv2.threshold(cv2.absdiff(gray, previous), MOTION_PIXEL_DELTA, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) / changed.size >= IDLE_MOTION_THRESHOLD
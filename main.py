@@ -12,12 +12,22 @@ created and used.
 """
 import os
 os.environ['KIVY_NO_ARGS'] = '1'
+if os.environ.get('DISPLAY_MODE') == 'push':
+    # Let frames pushed from the worker wake the clock instead of waiting out its sleep
+    os.environ.setdefault('KIVY_CLOCK', 'interrupt')
 import kivy
 kivy.require('2.3.1')
 
+from frame_processor import FrameProcessor
+from process_pool import FrameProcessPool, PROCESS_WORKERS
+
+# Fork the worker processes now, before Gst.init and the Kivy window start
+# threads and open a GL context that the workers would inherit
+PROCESS_POOL = FrameProcessPool(FrameProcessor()) if __name__ == '__main__' and PROCESS_WORKERS > 0 else None
+
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import Gst, GLib
+from gi.repository import Gst
 
 Gst.init(None)
 
@@ -34,7 +44,7 @@ from kivy.uix.spinner import Spinner
 from kivy.uix.popup import Popup
 from kivy.uix.button import Button
 from kivy.uix.label import Label
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 from kivy.graphics.texture import Texture
 import cv2
 import os
@@ -48,8 +58,27 @@ import requests
 import argparse
 import threading
 import queue
+from collections import deque
+from contextlib import nullcontext
 import numpy as np
 import time
+import v4l2_probe
+import photo_output
+from asset_library import AssetLibrary
+from asset_watcher import AssetWatcher
+import photo_strip
+import clip_recorder
+from metrics import metrics, MetricsExporter
+from camera_registry import CameraRegistry
+from camera_pipeline import CameraPipeline, GlibMainLoopWorker, PREVIEW_SCALE, SOURCE_PACING, source_kind
+from frame_pool import FramePool, MemoryReporter, FRAME_POOL, MEMORY_REPORT_INTERVAL
+from frame_processor import FrameProcessorWorker, pick_best_shot, store_sample
+from quality_governor import QualityGovernor, QUALITY_GOVERNOR
+from chroma_key import CHROMA_KEY, BACKGROUNDS_DIR, ChromaKeyer
+from face_detectors import create_detector
+from effects import EFFECT, EFFECT_PRESETS, get_effect
+from smile_trigger import SmileTrigger, SMILE_TRIGGER
+from idle_mode import IdleMonitor, IDLE_MINUTES, IDLE_SLIDESHOW, IDLE_SLIDE_SECONDS, idle_format, recent_photos
 VOICE_ENABLED = os.environ.get('VOICE_ENABLED')
 if VOICE_ENABLED:
     from voice_listener import VoiceListener
@@ -59,8 +88,42 @@ logging.basicConfig(level=logging.INFO)
 DEFAULT_BANNER_PATH = 'assets/default_banner.png'
 PHOTOBOOTH_URL = os.environ.get('PHOTOBOOTH_URL')
 RESOLUTION = os.environ.get('RESOLUTION')
+PIPELINE_FIRST_FRAME_TIMEOUT = 5.0  # Seconds to wait for a new pipeline's first frame
+PHOTO_FORMAT = os.environ.get('PHOTO_FORMAT', 'jpeg').lower()  # jpeg, webp or png
+PHOTO_QUALITY = int(os.environ.get('PHOTO_QUALITY', '92'))
+SAVE_RAW = os.environ.get('SAVE_RAW')                  # Also keep raw frames for rerender.py
+CAPTURE_MODE = os.environ.get('CAPTURE_MODE', 'single')  # single, strip, grid or clip
+BURST_COUNT = int(os.environ.get('BURST_COUNT', '4'))  # Shots per strip or grid
+BURST_INTERVAL = float(os.environ.get('BURST_INTERVAL', '2.0'))  # Seconds between burst shots
+BURST_MAX_MISSES = 3  # Burst shots without a frame before the burst is abandoned
+BEST_SHOT_FRAMES = int(os.environ.get('BEST_SHOT_FRAMES', '6'))  # Frames to pick a photo from, 0 to disable
+BEST_SHOT_LOOKAHEAD = float(os.environ.get('BEST_SHOT_LOOKAHEAD', '0.1'))  # Seconds of frames after the shutter
+ASSET_WATCH = os.environ.get('ASSET_WATCH', '1') != '0'  # Pick up asset changes while running
+PERF_HUD = os.environ.get('PERF_HUD')                  # Show the performance overlay
+METRICS_FILE = os.environ.get('METRICS_FILE')          # .json, or .prom for Prometheus text
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', '10'))
+LATENCY_MODE = os.environ.get('LATENCY_MODE')          # Log camera-to-display latency distributions
+LATENCY_WINDOW = int(os.environ.get('LATENCY_WINDOW', '3000'))  # Frames per latency distribution
+DISPLAY_MODE = os.environ.get('DISPLAY_MODE', 'poll')  # poll (60Hz timer) or push (on each frame)
 # --- END CONFIGURATION ---
 
+# Segments of the camera-to-display path, in order, as recorded in the metrics
+LATENCY_STAGES = [
+    'capture_to_appsink', 'sample_queue_wait', 'process', 'display_wait', 'upload', 'glass_to_glass'
+]
+LATENCY_BUCKETS_MS = [10, 20, 33, 50, 67, 100, 150, 200, 300, 500]
+
+if LATENCY_MODE:
+    metrics.window = max(metrics.window, LATENCY_WINDOW)
+
+if PHOTO_FORMAT not in photo_output.PHOTO_FORMATS:
+    logging.warning(f"Unknown PHOTO_FORMAT '{PHOTO_FORMAT}'; saving photos as JPEG.")
+    PHOTO_FORMAT = 'jpeg'
+
+if CAPTURE_MODE not in ('single', 'strip', 'grid', 'clip'):
+    logging.warning(f"Unknown CAPTURE_MODE '{CAPTURE_MODE}'; taking single photos.")
+    CAPTURE_MODE = 'single'
+
 # A list of common resolutions to test
 STANDARD_RESOLUTIONS = [
     (640, 480),
@@ -72,6 +135,13 @@ STANDARD_RESOLUTIONS = [
     (3840, 2160)
 ]
 
+# Stand-in sources (see camera_pipeline.source_kind) offer one size, as
+# MJPG and as raw YUY2 like a USB webcam, unless RESOLUTION is set
+STAND_IN_NAME = 'Test source'
+STAND_IN_RESOLUTION = (1920, 1080)
+STAND_IN_FRAMERATE = 30
+STAND_IN_FORMATS = ['YUY2', 'MJPG']
+
 class RoundButton(ButtonBehavior, Widget):
     """
     A circular button with a visual feedback effect on press.
@@ -156,61 +226,6 @@ class RoundImageButton(ButtonBehavior, Image):
         self.stencil_shape.size = self.size
 
 
-class GlibMainLoopWorker(threading.Thread):
-    """A worker thread that runs the GLib.MainLoop."""
-    def __init__(self, **kwargs):
-        super(GlibMainLoopWorker, self).__init__(**kwargs)
-        self.main_loop = GLib.MainLoop()
-
-    def run(self):
-        logging.info("GLib main loop worker started.")
-        self.main_loop.run()
-        logging.info("GLib main loop worker stopped.")
-
-    def stop(self):
-        if self.main_loop.is_running():
-            self.main_loop.quit()
-
-class FrameProcessorWorker(threading.Thread):
-    """A worker thread to process GStreamer frames."""
-    def __init__(self, app, **kwargs):
-        super(FrameProcessorWorker, self).__init__(**kwargs)
-        self.app = app
-        self.stop_event = threading.Event()
-
-    def run(self):
-        logging.info("Frame processor worker started.")
-        while not self.stop_event.is_set():
-            try:
-                sample = self.app.sample_queue.get(timeout=0.1)
-            except queue.Empty:
-                continue
-
-            if sample:
-                buf = sample.get_buffer()
-                caps = sample.get_caps()
-                h = caps.get_structure(0).get_value("height")
-                w = caps.get_structure(0).get_value("width")
-
-                success, map_info = buf.map(Gst.MapFlags.READ)
-                if success:
-                    frame = np.ndarray((h, w, 3), buffer=map_info.data, dtype=np.uint8)
-
-                    # The frame from GStreamer is BGR. _apply_overlay expects BGR.
-                    processed_frame = self.app._apply_overlay(frame.copy())
-                    self.app.latest_processed_frame = processed_frame
-
-                    try:
-                        self.app.display_queue.put_nowait(processed_frame)
-                    except queue.Full:
-                        pass # UI is lagging
-
-                    buf.unmap(map_info)
-        logging.info("Frame processor worker stopped.")
-
-    def stop(self):
-        self.stop_event.set()
-
 class CameraApp(App):
     """
     The main application class for the camera app.
@@ -219,23 +234,74 @@ class CameraApp(App):
     and photo capture logic. It builds the GUI using Kivy widgets and manages
     camera selection, resolution changes, and the capture process.
     """
-    def __init__(self, device=None, resolution=None, **kwargs):
+    def __init__(self, device=None, resolution=None, source=None, pacing=SOURCE_PACING, **kwargs):
         super(CameraApp, self).__init__(**kwargs)
         self.device = device
         self.resolution = resolution
-        self.resized_overlay = None
-        self.pipeline = None
+        self.source = source           # A stand-in source used instead of the cameras
+        self.pacing = pacing           # "realtime" or "fast", for the stand-in source
+        # As fast as possible means waiting for the worker instead of dropping samples
+        self.block_samples = source is not None and pacing == 'fast'
+        self.process_pool = PROCESS_POOL
+        self.processor = PROCESS_POOL.processor if PROCESS_POOL else FrameProcessor()
+        self.effect_names = list(EFFECT_PRESETS)
+        self.current_effect_index = self.effect_names.index(EFFECT) if EFFECT in self.effect_names else 0
+        self.processor.effect = get_effect(self.effect_names[self.current_effect_index])
+        self.assets = AssetLibrary()
+        self.hat_paths = [None]        # Hat asset paths, None for no hat
+        self.background_paths = [None]  # Green screen background paths, None for the camera image
+        self.current_background_index = 0
+        self.preview_size = None       # (w, h) of the processed frames
+        self.asset_watcher = None
+        self.current_hat_index = 0
+        self.pipeline = None           # The active CameraPipeline
+        self._pipeline_lock = threading.Lock()
+        self._starting_pipeline = None # A new pipeline waiting for its first frame, outside the lock
+        self._pipeline_request = None  # Last requested (device_path, w, h, pixel_format, framerate)
+        self._switch_generation = 0    # Skips switches superseded by newer requests
+        self.current_format = None     # (w, h, pixel_format, framerate) of the pipeline
+        self.camera_lost = False       # The active camera was unplugged
+        self.camera_registry = None
+        self.metrics_exporter = None
         self.glib_worker = None
         self.frame_processor_worker = None
+        self.quality_governor = None
+        self.photo_writer = None
+        self.capture_processor = None  # The photo writer's own FrameProcessor, see _capture_processor_for
         self.sample_queue = queue.Queue(maxsize=5)  # Raw samples from GStreamer
+        # Fixed frame slots for the queues, in memory-budget mode
+        self.frame_pool = FramePool(FRAME_POOL) if FRAME_POOL > 0 else None
+        if 0 < FRAME_POOL < BEST_SHOT_FRAMES + 9:
+            logging.warning(f"FRAME_POOL={FRAME_POOL} is smaller than BEST_SHOT_FRAMES + 9 ({BEST_SHOT_FRAMES + 9}); "
+                            "frames will be dropped and best shots picked from fewer frames.")
+        self.memory_reporter = None
+        self._preview_texture = None                # Reused for every frame, with a frame pool
+        self._preview_rgb = None
         self.display_queue = queue.Queue(maxsize=2) # Processed frames for the UI
         self.latest_processed_frame = None          # For photo capture
+        self.latest_jpeg = None                     # Camera JPEG behind it, on the libjpeg path
+        self.keep_raw = bool(SAVE_RAW) or CAPTURE_MODE in ('strip', 'grid')  # Strips are built from raw shots
+        self.clip_recorder = None                   # The ClipRecorder taking frames, in clip mode
+        # Scored recent frames for picking the best shot
+        self.shot_ring = deque(maxlen=BEST_SHOT_FRAMES) if BEST_SHOT_FRAMES > 0 else None
+        self.latest_raw = None                      # (frame, faces) behind it, with SAVE_RAW
+        self.frame_ready = None                     # Called by the worker in push display mode
+        # Throttles the pipeline when nobody is around
+        self.idle_monitor = IdleMonitor(on_change=self.on_idle_changed) if IDLE_MINUTES > 0 else None
+        self._slide_event = None                    # Attract slideshow timer, while idle
+        self._idle_formats = None                   # (idle format, format to restore on wake), while idle
+        self._slide_index = 0
+        self.countdown_active = False
+        # Captures when everyone smiles; needs faces whether or not a hat is on
+        self.smile_trigger = SmileTrigger(self._on_smile) if SMILE_TRIGGER else None
+        if self.smile_trigger and self.smile_trigger.available:
+            self.processor.detect_always = True
         self.current_camera_name = None
         self.supported_formats = []
+        self._format_cache = {}       # camera index -> probed formats
+        self._probe_generation = 0    # Discards results from superseded probes
 
-        self.face_cascade = cv2.CascadeClassifier('assets/haarcascade_frontalface_default.xml')
-        if self.face_cascade.empty():
-            logging.error("Failed to load Haar Cascade for face detection.")
+        self.available_cameras = {}
 
     def get_available_cameras(self):
         """
@@ -270,7 +336,11 @@ class CameraApp(App):
         """
         Determines the supported resolutions, pixel formats, and framerates for a given camera.
         It uses `v4l2-ctl` to get a reliable list of format/resolution/framerate combinations.
-        If that fails, it falls back to a basic OpenCV-based trial-and-error method.
+        If that fails, it enumerates the formats with V4L2 ioctls, and only if that
+        also fails does it fall back to a basic OpenCV-based trial-and-error method.
+
+        This can block for several seconds on the OpenCV path, so it is run on a
+        background thread by `set_active_camera`.
 
         Args:
             camera_index (int): The index of the camera to check.
@@ -343,24 +413,24 @@ class CameraApp(App):
             logging.warning(f"v4l2-ctl for {device_path} failed (is it installed?): {e}. "
                             "Falling back to OpenCV's trial-and-error method.")
 
-        # Fallback to OpenCV's trial-and-error method
+        # Query the driver directly. This answers in milliseconds and does not
+        # need the device to be free.
+        formats = v4l2_probe.enumerate_formats(device_path, self._resolutions_to_check())
+        if formats:
+            formats = sorted(list(set(formats)), key=lambda f: (f[0] * f[1], f[3]))
+            logging.info(f"Found formats for {device_path} via V4L2 ioctls: {formats}")
+            return formats
+        logging.warning(f"V4L2 format enumeration for {device_path} gave no results. "
+                        "Falling back to OpenCV's trial-and-error method.")
+
+        # Last resort: OpenCV's trial-and-error method
         supported_formats = []
         cap = cv2.VideoCapture(camera_index, cv2.CAP_V4L2)
         if not cap.isOpened():
             logging.error(f"Could not open camera index {camera_index} for fallback resolution check.")
             return []
 
-        # Add the user-specified resolution to the list to ensure it is checked
-        resolutions_to_check = STANDARD_RESOLUTIONS[:] # Make a copy
-        if self.resolution:
-            try:
-                w, h = map(int, self.resolution.split('x'))
-                if (w, h) not in resolutions_to_check:
-                    resolutions_to_check.append((w, h))
-            except (ValueError, TypeError):
-                logging.error(f"Invalid resolution format: {self.resolution}")
-
-        for w, h in resolutions_to_check:
+        for w, h in self._resolutions_to_check():
             # Set the desired resolution
             cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
             cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
@@ -389,36 +459,68 @@ class CameraApp(App):
 
         return supported_formats
 
+    def get_stand_in_formats(self):
+        """
+        Returns the formats of the stand-in source, as
+        `get_supported_resolutions` does for a camera.
+        """
+        w, h = STAND_IN_RESOLUTION
+        if self.resolution:
+            try:
+                w, h = map(int, self.resolution.split('x'))
+            except (ValueError, TypeError):
+                logging.error(f"Invalid resolution format: {self.resolution}")
+        return [(w, h, pixel_format, STAND_IN_FRAMERATE) for pixel_format in STAND_IN_FORMATS]
+
+    def _resolutions_to_check(self):
+        """
+        Returns the standard resolutions plus the user-specified one, if any.
+        """
+        resolutions_to_check = STANDARD_RESOLUTIONS[:] # Make a copy
+        if self.resolution:
+            try:
+                w, h = map(int, self.resolution.split('x'))
+                if (w, h) not in resolutions_to_check:
+                    resolutions_to_check.append((w, h))
+            except (ValueError, TypeError):
+                logging.error(f"Invalid resolution format: {self.resolution}")
+        return resolutions_to_check
+
     def build(self):
         """
         Builds the application's user interface.
         """
         Window.fullscreen = True
-        self.birthday_frame = None
         self.frame_files = sorted(glob.glob('assets/frames/*.png'))
         self.current_frame_index = 0
         if self.frame_files:
             # Start with a random frame
             self.current_frame_index = random.randint(0, len(self.frame_files) - 1)
             frame_path = self.frame_files[self.current_frame_index]
-            self.birthday_frame = cv2.imread(frame_path, cv2.IMREAD_UNCHANGED)
+            self.processor.set_birthday_frame(self.assets.get(frame_path))
             logging.info(f"Loaded birthday frame: {frame_path}")
+        # Decode the other frames in the background
+        self.assets.preload(self.frame_files)
 
-        self.hats = [None]  # "no hat" option
         self.hat_files = sorted(glob.glob('assets/hats/*.png'))
+        self.hat_paths = [None] + self.hat_files  # Starting with the "no hat" option
         self.current_hat_index = 0
         if self.hat_files:
-            for hat_file in self.hat_files:
-                hat = cv2.imread(hat_file, cv2.IMREAD_UNCHANGED)
-                if hat is not None:
-                    self.hats.append(hat)
-            if len(self.hats) > 1:
-                logging.info(f"Loaded {len(self.hats) - 1} hats.")
-            else:
-                logging.warning("Found hat files, but failed to load them.")
+            self.assets.preload(self.hat_files)
+            logging.info(f"Loading {len(self.hat_files)} hats in the background.")
         else:
             logging.info("No hats found in assets/hats/")
 
+        if CHROMA_KEY:
+            self.background_paths = [None] + sorted(glob.glob(os.path.join(BACKGROUNDS_DIR, '*.png')))
+            if len(self.background_paths) > 1:
+                # Start with the first background; the booth has a green screen
+                self.current_background_index = 1
+                self.processor.background = self.assets.get(self.background_paths[1])
+                self.assets.preload(self.background_paths[2:])
+            else:
+                logging.info(f"No backgrounds found in {BACKGROUNDS_DIR}/")
+
         Window.clearcolor = (0.678, 0.847, 0.902, 1)  # Light blue background
         root = FloatLayout()
         main_layout = BoxLayout(orientation='vertical', spacing=10, padding=10)
@@ -439,7 +541,16 @@ class CameraApp(App):
         self.camera_view = Image()
         main_layout.add_widget(self.camera_view)
 
-        self.available_cameras = self.get_available_cameras()
+        if self.source:
+            self.available_cameras = {STAND_IN_NAME: {'index': None, 'type': 'stand-in', 'path': self.source}}
+            logging.info(f"Using {self.source} instead of a camera ({self.pacing} pacing).")
+        else:
+            self.camera_registry = CameraRegistry(on_added=self.on_camera_added, on_removed=self.on_camera_removed)
+            if self.camera_registry.start():
+                self.available_cameras = self.camera_registry.get_cameras()
+        if not self.available_cameras:
+            # The device monitor is unavailable or sees nothing (e.g. under confinement)
+            self.available_cameras = self.get_available_cameras()
         if not self.available_cameras:
             logging.error("No cameras found!")
             return root
@@ -493,6 +604,25 @@ class CameraApp(App):
         self.hat_switch_button.bind(on_press=self.change_hat)
         root.add_widget(self.hat_switch_button)
 
+        self.effect_switch_button = RoundImageButton(
+            source='assets/filter-icon.png',
+            size_hint=(None, None),
+            size=(128, 128),
+            pos_hint={'right': 0.73, 'y': 0.05}
+        )
+        self.effect_switch_button.bind(on_press=self.change_effect)
+        root.add_widget(self.effect_switch_button)
+
+        if CHROMA_KEY:
+            self.background_switch_button = RoundImageButton(
+                source='assets/background-icon.png',
+                size_hint=(None, None),
+                size=(128, 128),
+                pos_hint={'x': 0.16, 'y': 0.05}
+            )
+            self.background_switch_button.bind(on_press=self.change_background)
+            root.add_widget(self.background_switch_button)
+
         self.countdown_label = Label(
             text="",
             font_size='200sp',
@@ -512,15 +642,67 @@ class CameraApp(App):
         self.flash.bind(size=self._update_flash_rect, pos=self._update_flash_rect)
         root.add_widget(self.flash)
 
+        if ASSET_WATCH:
+            directories = ['assets/frames', 'assets/hats']
+            if CHROMA_KEY and os.path.isdir(BACKGROUNDS_DIR):
+                directories.append(BACKGROUNDS_DIR)
+            self.asset_watcher = AssetWatcher(directories, self.on_assets_changed)
+            self.asset_watcher.start()
+
         self.glib_worker = GlibMainLoopWorker()
         self.glib_worker.start()
 
         self.frame_processor_worker = FrameProcessorWorker(self)
         self.frame_processor_worker.start()
 
+        if QUALITY_GOVERNOR:
+            self.quality_governor = QualityGovernor(self)
+            self.quality_governor.start()
+
+        if self.idle_monitor:
+            Window.bind(on_touch_down=self._on_any_touch)
+
+        self.photo_writer = photo_output.PhotoWriter()
+        self.photo_writer.start()
+        self._burst = None
+
         self.set_active_camera(initial_camera_name)
 
-        Clock.schedule_interval(self.update, 1/60.0)
+        if DISPLAY_MODE == 'push':
+            # Draw each frame as soon as it is ready instead of polling for it
+            self.frame_ready = Clock.create_trigger(self.update)
+            logging.info("Display mode: push.")
+        else:
+            Clock.schedule_interval(self.update, 1/60.0)
+
+        if LATENCY_MODE:
+            Clock.schedule_interval(self.report_latency, 10)
+
+        self.processor.stage_timer = metrics.observe
+        if PERF_HUD:
+            self.hud_label = Label(
+                text="",
+                font_size='14sp',
+                halign='left',
+                valign='top',
+                color=(1, 1, 1, 1),
+                outline_width=2,
+                outline_color=(0, 0, 0, 1),
+                size_hint=(0.4, 0.4),
+                pos_hint={'x': 0.01, 'top': 0.99}
+            )
+            self.hud_label.bind(size=self.hud_label.setter('text_size'))
+            root.add_widget(self.hud_label)
+            self._hud_last_displayed = 0
+            Clock.schedule_interval(self.update_hud, 0.5)
+
+        if METRICS_FILE:
+            self.metrics_exporter = MetricsExporter(metrics, METRICS_FILE, METRICS_INTERVAL)
+            self.metrics_exporter.start()
+
+        if MEMORY_REPORT_INTERVAL > 0:
+            self.memory_reporter = MemoryReporter(self.frame_pool)
+            self.memory_reporter.start()
 
         self.capture_trigger = Clock.create_trigger(self.capture_photo)
         if VOICE_ENABLED:
@@ -535,86 +717,260 @@ class CameraApp(App):
 
         return root
 
+    def _on_smile(self):
+        self.capture_trigger()
+
     def _update_flash_rect(self, instance, value):
         self.flash_rect.pos = instance.pos
         self.flash_rect.size = instance.size
 
-    def on_new_sample(self, sink):
-        sample = sink.emit("pull-sample")
-        if sample:
+    def on_new_sample(self, sample, stamps):
+        if self.frame_pool is not None:
+            # Copy the frame out now, so the queue holds no GStreamer buffers
+            sample = store_sample(self.frame_pool, sample)
+            if sample is None:
+                return
+            stamps['slot'] = sample
+        try:
+            if self.block_samples:
+                self.sample_queue.put((sample, stamps), timeout=1)
+            else:
+                self.sample_queue.put_nowait((sample, stamps))
+        except queue.Full:
+            metrics.inc('dropped_sample_queue')
+            self._release_slot(stamps)
+
+    def _release_slot(self, stamps):
+        """Releases the frame pool slot a queued frame's stamps hold, if any."""
+        slot = stamps.pop('slot', None)
+        if slot is not None:
+            self.frame_pool.release(slot)
+
+    def _clear_display_queue(self):
+        """Drops the frames waiting for display, so the next one shows a change."""
+        while not self.display_queue.empty():
             try:
-                self.sample_queue.put_nowait(sample)
-            except queue.Full:
-                pass
-        return Gst.FlowReturn.OK
+                _, stamps = self.display_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._release_slot(stamps)
 
-    def set_pipeline_format(self, w, h, pixel_format, framerate):
-        logging.info(f"Setting pipeline to: {w}x{h} ({pixel_format}) @ {framerate}fps")
+    def _clear_shot_ring(self):
+        with self.frame_pool.lock if self.frame_pool else nullcontext():
+            for candidate in self.shot_ring:
+                if candidate['slot'] is not None:
+                    self.frame_pool.release(candidate['slot'])
+            self.shot_ring.clear()
 
-        if self.pipeline:
-            self.pipeline.set_state(Gst.State.NULL)
-            logging.info("Stopped previous GStreamer pipeline.")
+    def set_pipeline_format(self, w, h, pixel_format, framerate, force=False):
+        """
+        Switches the camera pipeline to a new format without blocking the UI.
 
-        camera_info = self.available_cameras[self.current_camera_name]
-        selected_index = camera_info['index']
+        The new pipeline is built and started on a background thread. When the
+        camera changes, the old pipeline keeps feeding the preview until the new
+        one has delivered its first frame. A device can only be opened once, so
+        for a format change on the same camera the old pipeline is stopped
+        first and the last frame stays on screen until the new one arrives.
 
-        self.pipeline = Gst.Pipeline.new("camera-pipeline")
-        source = Gst.ElementFactory.make("v4l2src", "source")
-        source.set_property("device", f"/dev/video{selected_index}")
+        Args:
+            w (int): Capture width.
+            h (int): Capture height.
+            pixel_format (str): The V4L2 fourcc, e.g. "MJPG" or "YUYV".
+            framerate (int): Capture framerate.
+            force (bool): Rebuild even if this format is already active.
+        """
+        camera_info = self.available_cameras[self.current_camera_name]
+        device_path = camera_info.get('path') or f"/dev/video{camera_info['index']}"
+        request = (device_path, w, h, pixel_format, framerate)
+        if request == self._pipeline_request and not force:
+            return
 
-        if pixel_format == 'MJPG':
-            caps_str = f"image/jpeg,width={w},height={h},framerate={framerate}/1"
-            decoder = Gst.ElementFactory.make("jpegdec", "decoder")
-        else:
-            caps_str = f"video/x-raw,format={pixel_format},width={w},height={h},framerate={framerate}/1"
-            decoder = None
-
-        caps = Gst.Caps.from_string(caps_str)
-        caps_filter = Gst.ElementFactory.make("capsfilter", "caps_filter")
-        caps_filter.set_property("caps", caps)
-
-        videoconvert = Gst.ElementFactory.make("videoconvert", "videoconvert")
-        final_caps = Gst.Caps.from_string("video/x-raw,format=BGR")
-        final_caps_filter = Gst.ElementFactory.make("capsfilter", "final_caps_filter")
-        final_caps_filter.set_property("caps", final_caps)
-
-        sink = Gst.ElementFactory.make("appsink", "sink")
-        sink.set_property("emit-signals", True)
-        sink.set_property("max-buffers", 1)
-        sink.set_property("drop", True)
-        sink.connect("new-sample", self.on_new_sample)
-
-        elements = [source, caps_filter, videoconvert, final_caps_filter, sink]
-        if decoder:
-            elements.insert(2, decoder)
-
-        for el in elements:
-            self.pipeline.add(el)
-
-        source.link(caps_filter)
-        if decoder:
-            caps_filter.link(decoder)
-            decoder.link(videoconvert)
-        else:
-            caps_filter.link(videoconvert)
-        videoconvert.link(final_caps_filter)
-        final_caps_filter.link(sink)
+        logging.info(f"Setting pipeline to: {w}x{h} ({pixel_format}) @ {framerate}fps")
+        self._pipeline_request = request
+        self.current_format = (w, h, pixel_format, framerate)
+        self.camera_lost = False
+        self._switch_generation += 1
+        threading.Thread(
+            target=self._switch_pipeline,
+            args=(request, self._switch_generation),
+            daemon=True
+        ).start()
+
+    @mainthread
+    def set_quality_format(self, camera_format):
+        """Switches to a camera format chosen by the quality governor."""
+        if self.current_camera_name in self.available_cameras:
+            self.set_pipeline_format(*camera_format)
+
+    def _switch_pipeline(self, request, generation):
+        device_path, w, h, pixel_format, framerate = request
+        with self._pipeline_lock:
+            if generation != self._switch_generation:
+                logging.info(f"Skipping superseded pipeline switch to {w}x{h} ({pixel_format}).")
+                return
+
+            start = time.monotonic()
+            self._stop_starting_pipeline()
+            old_pipeline = self.pipeline
+            warm_standby = old_pipeline is not None and old_pipeline.device_path != device_path
+            if old_pipeline and not warm_standby:
+                old_pipeline.stop()
+                self.pipeline = None
+                logging.info("Stopped previous GStreamer pipeline.")
+
+            new_pipeline = CameraPipeline(
+                device_path, w, h, pixel_format, framerate, self.on_new_sample,
+                keep_jpeg=(PHOTO_FORMAT == 'jpeg'), pacing=self.pacing
+            )
+            if not new_pipeline.start():
+                self._restore_pipeline(old_pipeline, warm_standby, request)
+                return
+            self._starting_pipeline = new_pipeline
+
+        # Wait without the lock, so hotplug events and newer switches are not held up
+        got_frame = new_pipeline.wait_for_first_sample(PIPELINE_FIRST_FRAME_TIMEOUT)
+
+        with self._pipeline_lock:
+            if self._starting_pipeline is not new_pipeline:
+                return  # Stopped by a newer switch or because the camera went away
+            self._starting_pipeline = None
+            if not got_frame:
+                logging.warning(f"No frame from {device_path} within {PIPELINE_FIRST_FRAME_TIMEOUT}s.")
+                if warm_standby:
+                    # Keep showing the camera that works
+                    new_pipeline.stop()
+                    self._on_pipeline_failed(request)
+                    return
+
+            old_pipeline = self.pipeline
+            new_pipeline.active = True
+            self.pipeline = new_pipeline
+            if old_pipeline:
+                old_pipeline.stop()
+                logging.info("Stopped previous GStreamer pipeline.")
+
+            elapsed_ms = (time.monotonic() - start) * 1000
+            logging.info(f"Pipeline switch to {device_path} {w}x{h} ({pixel_format}) @ {framerate}fps "
+                         f"took {elapsed_ms:.0f}ms ({'warm standby' if warm_standby else 'cold restart'}).")
+        self._on_pipeline_switched(w, h, pixel_format, framerate)
+
+    def _stop_starting_pipeline(self):
+        """Stops a pipeline still waiting for its first frame. Called with the pipeline lock held."""
+        if self._starting_pipeline:
+            self._starting_pipeline.stop()
+            self._starting_pipeline = None
+
+    def _restore_pipeline(self, old_pipeline, warm_standby, request):
+        """
+        Handles a new pipeline that failed to start. Called with the pipeline lock held.
 
-        ret = self.pipeline.set_state(Gst.State.PLAYING)
-        if ret == Gst.StateChangeReturn.FAILURE:
-            logging.error("Unable to set the pipeline to the playing state.")
+        In a warm standby switch the old pipeline is still running. After a
+        cold restart it was already stopped to free the device, so it is
+        restarted in its previous format.
+        """
+        if old_pipeline is None or warm_standby:
+            self._on_pipeline_failed(request)
             return
+        camera_format = old_pipeline.format
+        logging.warning(f"Restarting {old_pipeline.device_path} in its previous format {camera_format}.")
+        restored = CameraPipeline(
+            old_pipeline.device_path, *camera_format, self.on_new_sample,
+            keep_jpeg=(PHOTO_FORMAT == 'jpeg'), pacing=self.pacing
+        )
+        if not restored.start():
+            logging.error(f"Could not restart {old_pipeline.device_path}; no camera pipeline is running.")
+            self._on_pipeline_failed(request)
+            return
+        restored.active = True
+        self.pipeline = restored
+        self._on_pipeline_failed(request, (old_pipeline.device_path, *camera_format))
 
+    @mainthread
+    def _on_pipeline_switched(self, w, h, pixel_format, framerate):
         logging.info("GStreamer pipeline started successfully.")
         self.resolution_selector.text = f"{w}x{h} ({pixel_format}) @ {framerate}fps"
+        self._prepare_frames(w, h)
+        if self.shot_ring is not None:
+            self._clear_shot_ring()  # Don't pick a frame from the previous camera or format
+
+    def _prepare_frames(self, w, h):
+        """Prepares every birthday frame for the new preview size in the background."""
+        pipeline = self.pipeline
+        if pipeline and pipeline.decoder_mode == 'libjpeg' and PREVIEW_SCALE > 1:
+            # libjpeg's DCT scaling rounds the size up
+            w, h = -(-w // PREVIEW_SCALE), -(-h // PREVIEW_SCALE)
+        self.preview_size = (w, h)
+        if not self.frame_files:
+            return
+        # Starting with the next frame the button switches to
+        start = (self.current_frame_index + 1) % len(self.frame_files)
+        order = self.frame_files[start:] + self.frame_files[:start]
+        self.assets.prepare_all(order, self.preview_size)
+        logging.info(f"Preparing {len(order)} birthday frames for {w}x{h} in the background.")
+
+    @mainthread
+    def _on_pipeline_failed(self, request, restored=None):
+        """
+        Allows a failed format to be retried. If the previous format was
+        restarted instead, `restored` is its (device_path, w, h,
+        pixel_format, framerate).
+        """
+        if self._pipeline_request != request:
+            return  # A newer request is on its way
+        self._pipeline_request = restored
+        if restored:
+            self.current_format = restored[1:]
+            w, h, pixel_format, framerate = self.current_format
+            self.resolution_selector.text = f"{w}x{h} ({pixel_format}) @ {framerate}fps"
 
     def set_active_camera(self, camera_name):
+        if self.camera_lost and camera_name != self.current_camera_name:
+            # Forget the unplugged camera now that it is no longer needed
+            if self.current_camera_name not in self.camera_registry.get_cameras():
+                self.available_cameras.pop(self.current_camera_name, None)
+            self.camera_lost = False
+
         self.current_camera_name = camera_name
+        if self.quality_governor:
+            self.quality_governor.reset()
         camera_info = self.available_cameras[camera_name]
         selected_index = camera_info['index']
         logging.info(f"Setting active camera to: {camera_name} (index: {selected_index})")
 
-        self.supported_formats = self.get_supported_resolutions(selected_index)
+        self._probe_generation += 1
+        if selected_index in self._format_cache:
+            self._on_formats_probed(camera_name, self._format_cache[selected_index], self._probe_generation)
+            return
+
+        # Probing can take seconds on the fallback paths, so keep it off the UI thread
+        self.resolution_selector.text = "Probing..."
+        threading.Thread(
+            target=self._probe_formats,
+            args=(camera_name, selected_index, self._probe_generation),
+            daemon=True
+        ).start()
+
+    def _probe_formats(self, camera_name, camera_index, generation):
+        start = time.monotonic()
+        if camera_index is None:
+            formats = self.get_stand_in_formats()
+        else:
+            formats = self.get_supported_resolutions(camera_index)
+        logging.info(f"Probed {len(formats)} formats for {camera_name} in "
+                     f"{(time.monotonic() - start) * 1000:.0f}ms")
+        self._on_formats_probed(camera_name, formats, generation)
+
+    @mainthread
+    def _on_formats_probed(self, camera_name, formats, generation):
+        if generation != self._probe_generation or camera_name not in self.available_cameras:
+            logging.info(f"Discarding stale format probe for {camera_name}.")
+            return
+
+        camera_index = self.available_cameras[camera_name]['index']
+        if formats:
+            self._format_cache[camera_index] = formats
+
+        self.supported_formats = formats
         self.resolution_selector.values = [f"{w}x{h} ({f}) @ {fps}fps" for w, h, f, fps, in self.supported_formats]
 
         if self.supported_formats:
@@ -629,6 +985,53 @@ class CameraApp(App):
             self.resolution_selector.text = "Default"
             self.resolution_selector.values = []
 
+    @mainthread
+    def on_camera_added(self, camera_name, camera_info):
+        """
+        Handles a camera being plugged in, as reported by the camera registry.
+
+        If it is the camera that was active when it disappeared, the pipeline
+        is rebuilt with the previous format instead of probing it again.
+        """
+        previous_info = self.available_cameras.get(camera_name)
+        self.available_cameras[camera_name] = camera_info
+        if camera_name != self.current_camera_name or not self.camera_lost:
+            return
+
+        if previous_info and previous_info.get('card') not in (None, camera_info.get('card')):
+            # A different camera took over the device node
+            logging.info(f"{camera_name} is now a different device; probing it again.")
+            self._format_cache.pop(camera_info['index'], None)
+            self.set_active_camera(camera_name)
+        elif self.current_format:
+            logging.info(f"Active camera {camera_name} reconnected; restarting the pipeline.")
+            self.set_pipeline_format(*self.current_format, force=True)
+
+    @mainthread
+    def on_camera_removed(self, camera_name, camera_info):
+        """
+        Handles a camera being unplugged, as reported by the camera registry.
+
+        The active camera keeps its entry so that it can resume when it comes
+        back; other cameras are dropped from the list.
+        """
+        if camera_name == self.current_camera_name:
+            logging.warning(f"Active camera {camera_name} was disconnected.")
+            self.camera_lost = True
+            self._switch_generation += 1  # Cancel pending switches to the lost camera
+            threading.Thread(target=self._stop_lost_pipeline, daemon=True).start()
+            return
+
+        self.available_cameras.pop(camera_name, None)
+        self._format_cache.pop(camera_info['index'], None)
+
+    def _stop_lost_pipeline(self):
+        # Takes the lock off the UI thread, as a switch may be starting a pipeline
+        with self._pipeline_lock:
+            self._stop_starting_pipeline()
+            if self.pipeline:
+                self.pipeline.stop()
+
     def on_camera_select(self, camera_name):
         self.set_active_camera(camera_name)
 
@@ -669,35 +1072,156 @@ class CameraApp(App):
         self.current_frame_index = (self.current_frame_index + 1) % len(self.frame_files)
 
         frame_path = self.frame_files[self.current_frame_index]
-        self.birthday_frame = cv2.imread(frame_path, cv2.IMREAD_UNCHANGED)
-        self.resized_overlay = None
-
-        while not self.display_queue.empty():
-            try:
-                self.display_queue.get_nowait()
-            except queue.Empty:
-                break
+        self._show_birthday_frame(frame_path)
         logging.info(f"Changed birthday frame to: {frame_path}")
 
+    def _show_birthday_frame(self, frame_path):
+        """Switches the processor to a birthday frame, using its prepared overlay if ready."""
+        def show(image):
+            if not self.frame_files or self.frame_files[self.current_frame_index] != frame_path:
+                return  # Switched again while it was loading
+            prepared = self.assets.peek_prepared(frame_path, self.preview_size) if self.preview_size else None
+            if prepared is None:
+                logging.info(f"Birthday frame {frame_path} is not prepared yet; preparing it on first use.")
+            self.processor.set_birthday_frame(image, prepared)
+            self._clear_display_queue()
+
+        if self.preview_size:
+            self.assets.prepare(frame_path, self.preview_size)
+            # Keep the following frame ready too, in case it was evicted
+            next_path = self.frame_files[(self.current_frame_index + 1) % len(self.frame_files)]
+            self.assets.prepare(next_path, self.preview_size)
+        self._when_loaded(frame_path, show)
+
+    def _when_loaded(self, path, apply):
+        """
+        Calls `apply` with a decoded asset, or None for no path.
+
+        A loaded asset is applied straight away. On a cache miss the asset is
+        decoded in the background and applied on the UI thread once ready,
+        leaving the previous one on screen meanwhile.
+        """
+        if path is None:
+            apply(None)
+            return
+        future = self.assets.load(path)
+        if future.done():
+            self._asset_loaded(future, apply)
+        else:
+            future.add_done_callback(lambda f: mainthread(self._asset_loaded)(f, apply))
+
+    def _asset_loaded(self, future, apply):
+        if future.cancelled():
+            return  # Invalidated; on_assets_changed applies it again
+        apply(future.result() if future.exception() is None else None)
+
+    @mainthread
+    def on_assets_changed(self, directory, added, removed, changed):
+        """
+        Updates the frame, hat or background lists when files change in an
+        asset directory.
+
+        Called by the AssetWatcher. Changed assets are reloaded, and the
+        current frame, hat or background is kept where it still exists.
+        """
+        for path in removed + changed:
+            self.assets.invalidate(path)
+        files = sorted(glob.glob(os.path.join(directory, '*.png')))
+
+        if directory == 'assets/frames':
+            current = None
+            if self.frame_files and self.processor.birthday_frame is not None:
+                current = self.frame_files[self.current_frame_index]
+            self.frame_files = files
+            self.assets.preload(added + changed)
+            if self.preview_size:
+                self.assets.prepare_all(added + changed, self.preview_size)
+            if current in files:
+                self.current_frame_index = files.index(current)
+                if current in changed:
+                    self._show_birthday_frame(current)
+            elif current is not None:
+                # The current frame was removed; move on to the next one, if any
+                if files:
+                    self.current_frame_index = min(self.current_frame_index, len(files) - 1)
+                    self._show_birthday_frame(files[self.current_frame_index])
+                else:
+                    self.current_frame_index = 0
+                    self.processor.set_birthday_frame(None)
+            else:
+                self.current_frame_index = 0
+        elif directory == BACKGROUNDS_DIR:
+            current = self.background_paths[self.current_background_index]
+            self.background_paths = [None] + files
+            self.assets.preload(added + changed)
+            if current in self.background_paths:
+                self.current_background_index = self.background_paths.index(current)
+                if current in changed:
+                    self._when_loaded(current, lambda image, path=current: self._set_background(path, image))
+            else:
+                self.current_background_index = 0
+                self.processor.background = None
+        else:
+            current = self.hat_paths[self.current_hat_index]
+            self.hat_files = files
+            self.hat_paths = [None] + files
+            self.assets.preload(added + changed)
+            if current in self.hat_paths:
+                self.current_hat_index = self.hat_paths.index(current)
+                if current in changed:
+                    self._when_loaded(current, lambda image, path=current: self._set_hat(path, image))
+            else:
+                self.current_hat_index = 0
+                self.processor.hat = None
+
     def change_hat(self, *args):
-        if not self.hats:
+        if len(self.hat_paths) <= 1:
             return
 
-        self.current_hat_index = (self.current_hat_index + 1) % len(self.hats)
-        if self.hats[self.current_hat_index] is None:
+        self.current_hat_index = (self.current_hat_index + 1) % len(self.hat_paths)
+        hat_path = self.hat_paths[self.current_hat_index]
+        self._when_loaded(hat_path, lambda image: self._set_hat(hat_path, image))
+
+    def _set_hat(self, hat_path, image):
+        if self.hat_paths[self.current_hat_index] != hat_path:
+            return  # Switched again while it was loading
+        self.processor.hat = image
+        if image is None:
             logging.info("Changed to no hat.")
         else:
             logging.info(f"Changed hat to index: {self.current_hat_index}")
 
         # Clear the display queue to force a redraw with the new hat
-        while not self.display_queue.empty():
-            try:
-                self.display_queue.get_nowait()
-            except queue.Empty:
-                break
+        self._clear_display_queue()
+
+    def change_background(self, *args):
+        if len(self.background_paths) <= 1:
+            return
+
+        self.current_background_index = (self.current_background_index + 1) % len(self.background_paths)
+        background_path = self.background_paths[self.current_background_index]
+        self._when_loaded(background_path, lambda image: self._set_background(background_path, image))
+
+    def _set_background(self, background_path, image):
+        if self.background_paths[self.current_background_index] != background_path:
+            return  # Switched again while it was loading
+        self.processor.background = image
+        logging.info(f"Changed background to: {background_path or 'none'}")
+
+        # Clear the display queue to force a redraw with the new background
+        self._clear_display_queue()
+
+    def change_effect(self, *args):
+        self.current_effect_index = (self.current_effect_index + 1) % len(self.effect_names)
+        effect_name = self.effect_names[self.current_effect_index]
+        self.processor.effect = get_effect(effect_name)
+        logging.info(f"Changed effect to: {effect_name}")
+
+        # Clear the display queue to force a redraw with the new effect
+        self._clear_display_queue()
 
     def on_resolution_select(self, spinner, text):
-        if text == 'Resolution' or text == 'Default' or not self.supported_formats:
+        if text in ('Resolution', 'Default', 'Probing...') or not self.supported_formats:
             return
 
         logging.info(f"User selected resolution: {text}")
@@ -711,108 +1235,46 @@ class CameraApp(App):
 
         if selected_format:
             logging.info(f"Found matching format: {selected_format}")
+            if self.quality_governor and selected_format != self.current_format:
+                self.quality_governor.reset()  # The user's choice replaces any reduced format
             w, h, pixel_format, framerate = selected_format
             self.set_pipeline_format(w, h, pixel_format, framerate)
         else:
             logging.error(f"Could not find matching format for selection: {text}")
 
-    def _apply_overlay(self, frame):
-        output_frame = frame.copy()
-
-        # Apply birthday frame first
-        if self.birthday_frame is not None:
-            h, w, _ = frame.shape
-            if self.resized_overlay is None or self.resized_overlay.shape[:2] != (h, w):
-                logging.info(f"Creating new birthday frame cache for resolution {w}x{h}.")
-                self.resized_overlay = cv2.resize(self.birthday_frame, (w, h))
-
-            overlay_img = self.resized_overlay[:,:,:3]
-            mask = self.resized_overlay[:,:,3]
-
-            background = cv2.bitwise_and(output_frame, output_frame, mask=cv2.bitwise_not(mask))
-            foreground = cv2.bitwise_and(overlay_img, overlay_img, mask=mask)
-            output_frame = cv2.add(background, foreground)
-
-        # Apply hats on faces
-        if self.hats and not self.face_cascade.empty():
-            hat = self.hats[self.current_hat_index]
-            if hat is None:
-                return output_frame
-
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(100, 100))
-
-            if len(faces) > 0:
-                for (x, y, w, h) in faces:
-                    # Adjust hat size and position
-                    hat_w = int(w * 1.1)
-                    hat_h = int(hat.shape[0] * (hat_w / hat.shape[1]))
-
-                    hat_x = x - int((hat_w - w) / 2)
-                    hat_y = y - int(hat_h * 0.85)  # Position hat above the face
-
-                    # Resize hat
-                    try:
-                        resized_hat = cv2.resize(hat, (hat_w, hat_h))
-                    except cv2.error:
-                        continue  # Skip if resizing fails
-
-                    # Define ROI, handling boundaries
-                    frame_h, frame_w, _ = output_frame.shape
-
-                    # Top-left corner of where the hat will be placed
-                    roi_y1 = max(hat_y, 0)
-                    roi_x1 = max(hat_x, 0)
-
-                    # Bottom-right corner
-                    roi_y2 = min(hat_y + hat_h, frame_h)
-                    roi_x2 = min(hat_x + hat_w, frame_w)
-
-                    # Calculate the part of the hat that is visible
-                    hat_roi_y1 = max(0, -hat_y)
-                    hat_roi_x1 = max(0, -hat_x)
-
-                    hat_roi_y2 = hat_roi_y1 + (roi_y2 - roi_y1)
-                    hat_roi_x2 = hat_roi_x1 + (roi_x2 - roi_x1)
-
-                    if (hat_roi_y2 - hat_roi_y1) <= 0 or (hat_roi_x2 - hat_roi_x1) <= 0:
-                        continue
-
-                    hat_part = resized_hat[hat_roi_y1:hat_roi_y2, hat_roi_x1:hat_roi_x2]
-
-                    # ROI on the main frame
-                    roi = output_frame[roi_y1:roi_y2, roi_x1:roi_x2]
-
-                    if roi.shape[:2] != hat_part.shape[:2]:
-                        continue
-
-                    # Create mask and inverse mask
-                    hat_alpha = hat_part[:, :, 3]
-                    hat_rgb = hat_part[:, :, :3]
-
-                    # Black-out the area of hat in ROI
-                    roi_bg = cv2.bitwise_and(roi, roi, mask=cv2.bitwise_not(hat_alpha))
-
-                    # Take only region of hat from hat image.
-                    hat_fg = cv2.bitwise_and(hat_rgb, hat_rgb, mask=hat_alpha)
-
-                    # Put hat in ROI and modify the main image
-                    dst = cv2.add(roi_bg, hat_fg)
-                    output_frame[roi_y1:roi_y2, roi_x1:roi_x2] = dst
-
-        return output_frame
-
     def update(self, dt):
         try:
-            frame = self.display_queue.get_nowait()
+            frame, stamps = self.display_queue.get_nowait()
             while not self.display_queue.empty():
                 try:
-                    frame = self.display_queue.get_nowait()
+                    superseded = stamps
+                    frame, stamps = self.display_queue.get_nowait()
+                    self._release_slot(superseded)
+                    metrics.inc('dropped_update')  # Superseded before it was shown
                 except queue.Empty:
                     break
         except queue.Empty:
             return
 
+        if self._slide_event:
+            self._release_slot(stamps)
+            return  # The attract slideshow is showing
+
+        start = time.perf_counter()
+        metrics.observe('display_wait', time.monotonic() - stamps['t_processed'])
+        self._show_frame(frame)
+        self._release_slot(stamps)  # The texture has its own copy
+        metrics.observe('upload', time.perf_counter() - start)
+        metrics.inc('frames_displayed')
+
+        if stamps['capture_delay'] is not None:
+            metrics.observe('glass_to_glass', stamps['capture_delay'] + time.monotonic() - stamps['t_appsink'])
+
+    def _show_frame(self, frame):
+        """Shows a BGR frame in the camera view."""
+        if self.frame_pool is not None:
+            self._upload_frame(frame)
+            return
         frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         buf = cv2.flip(frame_rgb, 0).tobytes()
 
@@ -822,11 +1284,139 @@ class CameraApp(App):
         image_texture.blit_buffer(buf, colorfmt='rgb', bufferfmt='ubyte')
         self.camera_view.texture = image_texture
 
+    def _upload_frame(self, frame):
+        """
+        Shows a BGR frame by uploading it into a texture that is reused while
+        the frame size stays the same, instead of creating one per frame.
+        """
+        h, w = frame.shape[:2]
+        texture = self._preview_texture
+        if texture is None or texture.size != (w, h):
+            texture = self._preview_texture = Texture.create(size=(w, h), colorfmt='rgb')
+            texture.flip_vertical()  # Instead of flipping every frame
+            self._preview_rgb = np.empty((h, w, 3), dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._preview_rgb)
+        texture.blit_buffer(self._preview_rgb.reshape(-1), colorfmt='rgb', bufferfmt='ubyte')
+        if self.camera_view.texture is texture:
+            self.camera_view.canvas.ask_update()
+        else:
+            self.camera_view.texture = texture
+
+    def _on_any_touch(self, window, touch):
+        self.idle_monitor.note_activity('touch')
+        return False  # Let the widgets handle it
+
+    @mainthread
+    def on_idle_changed(self, idle):
+        """
+        Switches the camera to a small, slow format and starts the attract
+        slideshow as the booth goes idle, and undoes both when it wakes.
+        """
+        if idle:
+            self._set_idle_format()
+            if IDLE_SLIDESHOW:
+                self._slide_event = Clock.schedule_interval(self._next_slide, IDLE_SLIDE_SECONDS)
+                self._next_slide(0)
+            return
+        if self._idle_formats:
+            camera_format, awake_format = self._idle_formats
+            self._idle_formats = None
+            # Unless the user or a camera change picked another format meanwhile
+            if self.current_format == camera_format and self.current_camera_name in self.available_cameras:
+                logging.info(f"Restoring camera format {awake_format} after idle mode.")
+                self.set_pipeline_format(*awake_format)
+        if self._slide_event:
+            self._slide_event.cancel()
+            self._slide_event = None
+
+    def _set_idle_format(self):
+        """Switches the camera to its idle format, if it has a smaller or slower one."""
+        if self.current_format is None or self.current_camera_name not in self.available_cameras:
+            return
+        camera_format = idle_format(self.supported_formats, self.current_format)
+        if camera_format is None:
+            return
+        logging.info(f"Switching the camera to {camera_format} while idle.")
+        self._idle_formats = (camera_format, self.current_format)
+        self.set_pipeline_format(*camera_format)
+
+    def _next_slide(self, dt):
+        self._slide_index += 1
+        # Listing and decoding the photos happens off the UI thread
+        threading.Thread(target=self._load_slide, args=(self._slide_index,), daemon=True).start()
+
+    def _load_slide(self, index):
+        photos = recent_photos()
+        if not photos:
+            return
+        path = photos[index % len(photos)]
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            logging.warning(f"Failed to load slideshow photo {path}")
+            return
+        if self.preview_size:
+            # No larger than the preview, so uploading it costs no more than a frame
+            w, h = self.preview_size
+            scale = min(w / image.shape[1], h / image.shape[0], 1.0)
+            image = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)),
+                               interpolation=cv2.INTER_AREA)
+        self._show_slide(image)
+
+    @mainthread
+    def _show_slide(self, image):
+        if self._slide_event:
+            self._show_frame(image)
+
+    def report_latency(self, dt):
+        """
+        Logs the latency distribution of each segment of the camera-to-display path.
+        """
+        stages = metrics.snapshot()['stages']
+        logging.info(f"Latency over the last {LATENCY_WINDOW} frames (display mode: {DISPLAY_MODE}):")
+        for stage in LATENCY_STAGES:
+            summary = stages.get(stage)
+            if summary:
+                logging.info(f"  {stage:<18} p50 {summary['p50_ms']:6.1f}ms  p95 {summary['p95_ms']:6.1f}ms  "
+                             f"p99 {summary['p99_ms']:6.1f}ms  mean {summary['mean_ms']:6.1f}ms")
+
+        samples = metrics.samples('glass_to_glass')
+        if samples:
+            counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            for seconds in samples:
+                bucket = 0
+                while bucket < len(LATENCY_BUCKETS_MS) and seconds * 1000 > LATENCY_BUCKETS_MS[bucket]:
+                    bucket += 1
+                counts[bucket] += 1
+            labels = [f"<={ms}ms" for ms in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+            logging.info("  glass_to_glass histogram: " + ", ".join(
+                f"{label} {count * 100 / len(samples):.0f}%" for label, count in zip(labels, counts) if count
+            ))
+
+    def update_hud(self, dt):
+        """Refreshes the performance overlay from the current metrics."""
+        snapshot = metrics.snapshot()
+        counters = snapshot['counters']
+        displayed = counters.get('frames_displayed', 0)
+        fps = (displayed - self._hud_last_displayed) / dt if dt else 0
+        self._hud_last_displayed = displayed
+
+        lines = [f"display {fps:.1f} fps"]
+        if self.quality_governor:
+            lines.append(f"quality: {self.quality_governor.level_name()}")
+        drops = [f"{name[len('dropped_'):]} {value}" for name, value in sorted(counters.items())
+                 if name.startswith('dropped_')]
+        lines.append("drops: " + (", ".join(drops) if drops else "none"))
+        for stage, summary in sorted(snapshot['stages'].items()):
+            lines.append(f"{stage}: p50 {summary['p50_ms']:.1f}ms  p95 {summary['p95_ms']:.1f}ms")
+        self.hud_label.text = "\n".join(lines)
+
     def do_flash(self):
         self.flash.opacity = 1
         Animation(opacity=0, duration=0.2).start(self.flash)
 
     def capture_photo(self, *args):
+        if self.idle_monitor:
+            self.idle_monitor.note_activity('capture')
         if self.countdown_active:
             return
 
@@ -842,35 +1432,292 @@ class CameraApp(App):
             self.countdown_label.text = str(self.countdown_number)
         else:
             self.countdown_label.text = ""
-            self._take_and_save_photo()
-            self.countdown_active = False
-            self.capture_button.disabled = False
+            if CAPTURE_MODE == 'single':
+                if self.shot_ring is not None and BEST_SHOT_LOOKAHEAD > 0:
+                    # Let a few frames after the shutter into the ring before picking
+                    Clock.schedule_once(self._take_single_photo, BEST_SHOT_LOOKAHEAD)
+                else:
+                    self._take_single_photo()
+            elif CAPTURE_MODE == 'clip':
+                self._start_clip()
+            else:
+                self._start_burst()
             return False
 
-    def _take_and_save_photo(self, *args):
+    def _start_clip(self):
+        """Starts recording a clip from the processed frames."""
+        os.makedirs("photos", exist_ok=True)
+        now = datetime.now()
+        filename = (f"photos/clip_{now.strftime('%Y%m%d_%H%M%S')}"
+                    f"{clip_recorder.clip_extension(clip_recorder.CLIP_FORMAT)}")
+        recorder = clip_recorder.ClipRecorder(filename, on_done=self._on_clip_done)
+        recorder.start()
+        self.clip_recorder = recorder
+        self.countdown_label.text = "REC"
+        Clock.schedule_once(self._stop_clip, clip_recorder.CLIP_SECONDS)
+
+    def _stop_clip(self, dt):
+        if self.clip_recorder:
+            self.clip_recorder.stop()
+            self.clip_recorder = None
+        self.countdown_label.text = ""
+        self._end_capture()
+
+    def _on_clip_done(self, filename):
+        """Called on the recorder thread once the clip file is complete."""
+        if filename and PHOTOBOOTH_URL:
+            self.photo_writer.submit(self._upload_photo, filename)
+
+    def _take_single_photo(self, *args):
+        self._take_and_save_photo()
+        self._end_capture()
+
+    def _end_capture(self):
+        self.countdown_active = False
+        self.capture_button.disabled = False
+
+    def _start_burst(self):
+        """Takes the first burst shot now and schedules the rest."""
+        self._burst = {'shots': [], 'times': [], 'misses': 0, 'stamp': datetime.now().strftime('%Y%m%d_%H%M%S')}
+        if self._take_burst_shot() is not False:
+            Clock.schedule_interval(self._take_burst_shot, BURST_INTERVAL)
+
+    def _take_burst_shot(self, *args):
+        """
+        Grabs the current frame for the burst.
+
+        This only keeps references to frames the worker has already made, so
+        the preview keeps running; encoding happens on the photo writer.
+
+        Returns:
+            bool: False once the burst is over, which also unschedules it.
+        """
+        burst = self._burst
+        if burst is None:
+            return False
+        shot = self._capture_shot()
+        if shot is None:
+            burst['misses'] += 1
+            if burst['misses'] >= BURST_MAX_MISSES:
+                logging.error(f"No frame for {burst['misses']} burst shots; ending the burst.")
+                self._finish_burst()
+                return False
+            return None
+        now = time.monotonic()
+        if burst['times']:
+            interval = now - burst['times'][-1]
+            metrics.observe('burst_interval', interval)
+            if abs(interval - BURST_INTERVAL) > 0.1:
+                logging.warning(f"Burst shot {len(burst['times']) + 1} came {interval:.3f}s after the last, "
+                                f"target {BURST_INTERVAL}s.")
+        burst['times'].append(now)
+        burst['shots'].append(shot)
+        self.do_flash()
+
+        index = len(burst['shots'])
+        filename = f"photos/photo_{burst['stamp']}_{index}{photo_output.photo_extension(PHOTO_FORMAT)}"
+        self.photo_writer.submit(self._save_shot, shot, filename)
+        self.countdown_label.text = f"{index}/{BURST_COUNT}" if index < BURST_COUNT else ""
+
+        if index >= BURST_COUNT:
+            self._finish_burst()
+            return False
+        return None
+
+    def _finish_burst(self):
+        burst, self._burst = self._burst, None
+        if burst['shots']:
+            self.photo_writer.submit(self._save_strip, burst['shots'], burst['stamp'])
+        else:
+            logging.error("The burst has no shots; no strip is saved.")
+        self.countdown_label.text = ""
+        self._end_capture()
+
+    def _get_camera_jpeg(self):
+        """Returns the newest unmodified camera JPEG, or None if there is none."""
+        pipeline = self.pipeline
+        if pipeline is None:
+            return None
+        if pipeline.decoder_mode == 'libjpeg':
+            return self.latest_jpeg
+        return pipeline.get_latest_jpeg()
+
+    def _capture_shot(self):
+        """
+        Grabs everything needed to save the current frame, without encoding it.
+
+        Returns:
+            dict: The shot, or None if there is no frame yet.
+        """
         if self.latest_processed_frame is None:
             logging.error("No frame available to take a photo.")
+            return None
+
+        # With a frame pool, the frames are copied out before their slots can be reused
+        with self.frame_pool.lock if self.frame_pool else nullcontext():
+            processed, jpeg = self.latest_processed_frame, self.latest_jpeg
+            raw_frame, faces = self.latest_raw or (None, None)
+            latest = True
+            if self.shot_ring is not None:
+                candidates = list(self.shot_ring.copy())
+                best = pick_best_shot(candidates)
+                if best is not None:
+                    latest = best is candidates[-1]
+                    processed, jpeg = best['processed'], best['jpeg']
+                    raw_frame, faces = best['raw'] or (None, None)
+                    logging.info(f"Picked frame {candidates.index(best) + 1} of {len(candidates)} "
+                                 f"(sharpness {best['sharpness']:.0f}, faces {best['face_count']}).")
+            if self.frame_pool:
+                processed = processed.copy()
+                raw_frame = None if raw_frame is None else raw_frame.copy()
+
+        camera_jpeg = None
+        if PHOTO_FORMAT == 'jpeg' and not self.processor.overlay_active():
+            # Nothing to composite, so keep the camera's own JPEG untouched
+            if latest:
+                camera_jpeg = self._get_camera_jpeg()
+            elif self.pipeline and self.pipeline.decoder_mode == 'libjpeg':
+                # Only the libjpeg path keeps the JPEG of every frame
+                camera_jpeg = jpeg
+
+        frame_asset = None
+        if self.frame_files and self.processor.birthday_frame is not None:
+            frame_asset = self.frame_files[self.current_frame_index]
+        return {
+            'processed': processed,
+            'jpeg': jpeg,
+            'camera_jpeg': camera_jpeg,
+            'raw_frame': raw_frame,
+            'faces': faces,
+            'birthday_frame': self.processor.birthday_frame,
+            'hat': self.processor.hat,
+            'effect': self.processor.effect,
+            'background': self.processor.background if self.processor.keying_active() else None,
+            'frame_asset': frame_asset,
+            'hat_asset': self.hat_paths[self.current_hat_index],
+            'background_asset': self.background_paths[self.current_background_index],
+        }
+
+    def _take_and_save_photo(self, *args):
+        shot = self._capture_shot()
+        if shot is None:
             return
+        self.do_flash()
+        now = datetime.now()
+        filename = f"photos/photo_{now.strftime('%Y%m%d_%H%M%S')}{photo_output.photo_extension(PHOTO_FORMAT)}"
+        self.photo_writer.submit(self._save_shot, shot, filename)
 
-        if not os.path.exists("photos"):
-            os.makedirs("photos")
+    def _capture_processor_for(self, shot):
+        """
+        Returns the photo writer's own FrameProcessor, set up with the frame,
+        hat, effect and background in force when a shot was taken.
 
-        frame_with_overlay = self.latest_processed_frame
+        Full-size captures never go through the preview's processor, so its
+        prepared overlay, face tracking and chroma key smoothing are only
+        used by the frame processing thread.
+        """
+        processor = self.capture_processor
+        if processor is None:
+            processor = self.capture_processor = FrameProcessor(create_detector(self.processor.detector.name))
+            if processor.chroma_keyer is not None:
+                processor.chroma_keyer = ChromaKeyer(smoothing=0)  # Each capture is keyed on its own
+        processor.set_birthday_frame(shot['birthday_frame'])
+        processor.hat = shot['hat']
+        processor.effect = shot['effect']
+        processor.background = shot['background']
+        return processor
+
+    def _save_shot(self, shot, filename):
+        """Encodes and saves a shot, then uploads it. Runs on the photo writer."""
+        os.makedirs("photos", exist_ok=True)
+
+        camera_jpeg = shot['camera_jpeg']
+        raw_frame, raw_faces = shot['raw_frame'], shot['faces']
+        raw_jpeg = camera_jpeg
+        frame_with_overlay = None
+        if camera_jpeg is None:
+            frame_with_overlay = shot['processed']
+            if PREVIEW_SCALE > 1 and shot['jpeg'] is not None:
+                # The preview was decoded at reduced size; decode the capture in full
+                full_frame = cv2.imdecode(shot['jpeg'], cv2.IMREAD_COLOR)
+                if full_frame is not None:
+                    frame_with_overlay, raw_faces = self._capture_processor_for(shot).process(full_frame)
+                    raw_frame, raw_jpeg = full_frame, shot['jpeg']
+
+        start = time.perf_counter()
+        if not photo_output.save_photo(filename, PHOTO_FORMAT, PHOTO_QUALITY,
+                                       frame=frame_with_overlay, camera_jpeg=camera_jpeg):
+            return
+        metrics.observe('photo_save', time.perf_counter() - start)
 
-        now = datetime.now()
-        filename = f"photos/photo_{now.strftime('%Y%m%d_%H%M%S')}.png"
-        cv2.imwrite(filename, frame_with_overlay)
-        logging.info(f"Photo saved as {filename}")
-        self.do_flash()
+        if SAVE_RAW:
+            self._save_raw_capture(filename, shot, raw_frame, raw_jpeg, raw_faces)
 
         if PHOTOBOOTH_URL:
             logging.info("Uploading photo to server")
             self._upload_photo(filename)
 
+    def _save_strip(self, shots, stamp):
+        """Composes burst shots into a strip or grid and saves it. Runs on the photo writer."""
+        os.makedirs("photos", exist_ok=True)
+        start = time.perf_counter()
+        cells = []
+        for shot in shots:
+            cell = shot['raw_frame']
+            background, effect = shot['background'], shot['effect']
+            has_hats = shot['hat'] is not None and shot['faces'] is not None and len(shot['faces']) > 0
+            if cell is None:
+                cell = shot['processed']
+            elif background is not None or effect is not None or has_hats:
+                # The writer's own processor; the preview's keyer is in use on the worker thread
+                processor = self._capture_processor_for(shot)
+                if background is not None:
+                    cell = processor.chroma_keyer.apply(cell, background, temporal=False)
+                if effect is not None:
+                    cell = effect.apply(cell)
+                elif background is None:
+                    cell = cell.copy()
+                if has_hats:
+                    processor.apply_hats(cell, shot['faces'], shot['hat'])
+            cells.append(cell)
+        strip = photo_strip.compose_strip(cells, CAPTURE_MODE, decoration=shots[-1]['birthday_frame'])
+        metrics.observe('strip_composite', time.perf_counter() - start)
+        logging.info(f"Composed a {len(cells)}-shot {CAPTURE_MODE} in {(time.perf_counter() - start) * 1000:.1f}ms.")
+
+        filename = f"photos/photo_{stamp}_{CAPTURE_MODE}{photo_output.photo_extension(PHOTO_FORMAT)}"
+        if not photo_output.save_photo(filename, PHOTO_FORMAT, PHOTO_QUALITY, frame=strip):
+            return
+        if PHOTOBOOTH_URL:
+            logging.info("Uploading photo strip to server")
+            self._upload_photo(filename)
+
+    def _save_raw_capture(self, filename, shot, raw_frame, raw_jpeg, faces):
+        """
+        Keeps the unprocessed frame and overlay parameters behind a photo.
+
+        Faces are detected here if the preview skipped detection (no hat), so
+        that a hat can still be added when the photo is re-rendered.
+        """
+        if raw_frame is None and raw_jpeg is None:
+            logging.warning("No raw frame available to keep with the photo.")
+            return
+        if faces is None:
+            if raw_jpeg is not None and (raw_frame is None or PREVIEW_SCALE > 1):
+                # The face boxes must match the stored image, which is the full-size JPEG
+                raw_frame = cv2.imdecode(np.frombuffer(raw_jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            faces = self._capture_processor_for(shot).detect_faces(raw_frame) if raw_frame is not None else ()
+
+        photo_output.save_raw_capture(
+            filename, shot['frame_asset'], shot['hat_asset'], faces,
+            raw_frame=raw_frame, raw_jpeg=raw_jpeg,
+            effect=shot['effect'].name if shot['effect'] is not None else None,
+            background_asset=shot['background_asset'] if shot['background'] is not None else None
+        )
+
     def _upload_photo(self, filename):
         try:
             with open(filename, 'rb') as f:
-                files = {'file': (os.path.basename(filename), f, 'image/png')}
+                files = {'file': (os.path.basename(filename), f, photo_output.mime_type(filename))}
                 response = requests.post(PHOTOBOOTH_URL, files=files)
                 if response.status_code == 201:
                     logging.info(f"Photo uploaded successfully: {response.json()}")
@@ -884,14 +1731,49 @@ class CameraApp(App):
         if hasattr(self, 'voice_listener') and self.voice_listener:
             self.voice_listener.stop()
 
+        if self.quality_governor:
+            self.quality_governor.stop()
+
         if self.frame_processor_worker:
             self.frame_processor_worker.stop()
             self.frame_processor_worker.join()
             logging.info("Frame processor worker stopped.")
 
-        if self.pipeline:
-            self.pipeline.set_state(Gst.State.NULL)
-            logging.info("GStreamer pipeline state set to NULL.")
+        if self.process_pool:
+            self.process_pool.close()
+
+        self._switch_generation += 1  # Cancel pending pipeline switches
+        with self._pipeline_lock:
+            self._stop_starting_pipeline()
+            if self.pipeline:
+                self.pipeline.stop()
+                logging.info("GStreamer pipeline state set to NULL.")
+
+        if self.camera_registry:
+            self.camera_registry.stop()
+
+        if self.clip_recorder:
+            self.clip_recorder.stop()
+
+        if self.photo_writer:
+            # Finishes the photos still being saved
+            self.photo_writer.stop()
+            self.photo_writer.join()
+
+        if self.memory_reporter:
+            self.memory_reporter.stop()
+
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+            try:
+                metrics.write(METRICS_FILE)
+            except OSError as e:
+                logging.error(f"Failed to write metrics to {METRICS_FILE}: {e}")
+
+        if self.asset_watcher:
+            self.asset_watcher.stop()
+
+        self.assets.shutdown()
 
         if self.glib_worker:
             self.glib_worker.stop()
@@ -900,11 +1782,20 @@ class CameraApp(App):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="A Kivy-based camera app.")
-    parser.add_argument('--device', help='The v4l device path to use (e.g., /dev/video0)')
+    parser.add_argument('--device',
+                        help='The v4l device path to use (e.g., /dev/video0), or instead of a camera: '
+                             'videotestsrc[:PATTERN], a video file or an image sequence such as frames/%%05d.jpg')
+    parser.add_argument('--pacing', choices=['realtime', 'fast'], default=SOURCE_PACING,
+                        help='Play a --device that is not a camera in real time, or as fast as frames are processed')
     args = parser.parse_args()
     device_path = args.device
     device_index = None
-    if device_path:
+    source = None
+    if device_path and source_kind(device_path) != 'v4l2':
+        if source_kind(device_path) == 'file' and not os.path.exists(device_path):
+            parser.error(f"No such video file: {device_path}")
+        source = device_path
+    elif device_path:
         match = re.search(r'\d+$', device_path)
         if match:
             device_index = int(match.group(0))
@@ -912,7 +1803,7 @@ if __name__ == '__main__':
             logging.warning(f"Could not extract a numeric index from device path: '{device_path}'. "
                             "The application will use the default camera.")
 
-    app = CameraApp(device=device_index, resolution=RESOLUTION)
+    app = CameraApp(device=device_index, resolution=RESOLUTION, source=source, pacing=args.pacing)
     try:
         app.run()
     except KeyboardInterrupt:
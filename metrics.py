@@ -0,0 +1,168 @@
+"""
+Runtime metrics for the photobooth pipeline.
+
+A single module-level `metrics` instance collects counters (e.g. frames
+dropped at each queue), gauges and per-stage timings from every thread.
+Timings keep a sliding window of recent samples for percentiles.
+
+`MetricsExporter` periodically writes a snapshot to a file, as JSON or, for
+paths ending in ".prom", in the Prometheus text exposition format (suitable
+for the node_exporter textfile collector).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_WINDOW = 300  # Timing samples kept per stage
+
+
+def _percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Metrics:
+    """Thread-safe counters, gauges and stage timing windows."""
+    def __init__(self, window=DEFAULT_WINDOW):
+        """
+        Initializes the Metrics.
+
+        Args:
+            window (int): Number of recent samples kept per timing.
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._totals = {}  # stage -> [count, seconds] since start, for Prometheus
+        self.start_time = time.time()
+
+    def inc(self, name, amount=1):
+        """Increments a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        """Sets a gauge to its current value."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, stage, seconds):
+        """Records one timing sample for a stage, in seconds."""
+        with self._lock:
+            timings = self._timings.get(stage)
+            if timings is None:
+                timings = self._timings[stage] = deque(maxlen=self.window)
+                self._totals[stage] = [0, 0.0]
+            timings.append(seconds)
+            totals = self._totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def samples(self, stage):
+        """Returns a copy of the recent timing samples for a stage, in seconds."""
+        with self._lock:
+            return list(self._timings.get(stage, ()))
+
+    def counter(self, name):
+        """Returns the current value of a counter."""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """
+        Returns the current metrics as a dictionary.
+
+        Stage timings are summarised as count, mean, p50, p95 and p99 in
+        milliseconds over the recent window, plus the number of samples and
+        their total seconds since start.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {stage: sorted(values) for stage, values in self._timings.items() if values}
+            totals = {stage: tuple(total) for stage, total in self._totals.items()}
+
+        stages = {}
+        for stage, values in timings.items():
+            stages[stage] = {
+                'count': len(values),
+                'mean_ms': sum(values) / len(values) * 1000,
+                'p50_ms': _percentile(values, 0.50) * 1000,
+                'p95_ms': _percentile(values, 0.95) * 1000,
+                'p99_ms': _percentile(values, 0.99) * 1000,
+                'total_count': totals[stage][0],
+                'total_seconds': totals[stage][1],
+            }
+        return {
+            'timestamp': time.time(),
+            'uptime_s': time.time() - self.start_time,
+            'counters': counters,
+            'gauges': gauges,
+            'stages': stages,
+        }
+
+    def to_prometheus(self, snapshot=None):
+        """Formats a snapshot in the Prometheus text exposition format."""
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE photobooth_{name}_total counter")
+            lines.append(f"photobooth_{name}_total {value}")
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"# TYPE photobooth_{name} gauge")
+            lines.append(f"photobooth_{name} {value}")
+        if snapshot['stages']:
+            lines.append("# TYPE photobooth_stage_seconds summary")
+        for stage, summary in sorted(snapshot['stages'].items()):
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'photobooth_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                             f'{summary[key] / 1000:.6f}')
+            # Cumulative, so that rate(_sum) / rate(_count) gives the mean
+            lines.append(f'photobooth_stage_seconds_sum{{stage="{stage}"}} {summary["total_seconds"]:.6f}')
+            lines.append(f'photobooth_stage_seconds_count{{stage="{stage}"}} {summary["total_count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes a snapshot to a file, replacing it atomically.
+
+        Paths ending in ".prom" get the Prometheus text format, anything else JSON.
+        """
+        snapshot = self.snapshot()
+        if path.endswith('.prom'):
+            content = self.to_prometheus(snapshot)
+        else:
+            content = json.dumps(snapshot, indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+class MetricsExporter(threading.Thread):
+    """A worker thread that periodically writes the metrics to a file."""
+    def __init__(self, metrics, path, interval=10.0, **kwargs):
+        super(MetricsExporter, self).__init__(daemon=True, **kwargs)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        logging.info(f"Writing metrics to {self.path} every {self.interval}s.")
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.metrics.write(self.path)
+            except OSError as e:
+                logging.error(f"Failed to write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+metrics = Metrics()
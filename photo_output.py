@@ -0,0 +1,253 @@
+"""
+Encoding and saving of captured photos.
+
+Photos can be written as JPEG, WebP or PNG. JPEG and WebP are encoded with
+OpenCV's bundled libjpeg-turbo and libwebp at a configurable quality. When a
+JPEG from the camera is supplied, it is written as-is without decoding or
+re-encoding. Every save is timed and sized so operators can compare formats.
+`PhotoWriter` runs saves on a background thread so capture never waits on
+encoding.
+
+Captures can also keep their raw camera frame next to a JSON sidecar that
+records the overlay used (frame asset, hat asset and face boxes), so that
+`rerender.py` can composite them again later with different assets.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+RAW_DIR = 'photos/raw'
+
+# Photo format -> (file extension, MIME type)
+PHOTO_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    'png': ('.png', 'image/png'),
+}
+
+MIME_TYPES = {extension: mime for extension, mime in PHOTO_FORMATS.values()}
+# Animated clips from clip_recorder are uploaded the same way
+MIME_TYPES.update({'.gif': 'image/gif', '.mp4': 'video/mp4'})
+
+
+def photo_extension(photo_format):
+    """Returns the file extension for a photo format, e.g. ".jpg"."""
+    return PHOTO_FORMATS[photo_format][0]
+
+
+def mime_type(filename):
+    """Returns the MIME type for a photo filename, based on its extension."""
+    for extension, mime in MIME_TYPES.items():
+        if filename.lower().endswith(extension):
+            return mime
+    return 'application/octet-stream'
+
+
+def encode_photo(frame, photo_format, quality):
+    """
+    Encodes a BGR frame.
+
+    Args:
+        frame (numpy.ndarray): The BGR image.
+        photo_format (str): "jpeg", "webp" or "png".
+        quality (int): 1-100 for JPEG and WebP; ignored for PNG.
+
+    Returns:
+        bytes: The encoded image, or None if encoding failed.
+    """
+    extension = photo_extension(photo_format)
+    if photo_format == 'jpeg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif photo_format == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = []
+    success, encoded = cv2.imencode(extension, frame, params)
+    if not success:
+        logging.error(f"Failed to encode photo as {photo_format}.")
+        return None
+    return encoded.tobytes()
+
+
+class PhotoStats:
+    """Keeps running totals of photo sizes and save times per format."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def add(self, photo_format, size, elapsed):
+        """
+        Records one saved photo and logs the running average for its format.
+
+        Args:
+            photo_format (str): The format label, e.g. "jpeg" or "jpeg-passthrough".
+            size (int): File size in bytes.
+            elapsed (float): Seconds spent encoding and writing.
+        """
+        with self._lock:
+            count, total_size, total_time = self._totals.get(photo_format, (0, 0, 0.0))
+            count, total_size, total_time = count + 1, total_size + size, total_time + elapsed
+            self._totals[photo_format] = (count, total_size, total_time)
+        logging.info(f"{photo_format} photos: {count} saved, average {total_size / count / 1024:.0f}KB, "
+                     f"average save time {total_time / count * 1000:.1f}ms")
+
+    def summary(self):
+        """Returns {format: {'count', 'avg_bytes', 'avg_save_ms'}}."""
+        with self._lock:
+            return {
+                photo_format: {
+                    'count': count,
+                    'avg_bytes': total_size / count,
+                    'avg_save_ms': total_time / count * 1000,
+                }
+                for photo_format, (count, total_size, total_time) in self._totals.items()
+            }
+
+
+stats = PhotoStats()
+
+
+class PhotoWriter(threading.Thread):
+    """
+    A worker thread that runs photo encoding and saving jobs in order.
+
+    Jobs still queued when the writer is stopped are finished before it exits.
+    """
+    def __init__(self, **kwargs):
+        super(PhotoWriter, self).__init__(daemon=True, **kwargs)
+        self.jobs = queue.Queue()
+        self.stop_event = threading.Event()
+
+    def submit(self, job, *args):
+        """Queues `job(*args)` to run on the writer thread."""
+        self.jobs.put((job, args))
+
+    def run(self):
+        logging.info("Photo writer started.")
+        while not (self.stop_event.is_set() and self.jobs.empty()):
+            try:
+                job, args = self.jobs.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                job(*args)
+            except Exception:
+                logging.exception("Photo job failed.")
+        logging.info("Photo writer stopped.")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def save_photo(filename, photo_format, quality, frame=None, camera_jpeg=None):
+    """
+    Writes a photo to disk and records its size and save time.
+
+    Args:
+        filename (str): Output path, including the extension.
+        photo_format (str): "jpeg", "webp" or "png".
+        quality (int): Encoder quality for JPEG and WebP.
+        frame (numpy.ndarray): The BGR image to encode.
+        camera_jpeg (bytes-like): A JPEG from the camera to write unchanged
+            instead of encoding `frame`.
+
+    Returns:
+        bool: True if the photo was written.
+    """
+    start = time.perf_counter()
+    if camera_jpeg is not None:
+        data = camera_jpeg
+        label = 'jpeg-passthrough'
+    else:
+        data = encode_photo(frame, photo_format, quality)
+        label = photo_format
+        if data is None:
+            return False
+
+    try:
+        with open(filename, 'wb') as f:
+            f.write(data)
+    except OSError as e:
+        logging.error(f"Failed to write photo {filename}: {e}")
+        return False
+
+    elapsed = time.perf_counter() - start
+    size = len(data)
+    logging.info(f"Photo saved as {filename} ({label}, {size / 1024:.0f}KB, {elapsed * 1000:.1f}ms)")
+    stats.add(label, size, elapsed)
+    return True
+
+
+def save_raw_capture(photo_filename, frame_asset, hat_asset, faces, raw_frame=None, raw_jpeg=None, effect=None,
+                     background_asset=None):
+    """
+    Saves the unprocessed frame behind a photo together with its overlay parameters.
+
+    The raw frame goes to `RAW_DIR` under the photo's name, as the camera's
+    JPEG when one is given or as a lossless PNG otherwise, next to a JSON
+    sidecar.
+
+    Args:
+        photo_filename (str): The composited photo this belongs to.
+        frame_asset (str): Path of the birthday frame used, or None.
+        hat_asset (str): Path of the hat used, or None.
+        faces: The (x, y, w, h) face boxes in raw frame coordinates.
+        raw_frame (numpy.ndarray): The raw BGR frame.
+        raw_jpeg (bytes-like): The camera's JPEG of the raw frame.
+        effect (str): Name of the colour effect used, or None.
+        background_asset (str): Path of the green screen background used, or None.
+
+    Returns:
+        str: The sidecar path, or None if saving failed.
+    """
+    os.makedirs(RAW_DIR, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(photo_filename))[0]
+    if raw_jpeg is not None:
+        raw_path = os.path.join(RAW_DIR, f"{stem}.jpg")
+        data = raw_jpeg
+    else:
+        raw_path = os.path.join(RAW_DIR, f"{stem}.png")
+        # Lossless, since re-rendering starts from this copy
+        data = encode_photo(raw_frame, 'png', 0)
+        if data is None:
+            return None
+
+    sidecar = {
+        'photo': photo_filename,
+        'raw': os.path.basename(raw_path),
+        'frame_asset': frame_asset,
+        'hat_asset': hat_asset,
+        'effect': effect,
+        'background_asset': background_asset,
+        'faces': [[int(v) for v in face] for face in faces],
+    }
+    sidecar_path = os.path.join(RAW_DIR, f"{stem}.json")
+    try:
+        with open(raw_path, 'wb') as f:
+            f.write(data)
+        with open(sidecar_path, 'w') as f:
+            json.dump(sidecar, f, indent=2)
+    except OSError as e:
+        logging.error(f"Failed to save raw capture for {photo_filename}: {e}")
+        return None
+    logging.info(f"Raw capture saved as {raw_path}")
+    return sidecar_path
+
+
+def load_raw_capture(sidecar_path):
+    """
+    Loads a raw capture saved by `save_raw_capture`.
+
+    Returns:
+        tuple: (raw_frame, sidecar), or (None, sidecar) if the raw frame
+               could not be read.
+    """
+    with open(sidecar_path) as f:
+        sidecar = json.load(f)
+    raw_path = os.path.join(os.path.dirname(sidecar_path), sidecar['raw'])
+    return cv2.imread(raw_path, cv2.IMREAD_COLOR), sidecar
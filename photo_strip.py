@@ -0,0 +1,67 @@
+"""
+Composition of burst shots into a photo strip or grid.
+
+The shots are scaled into equal cells on a white card, and the birthday
+frame, if any, is drawn over each cell, fitted to it as it is to the
+preview, so a landscape frame is not stretched over a tall strip.
+"""
+import math
+
+import cv2
+import numpy as np
+
+STRIP_CELL_WIDTH = 800  # Pixel width of each shot on the card
+STRIP_MARGIN = 40       # Pixels around and between the shots
+
+
+def layout_size(count, layout):
+    """
+    Returns the (columns, rows) used for a number of shots.
+
+    Args:
+        count (int): The number of shots.
+        layout (str): "strip" for a single column, "grid" for a near-square grid.
+    """
+    if layout == 'grid':
+        columns = math.ceil(math.sqrt(count))
+        return columns, math.ceil(count / columns)
+    return 1, count
+
+
+def compose_strip(shots, layout='strip', decoration=None, cell_width=STRIP_CELL_WIDTH, margin=STRIP_MARGIN):
+    """
+    Tiles shots onto a card.
+
+    Args:
+        shots (list): BGR frames, all with the same aspect ratio.
+        layout (str): "strip" or "grid".
+        decoration (numpy.ndarray): A BGRA image drawn over each shot, or None.
+        cell_width (int): Width of each shot on the card.
+        margin (int): Space around and between the shots.
+
+    Returns:
+        numpy.ndarray: The BGR card.
+    """
+    columns, rows = layout_size(len(shots), layout)
+    h, w = shots[0].shape[:2]
+    cell_height = round(cell_width * h / w)
+    card = np.full((rows * (cell_height + margin) + margin, columns * (cell_width + margin) + margin, 3),
+                   255, dtype=np.uint8)
+
+    overlay = None
+    if decoration is not None:
+        # Resized once, to the cell, the way the preview fits it to the frame
+        overlay = cv2.resize(decoration, (cell_width, cell_height), interpolation=cv2.INTER_AREA)
+        mask = overlay[:, :, 3]
+        inverse_mask = cv2.bitwise_not(mask)
+        foreground = cv2.bitwise_and(overlay[:, :, :3], overlay[:, :, :3], mask=mask)
+
+    for i, shot in enumerate(shots):
+        row, column = divmod(i, columns)
+        y = margin + row * (cell_height + margin)
+        x = margin + column * (cell_width + margin)
+        cell = cv2.resize(shot, (cell_width, cell_height), interpolation=cv2.INTER_AREA)
+        if overlay is not None:
+            cell = cv2.add(cv2.bitwise_and(cell, cell, mask=inverse_mask), foreground)
+        card[y:y + cell_height, x:x + cell_width] = cell
+    return card
@@ -0,0 +1,99 @@
+"""
+Per-element CPU time reporting for the camera pipeline.
+
+`ElementProfiler` puts buffer probes on the sink and src pads of each
+element. Without queues, an element pushes its output from the same
+streaming thread that called its chain function, so the time between the
+two probes is the element's processing time, and `time.thread_time()` over
+the same span is the CPU it used. Decoders that push from their own thread
+(e.g. V4L2 mem2mem) only get wall time.
+
+Stages that run in Python, such as the in-app JPEG decode, can be reported
+alongside the elements with `record`.
+"""
+import logging
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+
+class ElementProfiler:
+    """Accumulates and periodically logs per-element processing time."""
+    def __init__(self, interval=10.0):
+        """
+        Initializes the ElementProfiler.
+
+        Args:
+            interval (float): Seconds between log reports.
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._entered = {}  # element -> (thread, wall, cpu) at the sink pad; two pipelines can share names
+        self._stats = {}
+        self._last_report = time.monotonic()
+
+    def attach(self, pipeline):
+        """
+        Adds probes to every element of a pipeline that has both a sink and a src pad.
+        """
+        iterator = pipeline.iterate_elements()
+        while True:
+            result, element = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            sink_pad = element.get_static_pad("sink")
+            src_pad = element.get_static_pad("src")
+            if sink_pad is None or src_pad is None:
+                continue
+            sink_pad.add_probe(Gst.PadProbeType.BUFFER, self._on_enter, element)
+            src_pad.add_probe(Gst.PadProbeType.BUFFER, self._on_exit, element)
+
+    def _on_enter(self, pad, info, element):
+        self._entered[element] = (threading.get_ident(), time.perf_counter(), time.thread_time())
+        return Gst.PadProbeReturn.OK
+
+    def _on_exit(self, pad, info, element):
+        entered = self._entered.pop(element, None)
+        if entered is not None:
+            thread_id, wall_start, cpu_start = entered
+            cpu = None
+            if thread_id == threading.get_ident():
+                cpu = time.thread_time() - cpu_start
+            self.record(element.get_name(), time.perf_counter() - wall_start, cpu)
+        return Gst.PadProbeReturn.OK
+
+    def record(self, name, wall, cpu=None):
+        """
+        Adds one processed buffer to a stage's totals.
+
+        Args:
+            name (str): The element or stage name.
+            wall (float): Wall-clock seconds spent on the buffer.
+            cpu (float): CPU seconds spent on the buffer, if known.
+        """
+        with self._lock:
+            count, wall_total, cpu_total = self._stats.get(name, (0, 0.0, 0.0))
+            if cpu is None or cpu_total is None:
+                cpu_total = None
+            else:
+                cpu_total += cpu
+            self._stats[name] = (count + 1, wall_total + wall, cpu_total)
+
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            elapsed = now - self._last_report
+            stats, self._stats = self._stats, {}
+            self._last_report = now
+
+        for stage, (count, wall_total, cpu_total) in sorted(stats.items()):
+            if cpu_total is None:
+                cpu_str = "cpu n/a (pushes from another thread)"
+            else:
+                cpu_str = (f"cpu {cpu_total / count * 1000:.2f}ms/buffer, "
+                           f"{cpu_total / elapsed * 100:.0f}% of a core")
+            logging.info(f"[profile] {stage}: {count / elapsed:.1f} buffers/s, "
+                         f"wall {wall_total / count * 1000:.2f}ms/buffer, {cpu_str}")
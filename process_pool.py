@@ -0,0 +1,299 @@
+"""
+Multi-core frame processing with a pool of worker processes.
+
+`FrameProcessor` work (overlay blending, grayscale conversion, face
+detection and hat compositing) otherwise runs on a single thread that
+shares the GIL with the Kivy UI and the voice listener. `FrameProcessPool`
+spreads frames across worker processes, each with its own `FrameProcessor`.
+
+Frames are not pickled. Each slot in the pool is one
+`multiprocessing.shared_memory` block holding an input frame followed by
+the processed output; only the slot number, shape and a sequence number go
+through the task and result queues. Results can finish out of order, so
+they are reordered by sequence number before `on_result` is called.
+
+The birthday frame, hat, background, colour effect and detection settings
+are read from the app's `FrameProcessor`: when they change, they are sent
+to every worker once, and each task carries the settings generation it
+needs.
+
+Chroma key masks are not smoothed over time in the workers when there is
+more than one: each worker sees only every Nth frame, so averaging its own
+masks would blend masks from different moments and make the matte flicker.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from chroma_key import ChromaKeyer
+from effects import get_effect
+from face_detectors import create_detector
+from frame_processor import FrameProcessor
+
+# --- CONFIGURATION ---
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', '0'))  # Worker processes, 0 to process in-thread
+# --- END CONFIGURATION ---
+
+SLOTS_PER_WORKER = 2  # One frame being processed and one waiting, per worker
+RESULT_POLL = 0.5     # Seconds between worker health checks while waiting
+
+
+def _frame_view(shm, shape, offset=0):
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+
+def _process_slot(processor, shm, shape, faces):
+    """Processes the frame in a slot, writing the output after it."""
+    nbytes = int(np.prod(shape))
+    target = _frame_view(shm, shape, nbytes)
+    output, faces = processor.process(_frame_view(shm, shape), faces, out=target)
+    if output is not target:
+        target[:] = output
+    return faces
+
+
+def _worker_main(tasks, settings, results, detector_name, detect_scale, smoothing):
+    """The loop run by each worker process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The app shuts the pool down
+    cv2.setNumThreads(1)  # One process per core already
+    processor = FrameProcessor(create_detector(detector_name, detect_scale))
+    if processor.chroma_keyer is not None and smoothing != processor.chroma_keyer.smoothing:
+        processor.chroma_keyer = ChromaKeyer(smoothing=smoothing)
+    stage_times = []
+    processor.stage_timer = lambda stage, seconds: stage_times.append((stage, seconds))
+    generation = 0
+    attached = {}  # slot -> SharedMemory
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, task_generation, slot, name, shape, faces = task
+        while generation < task_generation:
+            generation, birthday_frame, prepared, hat, background, params = settings.get()
+            detect_interval, detect_scale, detect_always, effect_name, simple_effects = params
+            processor.set_birthday_frame(birthday_frame, prepared)
+            processor.hat = hat
+            processor.background = background
+            processor.detect_interval = detect_interval
+            processor.detector.scale = detect_scale
+            processor.detect_always = detect_always
+            processor.effect = get_effect(effect_name) if effect_name else None
+            processor.simple_effects = simple_effects
+
+        shm = attached.get(slot)
+        if shm is None or shm.name != name:
+            if shm is not None:
+                shm.close()  # The parent replaced the slot with a larger one
+            shm = attached[slot] = shared_memory.SharedMemory(name=name)
+
+        stage_times.clear()
+        try:
+            faces = _process_slot(processor, shm, shape, faces)
+            results.put((seq, True, faces, list(stage_times)))
+        except Exception:
+            logging.exception("Frame processing failed in a worker process.")
+            results.put((seq, False, None, []))
+
+    for shm in attached.values():
+        shm.close()
+
+
+class FrameProcessPool:
+    """
+    Processes frames on worker processes and returns the results in order.
+
+    `on_result` is called from the pool's collector thread with (context,
+    processed_frame, faces) for every submitted frame, in submission order.
+    `processed_frame` is None if processing failed.
+    """
+    def __init__(self, processor, workers=PROCESS_WORKERS, on_result=None):
+        """
+        Initializes the FrameProcessPool and starts its worker processes.
+
+        Args:
+            processor (FrameProcessor): The processor whose birthday frame,
+                hat, background, effect and face detector the workers follow, and whose
+                `stage_timer` receives the workers' stage timings.
+            workers (int): Number of worker processes.
+            on_result: Called with (context, processed_frame, faces).
+        """
+        self.processor = processor
+        self.workers = workers
+        self.on_result = on_result
+        self.failed = False
+        self._lock = threading.Condition()
+        self._stop_event = threading.Event()
+        self._seq = 0
+        self._next_result = 0
+        self._finished = {}   # seq -> result, waiting for earlier frames
+        self._in_flight = {}  # seq -> (slot, shape, context, out)
+        self._slots = [None] * (workers * SLOTS_PER_WORKER)  # slot -> SharedMemory
+        self._free = list(range(len(self._slots)))
+        self._generation = 0
+        self._settings_sent = None  # The (birthday_frame, prepared, hat, background, params) the workers have
+        # A worker sees every Nth frame, so only a lone worker can smooth masks over time
+        keyer = processor.chroma_keyer
+        smoothing = keyer.smoothing if keyer is not None and workers == 1 else 0
+
+        # Fork rather than spawn: spawned children re-import the main module,
+        # and importing main.py opens the Kivy window. main.py starts the
+        # pool before Gst.init and the window import, and headless.py before
+        # its pipeline and worker threads.
+        context = multiprocessing.get_context('fork')
+        # Share one resource tracker with the workers; a tracker of their own
+        # would unlink the slots they attached to when they exit
+        resource_tracker.ensure_running()
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._settings = []
+        self._workers = []
+        for i in range(workers):
+            settings = context.Queue()
+            worker = context.Process(
+                target=_worker_main,
+                args=(self._tasks, settings, self._results, processor.detector.name, processor.detector.scale,
+                      smoothing),
+                name=f'frame-worker-{i}', daemon=True
+            )
+            worker.start()
+            self._settings.append(settings)
+            self._workers.append(worker)
+        self._collector = threading.Thread(target=self._collect, name='frame-pool-collector', daemon=True)
+        self._collector.start()
+        logging.info(f"Frame process pool started with {workers} workers.")
+
+    def _sync_settings(self, shape):
+        """Sends the processor's settings to the workers if they changed."""
+        birthday_frame = self.processor.birthday_frame
+        prepared = self.processor.resized_overlay
+        if prepared is not None and prepared[0].shape[:2] != shape[:2]:
+            prepared = None  # Prepared for another size, e.g. by a full-size capture
+        hat = self.processor.hat
+        background = self.processor.background
+        effect = self.processor.effect
+        # Effects are sent by name; each worker compiles its own from the presets
+        params = (self.processor.detect_interval, self.processor.detector.scale, self.processor.detect_always,
+                  effect.name if effect is not None else None, self.processor.simple_effects)
+        images = (birthday_frame, prepared, hat, background)
+        if self._settings_sent is not None and params == self._settings_sent[4] and all(
+                new is old for new, old in zip(images, self._settings_sent)):
+            return
+        self._settings_sent = images + (params,)
+        self._generation += 1
+        for settings in self._settings:
+            settings.put((self._generation,) + images + (params,))
+
+    def _slot_for(self, slot, nbytes):
+        shm = self._slots[slot]
+        if shm is None or shm.size < 2 * nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = self._slots[slot] = shared_memory.SharedMemory(create=True, size=2 * nbytes)
+        return shm
+
+    def submit(self, frame, context=None, faces=None, timeout=None, out=None):
+        """
+        Queues a BGR frame for processing.
+
+        Args:
+            frame (numpy.ndarray): The frame. It is copied into shared
+                memory, so the caller keeps ownership.
+            context: Passed back to `on_result` with the frame's result.
+            faces: Face boxes to use instead of running detection.
+            timeout (float): Seconds to wait for a free slot, or None to wait
+                indefinitely.
+            out (numpy.ndarray): A frame of the same shape to copy the result
+                into, or None for a new frame.
+
+        Returns:
+            int: The frame's sequence number, or None if no slot became free.
+        """
+        frame = np.ascontiguousarray(frame)
+        with self._lock:
+            if not self._lock.wait_for(lambda: self._free or self.failed, timeout) or self.failed:
+                return None
+            slot = self._free.pop()
+            seq = self._seq
+            self._seq += 1
+            shm = self._slot_for(slot, frame.nbytes)
+            _frame_view(shm, frame.shape)[:] = frame
+            self._sync_settings(frame.shape)
+            self._in_flight[seq] = (slot, frame.shape, context, out)
+            self._tasks.put((seq, self._generation, slot, shm.name, frame.shape, faces))
+        return seq
+
+    def _collect(self):
+        while not self._stop_event.is_set():
+            try:
+                seq, ok, faces, stage_times = self._results.get(timeout=RESULT_POLL)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers) and not self._stop_event.is_set():
+                    self._fail()
+                    return
+                continue
+            self._finished[seq] = (ok, faces, stage_times)
+
+            while self._next_result in self._finished:
+                ok, faces, stage_times = self._finished.pop(self._next_result)
+                with self._lock:
+                    slot, shape, context, out = self._in_flight.pop(self._next_result)
+                    output = None
+                    if ok:
+                        view = _frame_view(self._slots[slot], shape, int(np.prod(shape)))
+                        if out is None:
+                            output = view.copy()
+                        else:
+                            output = out
+                            np.copyto(output, view)
+                    self._free.append(slot)
+                    self._lock.notify()
+                self._next_result += 1
+
+                stage_timer = self.processor.stage_timer
+                if stage_timer:
+                    for stage, seconds in stage_times:
+                        stage_timer(stage, seconds)
+                if self.on_result:
+                    self.on_result(context, output, faces)
+
+    def _fail(self):
+        """Gives up on the pool after a worker process died."""
+        logging.error("A frame worker process died; frame processing falls back to a single thread.")
+        with self._lock:
+            self.failed = True
+            self._lock.notify_all()
+            lost = [self._in_flight.pop(seq)[2] for seq in sorted(self._in_flight)]
+        if self.on_result:
+            for context in lost:
+                self.on_result(context, None, None)  # Lets the caller release what the frames held
+
+    def close(self):
+        """Stops the workers and frees the shared memory."""
+        self._stop_event.set()
+        for _ in self._workers:
+            self._tasks.put(None)
+        deadline = time.monotonic() + 2.0
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                worker.terminate()
+        self._collector.join()
+        with self._lock:
+            self.failed = True
+            self._lock.notify_all()
+            for shm in self._slots:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+            self._slots = []
+        logging.info("Frame process pool stopped.")
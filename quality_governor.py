@@ -0,0 +1,195 @@
+"""
+Adaptive preview quality for overloaded machines.
+
+`QualityGovernor` watches how long frames take to process and how many are
+processed per second. When processing falls behind the camera, it steps
+down through `QUALITY_LEVELS`: face detection on fewer frames, simpler
+colour effects and chroma keying, detection on smaller frames, then a
+smaller camera format from the ones the camera supports. When the load
+drops again, it steps back up, more cautiously than it stepped down so that
+it does not flap between levels.
+
+Every decision is logged with the numbers behind it, kept in `history`,
+and published as the `quality_level` gauge and the `quality_steps_down`
+and `quality_steps_up` counters, so the behaviour of each kiosk model shows
+up in the metrics file.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+# --- CONFIGURATION ---
+QUALITY_GOVERNOR = os.environ.get('QUALITY_GOVERNOR')              # Adapt quality to the load when set
+QUALITY_TARGET_FPS = float(os.environ.get('QUALITY_TARGET_FPS', '0'))  # 0 for the camera framerate
+QUALITY_INTERVAL = float(os.environ.get('QUALITY_INTERVAL', '2.0'))    # Seconds between decisions
+# --- END CONFIGURATION ---
+
+# From best to cheapest. `detect_scale` multiplies the configured detection
+# downscale, `simple_effects` drops colour effect curves and vignettes and
+# gives the chroma key a hard edge, and `preview_step` is how many supported
+# formats below the chosen one the camera is switched to.
+QUALITY_LEVELS = [
+    {'name': 'full', 'detect_interval': 1, 'detect_scale': 1, 'simple_effects': False, 'preview_step': 0},
+    {'name': 'detect-half-rate', 'detect_interval': 2, 'detect_scale': 1, 'simple_effects': False, 'preview_step': 0},
+    {'name': 'detect-third-rate', 'detect_interval': 3, 'detect_scale': 1, 'simple_effects': False, 'preview_step': 0},
+    {'name': 'effects-simple', 'detect_interval': 3, 'detect_scale': 1, 'simple_effects': True, 'preview_step': 0},
+    {'name': 'detect-small', 'detect_interval': 3, 'detect_scale': 2, 'simple_effects': True, 'preview_step': 0},
+    {'name': 'detect-tiny', 'detect_interval': 4, 'detect_scale': 4, 'simple_effects': True, 'preview_step': 0},
+    {'name': 'preview-smaller', 'detect_interval': 4, 'detect_scale': 4, 'simple_effects': True, 'preview_step': 1},
+    {'name': 'preview-smallest', 'detect_interval': 4, 'detect_scale': 4, 'simple_effects': True, 'preview_step': 2},
+]
+
+HIGH_LOAD = 0.85       # Fraction of the frame budget above which quality steps down
+LOW_LOAD = 0.5         # Fraction below which it may step back up
+CALM_INTERVALS = 3     # Quiet intervals needed before stepping up
+FORMAT_CALM_INTERVALS = 10  # Before stepping back up to a larger camera format
+FORMAT_COOLDOWN = 8.0  # Seconds to let a camera format switch settle before judging it
+HISTORY_LENGTH = 50
+DROP_COUNTERS = ('dropped_sample_queue', 'dropped_process_pool')
+
+
+def smaller_formats(formats, base_format):
+    """
+    Returns the supported formats smaller than `base_format`, largest first.
+
+    Formats with the same pixel format and at least the same framerate are
+    preferred; one entry is kept per size.
+
+    Args:
+        formats (list): (w, h, pixel_format, framerate) tuples.
+        base_format (tuple): The (w, h, pixel_format, framerate) chosen by the user.
+    """
+    w, h, pixel_format, framerate = base_format
+    candidates = [f for f in formats if f[0] * f[1] < w * h and f[3] >= framerate]
+    same_format = [f for f in candidates if f[2] == pixel_format]
+    by_size = {}
+    for f in sorted(same_format or candidates, key=lambda f: (f[0] * f[1], f[3]), reverse=True):
+        by_size.setdefault((f[0], f[1]), f)
+    return list(by_size.values())
+
+
+class QualityGovernor(threading.Thread):
+    """
+    A worker thread that adapts processing quality to the load.
+
+    The `app` must provide `processor`, `current_format`, `supported_formats`
+    and `process_pool`, and a `set_quality_format(format)` method that
+    switches the camera format from the UI thread.
+    """
+    def __init__(self, app, target_fps=QUALITY_TARGET_FPS, interval=QUALITY_INTERVAL, **kwargs):
+        super(QualityGovernor, self).__init__(daemon=True, **kwargs)
+        self.app = app
+        self.target_fps = target_fps
+        self.interval = interval
+        self.level = 0
+        self.history = deque(maxlen=HISTORY_LENGTH)  # (time, level name, reason)
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._calm = 0
+        self._hold_until = 0.0
+        self._base_format = None  # The format chosen by the user, while a smaller one is used
+        self._detect_scale = app.processor.detector.scale  # The configured detection downscale
+        self._last_processed = metrics.counter('frames_processed')
+        self._last_drops = self._drops()
+        self._last_time = time.monotonic()
+        metrics.set_gauge('quality_level', 0)
+
+    def _drops(self):
+        return sum(metrics.counter(name) for name in DROP_COUNTERS)
+
+    def level_name(self):
+        """Returns the name of the current quality level."""
+        return QUALITY_LEVELS[self.level]['name']
+
+    def run(self):
+        logging.info("Quality governor started.")
+        while not self.stop_event.wait(self.interval):
+            with self._lock:
+                self._tick()
+        logging.info("Quality governor stopped.")
+
+    def _tick(self):
+        now = time.monotonic()
+        processed = metrics.counter('frames_processed')
+        drops = self._drops()
+        frames = processed - self._last_processed
+        new_drops = drops - self._last_drops
+        fps = frames / (now - self._last_time)
+        self._last_processed, self._last_drops, self._last_time = processed, drops, now
+
+        current_format = self.app.current_format
+        if frames == 0 or current_format is None or now < self._hold_until:
+            return  # No camera, or a format switch is settling
+
+        target_fps = self.target_fps or current_format[3]
+        samples = metrics.samples('process')[-frames:]
+        workers = self.app.process_pool.workers if self.app.process_pool else 1
+        load = sum(samples) / len(samples) * target_fps / workers if samples else 0.0
+        stats = f"load {load:.2f}, {fps:.1f}/{target_fps:g} fps, {new_drops} dropped"
+
+        if load > HIGH_LOAD or (new_drops > 0 and fps < target_fps * 0.9):
+            self._calm = 0
+            if self.level < len(QUALITY_LEVELS) - 1:
+                self._set_level(self.level + 1, f"overloaded ({stats})")
+                metrics.inc('quality_steps_down')
+        elif load < LOW_LOAD and new_drops == 0 and self.level > 0:
+            self._calm += 1
+            needed = CALM_INTERVALS
+            if QUALITY_LEVELS[self.level - 1]['preview_step'] != QUALITY_LEVELS[self.level]['preview_step']:
+                needed = FORMAT_CALM_INTERVALS
+            if self._calm >= needed:
+                self._calm = 0
+                self._set_level(self.level - 1, f"recovered ({stats})")
+                metrics.inc('quality_steps_up')
+        else:
+            self._calm = 0
+
+    def _set_level(self, level, reason):
+        previous = QUALITY_LEVELS[self.level]
+        settings = QUALITY_LEVELS[level]
+        self.level = level
+        logging.info(f"Quality level {level} ({settings['name']}): {reason}")
+        self.history.append((time.time(), settings['name'], reason))
+        metrics.set_gauge('quality_level', level)
+
+        self._apply_processing(settings)
+
+        if settings['preview_step'] != previous['preview_step']:
+            if self._base_format is None:
+                self._base_format = self.app.current_format
+            formats = smaller_formats(self.app.supported_formats, self._base_format)
+            step = min(settings['preview_step'], len(formats))
+            target = formats[step - 1] if step else self._base_format
+            if target != self.app.current_format:
+                logging.info(f"Quality governor switching the camera to {target[0]}x{target[1]} "
+                             f"({target[2]}) @ {target[3]}fps.")
+                self.app.set_quality_format(target)
+                self._hold_until = time.monotonic() + FORMAT_COOLDOWN
+            if not step:
+                self._base_format = None
+
+    def _apply_processing(self, settings):
+        processor = self.app.processor
+        processor.detect_interval = settings['detect_interval']
+        processor.detector.scale = self._detect_scale * settings['detect_scale']
+        processor.simple_effects = settings['simple_effects']
+
+    def reset(self):
+        """Returns to full quality, e.g. after the user picked a new camera format."""
+        with self._lock:
+            self._base_format = None  # The user's choice is the new base
+            self._calm = 0
+            if self.level:
+                self.level = 0
+                settings = QUALITY_LEVELS[0]
+                self._apply_processing(settings)
+                self.history.append((time.time(), settings['name'], 'reset'))
+                metrics.set_gauge('quality_level', 0)
+                logging.info("Quality level reset to full.")
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,169 @@
+"""
+Batch re-render of captured photos with a different frame, hat, background or
+colour effect.
+
+The booth keeps the raw camera frame and the overlay parameters of each
+photo when it runs with `SAVE_RAW` set (see `photo_output.save_raw_capture`).
+This tool composites those raw frames again with any asset, reusing the face
+boxes stored at capture time so no detection is needed, and spreads the work
+across a process pool sized to the machine's cores.
+
+Example:
+    python rerender.py photos/raw --frame assets/frames/frame_balloons.png --hat none --output photos/balloons
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import photo_output
+from chroma_key import BACKGROUNDS_DIR, ChromaKeyer
+from effects import EFFECT_PRESETS, get_effect
+from frame_processor import FrameProcessor
+
+logging.basicConfig(level=logging.INFO)
+
+KEEP = 'keep'  # Use the asset recorded for each photo
+
+# Per-process state, set up once by _init_worker
+_processor = None
+_assets = {}
+
+
+def resolve_asset(value, asset_dir):
+    """
+    Turns a --frame/--hat argument into an asset path.
+
+    Args:
+        value (str): "keep", "none", a path, or a file name in `asset_dir`.
+        asset_dir (str): The directory searched for bare file names.
+
+    Returns:
+        str: The asset path, KEEP, or None for no asset.
+    """
+    if value in (KEEP, 'none'):
+        return None if value == 'none' else KEEP
+    if os.path.exists(value):
+        return value
+    candidate = os.path.join(asset_dir, value)
+    if os.path.exists(candidate):
+        return candidate
+    raise SystemExit(f"Asset not found: {value}")
+
+
+def _load_asset(path):
+    """Loads a BGRA asset once per process."""
+    if path is None:
+        return None
+    if path not in _assets:
+        _assets[path] = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if _assets[path] is None:
+            logging.error(f"Failed to load asset {path}")
+    return _assets[path]
+
+
+def _init_worker(frame_asset, hat_asset, background_asset):
+    global _processor
+    # One OpenCV thread per process; the pool already uses every core
+    cv2.setNumThreads(1)
+    _processor = FrameProcessor()
+    # Photos are unrelated stills, so no smoothing between them
+    _processor.chroma_keyer = ChromaKeyer(smoothing=0)
+    for path in (frame_asset, hat_asset, background_asset):
+        if path not in (None, KEEP):
+            _load_asset(path)
+
+
+def render_one(sidecar_path, frame_asset, hat_asset, background_asset, effect, output_dir, photo_format, quality):
+    """
+    Re-composites one raw capture.
+
+    Returns:
+        tuple: (sidecar_path, output_path), with output_path None on failure.
+    """
+    try:
+        raw_frame, sidecar = photo_output.load_raw_capture(sidecar_path)
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Failed to read {sidecar_path}: {e}")
+        return sidecar_path, None
+    if raw_frame is None:
+        logging.error(f"Failed to read the raw frame for {sidecar_path}")
+        return sidecar_path, None
+
+    if frame_asset == KEEP:
+        frame_asset = sidecar.get('frame_asset')
+    if hat_asset == KEEP:
+        hat_asset = sidecar.get('hat_asset')
+    if background_asset == KEEP:
+        background_asset = sidecar.get('background_asset')
+    if effect == KEEP:
+        effect = sidecar.get('effect')  # Absent from sidecars saved before effects
+    _processor.set_birthday_frame(_load_asset(frame_asset))
+    _processor.hat = _load_asset(hat_asset)
+    _processor.background = _load_asset(background_asset)
+    _processor.effect = get_effect(effect) if effect else None
+
+    output_frame, _ = _processor.process(raw_frame, faces=sidecar.get('faces', []))
+    stem = os.path.splitext(os.path.basename(sidecar_path))[0]
+    output_path = os.path.join(output_dir, f"{stem}{photo_output.photo_extension(photo_format)}")
+    if not photo_output.save_photo(output_path, photo_format, quality, frame=output_frame):
+        return sidecar_path, None
+    return sidecar_path, output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-render captured photos with a different frame, hat or effect.")
+    parser.add_argument('raw_dir', nargs='?', default=photo_output.RAW_DIR,
+                        help=f'Directory of raw captures (default: {photo_output.RAW_DIR})')
+    parser.add_argument('--frame', default=KEEP,
+                        help='Frame asset path or name in assets/frames, "none", or "keep" (default)')
+    parser.add_argument('--hat', default=KEEP,
+                        help='Hat asset path or name in assets/hats, "none", or "keep" (default)')
+    parser.add_argument('--background', default=KEEP,
+                        help=f'Green screen background path or name in {BACKGROUNDS_DIR}, "none", '
+                             f'or "keep" (default)')
+    parser.add_argument('--effect', default=KEEP, choices=[KEEP] + list(EFFECT_PRESETS),
+                        help='Colour effect preset, "none", or "keep" (default)')
+    parser.add_argument('--output', default='photos/rerendered', help='Output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--format', choices=sorted(photo_output.PHOTO_FORMATS), default='jpeg')
+    parser.add_argument('--quality', type=int, default=92)
+    args = parser.parse_args()
+
+    frame_asset = resolve_asset(args.frame, 'assets/frames')
+    hat_asset = resolve_asset(args.hat, 'assets/hats')
+    background_asset = resolve_asset(args.background, BACKGROUNDS_DIR)
+    sidecars = sorted(glob.glob(os.path.join(args.raw_dir, '*.json')))
+    if not sidecars:
+        raise SystemExit(f"No raw captures found in {args.raw_dir}")
+    os.makedirs(args.output, exist_ok=True)
+
+    workers = max(1, min(args.workers, len(sidecars)))
+    logging.info(f"Re-rendering {len(sidecars)} photos with {workers} worker processes.")
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(frame_asset, hat_asset, background_asset)) as executor:
+        futures = [
+            executor.submit(render_one, path, frame_asset, hat_asset, background_asset, args.effect, args.output,
+                            args.format, args.quality)
+            for path in sidecars
+        ]
+        for future in futures:
+            sidecar_path, output_path = future.result()
+            if output_path is None:
+                failed += 1
+    elapsed = time.perf_counter() - start
+
+    rendered = len(sidecars) - failed
+    print(f"Rendered {rendered} photos in {elapsed:.2f}s ({rendered / elapsed:.1f} photos/s, "
+          f"{workers} workers){f', {failed} failed' if failed else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Hands-free capture when everyone smiles.
+
+`SmileTrigger` is a cheap alternative to voice triggering. It reuses the face
+boxes the frame processor found for hats and runs OpenCV's smile cascade
+only on the lower half of each face, scaled down to `SMILE_ROI_WIDTH`
+pixels, at most `SMILE_CHECK_FPS` times a second. Once every face has been
+smiling in most of the checks over `SMILE_SECONDS`, it calls its callback,
+then waits `SMILE_COOLDOWN` seconds before it can fire again.
+
+Checks are timed as the `smile` stage, and triggers are counted as
+`smile_triggers`.
+"""
+import logging
+import os
+import time
+from collections import deque
+
+import cv2
+
+from metrics import metrics
+
+# --- CONFIGURATION ---
+SMILE_TRIGGER = os.environ.get('SMILE_TRIGGER')                         # Capture when everyone smiles
+SMILE_SECONDS = float(os.environ.get('SMILE_SECONDS', '1.0'))           # How long the smiles must hold
+SMILE_COOLDOWN = float(os.environ.get('SMILE_COOLDOWN', '10'))          # Seconds before triggering again
+SMILE_CHECK_FPS = float(os.environ.get('SMILE_CHECK_FPS', '10'))        # Smile checks per second, at most
+SMILE_CASCADE_PATH = os.environ.get(
+    'SMILE_CASCADE_PATH',
+    os.path.join(cv2.data.haarcascades, 'haarcascade_smile.xml') if hasattr(cv2, 'data')
+    else 'assets/haarcascade_smile.xml'
+)
+# --- END CONFIGURATION ---
+
+SMILE_ROI_WIDTH = 72        # Mouth regions are scaled to this width; the cascade window is 36x18
+SMILE_SCALE_FACTOR = 1.15
+SMILE_MIN_NEIGHBORS = 20    # Smile cascades fire on many mouths; demand strong agreement
+SMILE_RATIO = 0.8           # Share of the checks in the window that must see every face smiling
+
+
+class SmileTrigger:
+    """
+    Calls `callback` once all detected faces have been smiling for a while.
+
+    `update` is called from the frame processing thread with each frame and
+    its face boxes.
+    """
+    def __init__(self, callback, path=SMILE_CASCADE_PATH, seconds=SMILE_SECONDS,
+                 cooldown=SMILE_COOLDOWN, check_fps=SMILE_CHECK_FPS):
+        """
+        Initializes the SmileTrigger.
+
+        Args:
+            callback: Called with no arguments when everyone smiles.
+            path (str): Path to the smile Haar cascade.
+            seconds (float): How long the smiles must hold.
+            cooldown (float): Seconds after a trigger before the next one.
+            check_fps (float): Smile checks per second, at most.
+        """
+        self.callback = callback
+        self.seconds = seconds
+        self.cooldown = cooldown
+        self.check_interval = 1.0 / check_fps
+        self.cascade = cv2.CascadeClassifier(path)
+        self.available = not self.cascade.empty()
+        if not self.available:
+            logging.error(f"Failed to load the smile cascade from {path}; smile trigger disabled.")
+        self._checks = deque()  # (time, everyone smiling)
+        self._next_check = 0.0
+        self._cooldown_until = 0.0
+
+    def is_smiling(self, gray, face):
+        """
+        Returns True if the face at an (x, y, w, h) box in a greyscale frame
+        is smiling.
+        """
+        x, y, w, h = (int(v) for v in face)
+        frame_h, frame_w = gray.shape[:2]
+        # The mouth is in the lower half of the face box
+        x1, y1 = max(x, 0), max(y + h // 2, 0)
+        x2, y2 = min(x + w, frame_w), min(y + h, frame_h)
+        if x2 - x1 < SMILE_ROI_WIDTH // 2 or y2 - y1 < SMILE_ROI_WIDTH // 4:
+            return False
+        roi_h = max(round((y2 - y1) * SMILE_ROI_WIDTH / (x2 - x1)), 18)
+        roi = cv2.resize(gray[y1:y2, x1:x2], (SMILE_ROI_WIDTH, roi_h), interpolation=cv2.INTER_AREA)
+        smiles = self.cascade.detectMultiScale(roi, SMILE_SCALE_FACTOR, SMILE_MIN_NEIGHBORS)
+        return len(smiles) > 0
+
+    def update(self, frame, faces):
+        """
+        Checks a BGR frame's faces for smiles, triggering if they have held.
+
+        Args:
+            frame (numpy.ndarray): The raw camera frame.
+            faces: The (x, y, w, h) face boxes in it, or None if detection
+                did not run.
+        """
+        now = time.monotonic()
+        if not self.available or now < self._next_check or now < self._cooldown_until:
+            return
+        self._next_check = now + self.check_interval
+
+        if faces is None or len(faces) == 0:
+            self._checks.clear()
+            return
+        start = time.perf_counter()
+        # Convert only the band of rows that holds the faces
+        top = max(min(int(face[1]) for face in faces), 0)
+        bottom = min(max(int(face[1] + face[3]) for face in faces), frame.shape[0])
+        everyone = False
+        if bottom > top:
+            gray = cv2.cvtColor(frame[top:bottom], cv2.COLOR_BGR2GRAY)
+            everyone = all(self.is_smiling(gray, (x, y - top, w, h)) for x, y, w, h in faces)
+        metrics.observe('smile', time.perf_counter() - start)
+
+        self._checks.append((now, everyone))
+        while self._checks and now - self._checks[0][0] > self.seconds:
+            self._checks.popleft()
+        if now - self._checks[0][0] < self.seconds * 0.9:
+            return  # Not watched for long enough yet
+        smiling = sum(1 for _, everyone in self._checks if everyone)
+        if smiling >= SMILE_RATIO * len(self._checks):
+            logging.info(f"{len(faces)} smiling face(s) for {self.seconds:g}s; triggering capture.")
+            metrics.inc('smile_triggers')
+            self._checks.clear()
+            self._cooldown_until = now + self.cooldown
+            self.callback()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the app's top-level modules importable from the tests
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,40 @@
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+from camera_pipeline import source_kind, stand_in_description
+
+
+def test_source_kind():
+    assert source_kind('/dev/video0') == 'v4l2'
+    assert source_kind('videotestsrc') == 'videotestsrc'
+    assert source_kind('videotestsrc:smpte') == 'videotestsrc'
+    assert source_kind('recording/%05d.jpg') == 'images'
+    assert source_kind('clips/party.mp4') == 'file'
+    assert source_kind('100%/party.mp4') == 'file'  # Only a pattern in the file name counts
+
+
+def test_videotestsrc_description():
+    description = stand_in_description('videotestsrc:smpte', 640, 480, 'YUY2', 30, live=True)
+    assert description.startswith('videotestsrc pattern=smpte is-live=true ! ')
+    assert 'video/x-raw,width=640,height=480,framerate=30/1' in description
+    assert description.endswith('! videoconvert ! video/x-raw,format=YUY2')
+    assert 'pattern=ball is-live=false' in stand_in_description('videotestsrc', 640, 480, 'YUY2', 30, live=False)
+
+
+def test_mjpg_stand_ins_are_jpeg_encoded():
+    description = stand_in_description('clips/party.mp4', 1280, 720, 'MJPG', 30, live=False)
+    assert description.startswith('filesrc location="clips/party.mp4" ! decodebin ! ')
+    assert description.endswith('! jpegenc')
+
+
+def test_image_sequence_starts_at_the_first_file(tmp_path):
+    (tmp_path / '00001.png').write_bytes(b'')
+    pattern = str(tmp_path / '%05d.png')
+    description = stand_in_description(pattern, 640, 480, 'MJPG', 15, live=False)
+    assert f'multifilesrc location="{pattern}" index=1 loop=true' in description
+    assert 'caps="image/png,framerate=15/1"' in description
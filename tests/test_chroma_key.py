@@ -0,0 +1,63 @@
+import numpy as np
+
+from chroma_key import ChromaKeyer, fit_background
+
+GREEN = (40, 200, 40)
+RED = (30, 30, 200)
+BLUE = (200, 60, 20)
+
+
+def _frame():
+    """A green screen with a red subject in the middle."""
+    frame = np.full((120, 160, 3), GREEN, dtype=np.uint8)
+    frame[40:80, 60:100] = RED
+    return frame
+
+
+def test_background_replaces_the_backdrop():
+    frame = _frame()
+    original = frame.copy()
+    background = np.full((60, 80, 3), BLUE, dtype=np.uint8)
+    output = ChromaKeyer('green', 'hsv', scale=4).apply(frame, background, temporal=False)
+
+    assert output.shape == frame.shape
+    np.testing.assert_array_equal(output[5, 5], BLUE)
+    np.testing.assert_array_equal(output[115, 155], BLUE)
+    np.testing.assert_array_equal(output[60, 80], RED)
+    np.testing.assert_array_equal(frame, original)
+
+
+def test_simple_mode_has_a_hard_edge():
+    background = np.full((120, 160, 3), BLUE, dtype=np.uint8)
+    output = ChromaKeyer('green', 'ycrcb', scale=2).apply(_frame(), background, simple=True, temporal=False)
+    colours = {tuple(pixel) for pixel in output.reshape(-1, 3)}
+    assert colours <= {BLUE, RED}
+
+
+def test_apply_writes_into_out():
+    keyer = ChromaKeyer('green', 'hsv', scale=4)
+    background = np.full((120, 160, 3), BLUE, dtype=np.uint8)
+    out = np.empty((120, 160, 3), dtype=np.uint8)
+    for simple in (False, True):
+        expected = keyer.apply(_frame(), background, simple=simple, temporal=False)
+        assert keyer.apply(_frame(), background, simple=simple, temporal=False, out=out) is out
+        np.testing.assert_array_equal(out, expected)
+
+
+def test_records_the_stages():
+    stages = []
+    keyer = ChromaKeyer('green', 'hsv', scale=4)
+    background = np.full((60, 80, 4), BLUE + (255,), dtype=np.uint8)
+    keyer.apply(_frame(), background, record=lambda stage, start: stages.append(stage), temporal=False)
+    assert stages == ['key_background', 'key_mask', 'key_upscale', 'key_composite']
+    stages.clear()
+    keyer.apply(_frame(), background, record=lambda stage, start: stages.append(stage), temporal=False)
+    assert stages == ['key_mask', 'key_upscale', 'key_composite']  # The fitted background is cached
+
+
+def test_fit_background_fills_and_crops():
+    background = np.zeros((100, 300, 3), dtype=np.uint8)
+    background[:, 100:200] = 255  # The centre third
+    fitted = fit_background(background, (100, 100))
+    assert fitted.shape == (100, 100, 3)
+    assert fitted.min() == 255
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+except ValueError:
+    pytest.skip('GStreamer introspection data is not installed', allow_module_level=True)
+
+import clip_recorder
+from clip_recorder import ClipRecorder
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(clip_recorder.time, 'monotonic', clock)
+    return clock
+
+
+def test_frames_off_the_clip_clock_are_released_straight_away(clock):
+    recorder = ClipRecorder('clip.gif', seconds=1, fps=10, width=32)
+    released = []
+    frame = np.zeros((24, 64, 3), dtype=np.uint8)
+    recorder.push(frame, release=lambda: released.append(1))
+    assert released == []  # Kept
+    clock.now += 0.01
+    recorder.push(frame, release=lambda: released.append(2))
+    assert released == [2]
+
+
+def test_kept_frames_are_scaled_then_released(clock):
+    recorder = ClipRecorder('clip.gif', seconds=1, fps=10, width=32)
+    released = []
+    frame = np.zeros((24, 64, 3), dtype=np.uint8)
+    recorder.push(frame, release=lambda: released.append(1))
+    queued, release = recorder.frames.get_nowait()
+    assert queued is frame  # Not copied on the pushing thread
+    scaled = recorder._scale(queued, release)
+    assert released == [1]
+    assert scaled.shape == (12, 32, 3)
+
+    small = np.zeros((12, 32, 3), dtype=np.uint8)
+    owned = recorder._scale(small, lambda: released.append(2))
+    assert owned is not small
+    assert released == [1, 2]
+
+
+def test_frames_left_over_are_released(clock):
+    recorder = ClipRecorder('clip.gif', seconds=1, fps=10, width=32)
+    released = []
+    frame = np.zeros((24, 64, 3), dtype=np.uint8)
+    for i in range(3):
+        recorder.push(frame, release=lambda i=i: released.append(i))
+        clock.now += 0.1
+    recorder._drain()
+    assert sorted(released) == [0, 1, 2]
+    recorder.push(frame, release=lambda: released.append(3))
+    assert released[-1] == 3  # No longer recording
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import effects
+from effects import EFFECT_PRESETS, Effect, compile_effect
+
+
+def _frame():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    # The primaries, black and white, where clipping matters most
+    frame[0, :8] = [[0, 0, 0], [255, 255, 255], [0, 0, 255], [255, 0, 0],
+                    [0, 255, 0], [255, 255, 0], [0, 255, 255], [255, 0, 255]]
+    return frame
+
+
+def _unfused(frame, operations):
+    """Applies the operations one at a time in floating point, clipping after each."""
+    rgb = frame[:, :, ::-1].astype(np.float64)
+    for kind, value in operations:
+        if kind == 'matrix':
+            rgb = np.clip(rgb @ value[:, :3].T + value[:, 3], 0, 255)
+        else:
+            indices = np.round(rgb).astype(np.int64)
+            rgb = np.stack([value[indices[..., c], c] for c in range(3)], axis=-1)
+    return np.round(rgb[:, :, ::-1])
+
+
+@pytest.mark.parametrize('name', [name for name in EFFECT_PRESETS if name != 'none'])
+def test_presets_match_the_unfused_operations(name):
+    operations, _ = EFFECT_PRESETS[name]
+    frame = _frame()
+    output = Effect(name, operations).apply_color(frame)
+    assert output.shape == frame.shape
+    assert np.abs(output.astype(np.float64) - _unfused(frame, operations)).max() <= effects.FUSION_TOLERANCE
+
+
+def test_matrices_fuse_into_one_transform():
+    stages = compile_effect([effects.saturation(0.5), effects.tint(1.0, 0.95, 0.9),
+                             effects.brightness_contrast(0, 1.1)])
+    assert [kind for kind, _ in stages] == ['transform']
+    assert stages[0][1].shape == (3, 4)
+
+
+def test_clipping_operations_are_not_fused():
+    # The tint clips highlights that the fade would otherwise bring back
+    stages = compile_effect([effects.tint(1.2, 1.0, 1.0), effects.fade(0.2)])
+    assert [kind for kind, _ in stages] == ['transform', 'transform']
+
+
+def test_greyscale_curve_takes_the_grey_path():
+    stages = compile_effect([effects.saturation(0.0), effects.s_curve(1.0)])
+    assert [kind for kind, _ in stages] == ['gray_lut']
+    assert stages[0][1].shape == (1, 256)
+
+
+def test_gains_fold_into_a_curve():
+    stages = compile_effect([effects.tint(1.1, 1.0, 0.9), effects.s_curve(0.5)])
+    assert [kind for kind, _ in stages] == ['lut']
+    assert stages[0][1].shape == (1, 256, 3)
+
+
+def test_apply_color_writes_into_out():
+    effect = Effect('sepia', EFFECT_PRESETS['sepia'][0])
+    frame = _frame()
+    original = frame.copy()
+    out = np.empty_like(frame)
+    assert effect.apply_color(frame, out=out) is out
+    np.testing.assert_array_equal(out, effect.apply_color(frame))
+    np.testing.assert_array_equal(frame, original)
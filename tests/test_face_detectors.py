@@ -0,0 +1,24 @@
+from face_detectors import box_iou, match_faces
+
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (20, 20, 10, 10)) == 0.0
+    assert box_iou((0, 0, 10, 10), (10, 0, 10, 10)) == 0.0  # Touching edges
+    assert box_iou((0, 0, 10, 10), (5, 0, 10, 10)) == 50 / 150
+    assert box_iou((0, 0, 0, 0), (0, 0, 0, 0)) == 0.0
+
+
+def test_match_faces_counts_one_to_one_matches():
+    reference = [(0, 0, 100, 100), (200, 0, 100, 100)]
+    assert match_faces([(5, 5, 100, 100), (210, 0, 100, 100)], reference) == 2
+    # Two detections of the same face match it only once
+    assert match_faces([(0, 0, 100, 100), (2, 2, 100, 100)], reference) == 1
+    assert match_faces([], reference) == 0
+    assert match_faces([(0, 0, 100, 100)], []) == 0
+
+
+def test_match_faces_needs_enough_overlap():
+    reference = [(0, 0, 100, 100)]
+    assert match_faces([(50, 0, 100, 100)], reference) == 0  # IoU 1/3
+    assert match_faces([(50, 0, 100, 100)], reference, min_iou=0.3) == 1
@@ -0,0 +1,169 @@
+import queue
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+
+from frame_pool import FramePool
+from frame_processor import FrameProcessorWorker
+from metrics import metrics
+
+SHAPE = (24, 32, 3)
+
+
+class FakeProcessor:
+    def process(self, frame, faces=None, out=None):
+        np.copyto(out, 255 - frame)
+        return out, []
+
+
+def _app(pool_size, ring_size=3):
+    return SimpleNamespace(
+        frame_pool=FramePool(pool_size), process_pool=None, processor=FakeProcessor(),
+        sample_queue=queue.Queue(), display_queue=queue.Queue(maxsize=2),
+        shot_ring=deque(maxlen=ring_size) if ring_size else None,
+        keep_raw=False, latest_raw=None, latest_jpeg=None, latest_processed_frame=None,
+        clip_recorder=None, idle_monitor=None, smile_trigger=None, countdown_active=False, frame_ready=None,
+    )
+
+
+def _store(pool, value):
+    """Stands in for `store_sample`: copies a camera frame into a free slot."""
+    slot = pool.acquire()
+    if slot is not None:
+        pool.buffer(slot, 'raw', SHAPE)[:] = value
+    return slot
+
+
+def _process(worker, slot):
+    stamps = {'slot': slot, 't_appsink': 0.0}
+    frame, processed, faces = worker.process_sample(None, stamps)
+    worker.publish(frame, processed, faces, stamps)
+
+
+def _display(app):
+    """Stands in for the UI: takes a frame from the display queue and releases its slot."""
+    frame, stamps = app.display_queue.get_nowait()
+    slot = stamps.pop('slot', None)
+    if slot is not None:
+        app.frame_pool.release(slot)
+    return frame
+
+
+def test_slots_are_reference_counted():
+    pool = FramePool(2)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert pool.acquire() is None
+    pool.jpegs[first] = b'jpeg'
+    pool.retain(first)
+    pool.release(first)
+    assert pool.in_use() == 2
+    pool.release(first)
+    assert pool.in_use() == 1
+    assert pool.jpegs[first] is None
+    assert pool.acquire() == first
+    pool.release(first)
+    pool.release(second)
+    assert pool.in_use() == 0
+
+
+def test_hold_moves_to_the_new_slot():
+    pool = FramePool(3)
+    first, second = pool.acquire(), pool.acquire()
+    pool.hold('latest', first)
+    pool.release(first)
+    assert pool.in_use() == 2  # Still held
+    pool.hold('latest', second)
+    assert pool.in_use() == 1
+    pool.release(second)
+    assert pool.in_use() == 1  # Held as the newest frame
+
+
+def test_buffers_are_allocated_once_per_shape():
+    pool = FramePool(1)
+    slot = pool.acquire()
+    frame = pool.buffer(slot, 'raw', SHAPE)
+    assert pool.buffer(slot, 'raw', SHAPE) is frame
+    assert pool.buffer(slot, 'raw') is frame
+    assert pool.buffer(slot, 'raw', (12, 16, 3)) is not frame
+    assert pool.allocated_mb() == 12 * 16 * 3 / (1024 * 1024)
+
+
+def test_worker_processes_into_the_slot():
+    app = _app(12)
+    worker = FrameProcessorWorker(app)
+    slot = _store(app.frame_pool, 10)
+    _process(worker, slot)
+    processed = app.frame_pool.buffer(slot, 'processed')
+    assert app.latest_processed_frame is processed
+    assert (processed == 245).all()
+    # Held by the display queue, the newest frame and the shot ring
+    assert app.frame_pool._refs[slot] == 3
+    assert _display(app) is processed
+    assert app.frame_pool._refs[slot] == 2
+
+
+def test_slots_are_released_as_frames_move_on():
+    app = _app(12, ring_size=3)
+    worker = FrameProcessorWorker(app)
+    for value in range(20):
+        _process(worker, _store(app.frame_pool, value))
+        _display(app)
+    # The last three frames stay in the shot ring, the newest is one of them
+    assert app.frame_pool.in_use() == 3
+    ring_slots = {candidate['slot'] for candidate in app.shot_ring}
+    assert ring_slots == {slot for slot in range(12) if app.frame_pool._refs[slot] > 0}
+
+
+def test_full_display_queue_releases_the_slot():
+    app = _app(12, ring_size=0)
+    worker = FrameProcessorWorker(app)
+    dropped = metrics.counter('dropped_display_queue')
+    slots = [_store(app.frame_pool, value) for value in range(3)]
+    for slot in slots:
+        _process(worker, slot)
+    assert metrics.counter('dropped_display_queue') == dropped + 1
+    # The two queued frames, and the dropped one, held as the newest frame
+    assert app.frame_pool.in_use() == 3
+    _display(app)
+    _display(app)
+    assert app.frame_pool.in_use() == 1
+
+
+def test_failed_results_release_their_slot():
+    app = _app(4)
+    worker = FrameProcessorWorker(app)
+    slot = _store(app.frame_pool, 0)
+    stamps = {'slot': slot, 't_appsink': 0.0}
+    worker._pool_result((app.frame_pool.buffer(slot, 'raw'), stamps, 0.0, None), None, None)
+    assert app.frame_pool.in_use() == 0
+    worker.release_slot(stamps)  # Safe to call again
+    assert app.frame_pool.in_use() == 0
+
+
+def test_shot_ring_gives_up_slots_when_the_pool_runs_out():
+    app = _app(3, ring_size=6)
+    worker = FrameProcessorWorker(app)
+    app.frame_pool.on_exhausted = worker.release_shot_slots  # As set by run()
+    for value in range(20):
+        slot = _store(app.frame_pool, value)
+        assert slot is not None
+        _process(worker, slot)
+        _display(app)
+    assert app.frame_pool.in_use() <= 3
+    assert len(app.shot_ring) >= 1
+    assert (app.latest_processed_frame == 255 - 19).all()
+
+
+def test_without_reclaiming_a_small_pool_stalls():
+    app = _app(3, ring_size=6)
+    worker = FrameProcessorWorker(app)
+    slots = []
+    for value in range(5):
+        slot = _store(app.frame_pool, value)
+        slots.append(slot)
+        if slot is not None:
+            _process(worker, slot)
+            _display(app)
+    assert slots[3:] == [None, None]
@@ -0,0 +1,129 @@
+import os
+import queue
+from types import SimpleNamespace
+
+import numpy as np
+
+import idle_mode
+from frame_processor import FrameProcessorWorker
+from idle_mode import IdleMonitor
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_take_frame_keeps_to_the_idle_framerate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(idle_mode.time, 'monotonic', clock)
+    monitor = IdleMonitor(timeout=60, fps=5)
+
+    taken = []
+    for _ in range(100):  # One second of 100fps camera frames
+        taken.append(monitor.take_frame())
+        clock.now += 0.01
+    assert sum(taken) == 5
+    assert taken[0]
+
+
+def test_take_frame_restarts_after_a_stall(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(idle_mode.time, 'monotonic', clock)
+    monitor = IdleMonitor(timeout=60, fps=5)
+    assert monitor.take_frame()
+    clock.now += 10
+    assert monitor.take_frame()
+    # No burst of frames to catch up on the stall
+    clock.now += 0.01
+    assert not monitor.take_frame()
+
+
+def test_goes_idle_and_wakes(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(idle_mode.time, 'monotonic', clock)
+    changes = []
+    monitor = IdleMonitor(timeout=60, fps=5, on_change=changes.append)
+    clock.now += 59
+    monitor.check()
+    assert not monitor.idle
+    clock.now += 2
+    monitor.check()
+    assert monitor.idle
+    monitor.note_activity('touch')
+    assert not monitor.idle
+    assert changes == [True, False]
+
+
+def test_detect_motion():
+    monitor = IdleMonitor(timeout=60, fps=5)
+    still = np.full((480, 640, 3), 100, dtype=np.uint8)
+    assert not monitor.detect_motion(still)  # Nothing to compare with yet
+    assert not monitor.detect_motion(still.copy())
+
+    moved = still.copy()
+    moved[100:300, 200:400] = 220
+    assert monitor.detect_motion(moved)
+    assert not monitor.detect_motion(moved.copy())
+
+    noisy = moved.copy()
+    noisy[::50, ::50] = 0  # Scattered pixels, not motion
+    assert not monitor.detect_motion(noisy)
+
+
+def test_recent_photos(tmp_path):
+    for i, name in enumerate(['a.jpg', 'b.png', 'c.webp', 'd.txt']):
+        path = tmp_path / name
+        path.write_bytes(b'')
+        mtime = 1000 + i
+        os.utime(path, (mtime, mtime))
+    assert idle_mode.recent_photos(str(tmp_path), 2) == [str(tmp_path / 'c.webp'), str(tmp_path / 'b.png')]
+
+
+def test_idle_format():
+    formats = [
+        (320, 240, 'MJPG', 15), (320, 240, 'MJPG', 30), (640, 480, 'MJPG', 30),
+        (1920, 1080, 'MJPG', 30), (320, 240, 'YUYV', 5),
+    ]
+    assert idle_mode.idle_format(formats, (1920, 1080, 'MJPG', 30), scale=4, fps=5) == (320, 240, 'MJPG', 15)
+    assert idle_mode.idle_format(formats, (1920, 1080, 'MJPG', 30), scale=2, fps=20) == (640, 480, 'MJPG', 30)
+    # Nothing as small as the preview: the smallest size
+    assert idle_mode.idle_format(formats, (640, 480, 'MJPG', 30), scale=4, fps=5) == (320, 240, 'MJPG', 15)
+    # Already the smallest and slowest
+    assert idle_mode.idle_format(formats, (320, 240, 'MJPG', 15), scale=4, fps=5) is None
+
+
+def test_waking_clears_the_preview_width(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(idle_mode.time, 'monotonic', clock)
+    monitor = IdleMonitor(timeout=60, fps=5)
+    clock.now += 61
+    monitor.check()
+    monitor.preview_width = 480
+    monitor.note_activity('motion')
+    assert monitor.preview_width is None
+
+
+def test_waking_frame_is_decoded_once(monkeypatch):
+    monitor = IdleMonitor(timeout=0, fps=1000)
+    monitor.check()
+    processed = []
+    processor = SimpleNamespace(process=lambda frame, faces=None, out=None: (processed.append(frame) or frame, []))
+    app = SimpleNamespace(
+        frame_pool=None, process_pool=None, processor=processor, idle_monitor=monitor,
+        sample_queue=queue.Queue(), display_queue=queue.Queue(maxsize=2),
+    )
+    worker = FrameProcessorWorker(app)
+    decoded = []
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    monkeypatch.setattr(worker, 'frame_for', lambda sample, stamps: decoded.append(sample) or frame)
+    monkeypatch.setattr(worker, 'publish', lambda *args: worker.stop_event.set())
+    monkeypatch.setattr(monitor, 'detect_motion', lambda frame: True)
+
+    app.sample_queue.put(('sample', {'t_appsink': 0.0}))
+    worker.run()
+    assert decoded == ['sample']
+    assert len(processed) == 1 and processed[0] is frame
@@ -0,0 +1,58 @@
+import json
+
+from metrics import Metrics
+
+
+def test_snapshot_summarises_the_window():
+    metrics = Metrics(window=4)
+    for ms in (10, 20, 30, 40, 50):
+        metrics.observe('process', ms / 1000)
+    stage = metrics.snapshot()['stages']['process']
+    assert stage['count'] == 4  # The oldest sample left the window
+    assert stage['mean_ms'] == 35
+    assert stage['p50_ms'] == 40
+    assert stage['p99_ms'] == 50
+    assert stage['total_count'] == 5
+    assert abs(stage['total_seconds'] - 0.15) < 1e-9
+
+
+def test_counters_and_gauges():
+    metrics = Metrics()
+    metrics.inc('dropped_sample_queue')
+    metrics.inc('dropped_sample_queue', 2)
+    metrics.set_gauge('rss_mb', 120.5)
+    snapshot = metrics.snapshot()
+    assert metrics.counter('dropped_sample_queue') == 3
+    assert metrics.counter('missing') == 0
+    assert snapshot['counters'] == {'dropped_sample_queue': 3}
+    assert snapshot['gauges'] == {'rss_mb': 120.5}
+
+
+def test_prometheus_export():
+    metrics = Metrics(window=2)
+    metrics.inc('frames_displayed', 7)
+    metrics.set_gauge('quality_level', 1)
+    for seconds in (0.010, 0.020, 0.030):
+        metrics.observe('map', seconds)
+    lines = metrics.to_prometheus().splitlines()
+
+    assert '# TYPE photobooth_frames_displayed_total counter' in lines
+    assert 'photobooth_frames_displayed_total 7' in lines
+    assert '# TYPE photobooth_quality_level gauge' in lines
+    assert 'photobooth_quality_level 1' in lines
+    assert '# TYPE photobooth_stage_seconds summary' in lines
+    assert 'photobooth_stage_seconds{stage="map",quantile="0.5"} 0.020000' in lines
+    assert 'photobooth_stage_seconds{stage="map",quantile="0.99"} 0.030000' in lines
+    # _sum and _count cover every sample, not just the window, so rates work
+    assert 'photobooth_stage_seconds_sum{stage="map"} 0.060000' in lines
+    assert 'photobooth_stage_seconds_count{stage="map"} 3' in lines
+
+
+def test_write_picks_the_format_from_the_path(tmp_path):
+    metrics = Metrics()
+    metrics.inc('frames_processed')
+    metrics.write(str(tmp_path / 'metrics.json'))
+    metrics.write(str(tmp_path / 'metrics.prom'))
+    assert json.loads((tmp_path / 'metrics.json').read_text())['counters'] == {'frames_processed': 1}
+    assert 'photobooth_frames_processed_total 1' in (tmp_path / 'metrics.prom').read_text()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['metrics.json', 'metrics.prom']
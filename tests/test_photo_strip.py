@@ -0,0 +1,30 @@
+import numpy as np
+
+from photo_strip import compose_strip, layout_size
+
+
+def test_layout_size():
+    assert layout_size(4, 'strip') == (1, 4)
+    assert layout_size(4, 'grid') == (2, 2)
+    assert layout_size(5, 'grid') == (3, 2)
+
+
+def test_shots_fill_equal_cells():
+    shots = [np.full((90, 160, 3), value, dtype=np.uint8) for value in (10, 20, 30)]
+    card = compose_strip(shots, 'strip', cell_width=160, margin=10)
+    assert card.shape == (3 * 100 + 10, 180, 3)
+    for i, value in enumerate((10, 20, 30)):
+        y = 10 + i * 100
+        assert (card[y:y + 90, 10:170] == value).all()
+    assert (card[:10] == 255).all()  # Margins stay white
+
+
+def test_decoration_is_fitted_to_each_cell():
+    shots = [np.zeros((90, 160, 3), dtype=np.uint8) for _ in range(2)]
+    decoration = np.zeros((9, 16, 4), dtype=np.uint8)
+    decoration[:3, :, :] = (0, 0, 255, 255)  # A red band across the top third
+    card = compose_strip(shots, 'strip', decoration=decoration, cell_width=160, margin=10)
+    for y in (10, 110):
+        # Each cell gets the whole band at its top, unstretched by the strip's height
+        assert (card[y:y + 28, 10:170] == (0, 0, 255)).all()
+        assert (card[y + 32:y + 90, 10:170] == 0).all()
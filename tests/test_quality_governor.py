@@ -0,0 +1,29 @@
+from quality_governor import smaller_formats
+
+
+FORMATS = [
+    (1920, 1080, 'MJPG', 30),
+    (1280, 720, 'MJPG', 30),
+    (1280, 720, 'MJPG', 60),
+    (1280, 720, 'YUY2', 30),
+    (640, 480, 'MJPG', 30),
+    (640, 480, 'MJPG', 15),
+    (320, 240, 'YUY2', 30),
+]
+
+
+def test_smaller_formats_keep_the_pixel_format_and_framerate():
+    assert smaller_formats(FORMATS, (1920, 1080, 'MJPG', 30)) == [
+        (1280, 720, 'MJPG', 60),
+        (640, 480, 'MJPG', 30),
+    ]
+
+
+def test_smaller_formats_fall_back_to_other_pixel_formats():
+    assert smaller_formats(FORMATS, (1280, 720, 'YUY2', 30)) == [(320, 240, 'YUY2', 30)]
+    assert smaller_formats([(640, 480, 'MJPG', 30)], (1280, 720, 'YUY2', 30)) == [(640, 480, 'MJPG', 30)]
+
+
+def test_no_smaller_formats():
+    assert smaller_formats(FORMATS, (320, 240, 'YUY2', 30)) == []
+    assert smaller_formats(FORMATS, (1920, 1080, 'MJPG', 120)) == []
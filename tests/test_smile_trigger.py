@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import smile_trigger
+from smile_trigger import SmileTrigger
+
+FACES = [(40, 40, 120, 120)]
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(smile_trigger.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def trigger():
+    fired = []
+    trigger = SmileTrigger(lambda: fired.append(True), seconds=1.0, cooldown=10, check_fps=10)
+    trigger.available = True
+    trigger.smiling = True
+    trigger.checks = 0
+
+    def is_smiling(gray, face):
+        trigger.checks += 1
+        return trigger.smiling
+
+    trigger.is_smiling = is_smiling
+    trigger.fired = fired
+    return trigger
+
+
+def _run(trigger, clock, seconds, faces=FACES, step=0.05):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    for _ in range(round(seconds / step)):
+        trigger.update(frame, faces)
+        clock.now += step
+
+
+def test_fires_once_smiles_have_held(trigger, clock):
+    _run(trigger, clock, 0.85)
+    assert not trigger.fired
+    _run(trigger, clock, 0.2)
+    assert trigger.fired == [True]
+
+
+def test_checks_are_rate_limited(trigger, clock):
+    _run(trigger, clock, 0.5)  # Ten frames at 20fps
+    assert trigger.checks == 5
+
+
+def test_cooldown_after_firing(trigger, clock):
+    _run(trigger, clock, 1.5)
+    assert len(trigger.fired) == 1
+    _run(trigger, clock, 5)
+    assert len(trigger.fired) == 1
+    _run(trigger, clock, 10)
+    assert len(trigger.fired) == 2
+
+
+def test_needs_most_checks_smiling(trigger, clock):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    for i in range(40):
+        trigger.smiling = i % 3 != 0  # Two thirds of the checks
+        trigger.update(frame, FACES)
+        clock.now += 0.1
+    assert not trigger.fired
+
+
+def test_losing_the_faces_restarts_the_window(trigger, clock):
+    _run(trigger, clock, 0.6)
+    _run(trigger, clock, 0.1, faces=[])
+    _run(trigger, clock, 0.6)
+    assert not trigger.fired
+    _run(trigger, clock, 0.5)
+    assert trigger.fired == [True]
@@ -0,0 +1,134 @@
+import struct
+
+import pytest
+
+import v4l2_probe
+
+
+def fourcc(code):
+    return struct.unpack('<I', code.encode('ascii'))[0]
+
+
+class FakeDevice:
+    """Answers the enumeration ioctls from lists of entries, like a V4L2 driver."""
+    def __init__(self, formats, sizes, intervals, capability=None):
+        self.formats = formats        # [pixelformat]
+        self.sizes = sizes            # pixelformat -> [(type, six union fields)]
+        self.intervals = intervals    # (pixelformat, w, h) -> [(type, six union fields)]
+        self.capability = capability
+
+    def ioctl(self, fd, request, buf, mutate):
+        if request == v4l2_probe.VIDIOC_QUERYCAP:
+            if self.capability is None:
+                raise OSError(25, 'Inappropriate ioctl')
+            buf[:] = v4l2_probe._CAPABILITY.pack(*self.capability)
+        elif request == v4l2_probe.VIDIOC_ENUM_FMT:
+            index, buf_type = struct.unpack_from('<II', buf)
+            if index >= len(self.formats):
+                raise OSError(22, 'Invalid argument')
+            buf[:] = v4l2_probe._FMTDESC.pack(index, buf_type, 0, b'desc', self.formats[index], 0, 0, 0, 0)
+        elif request == v4l2_probe.VIDIOC_ENUM_FRAMESIZES:
+            index, pixelformat = struct.unpack_from('<II', buf)
+            entries = self.sizes.get(pixelformat, [])
+            if index >= len(entries):
+                raise OSError(22, 'Invalid argument')
+            size_type, union = entries[index]
+            buf[:] = v4l2_probe._FRMSIZEENUM.pack(index, pixelformat, size_type, *union, 0, 0)
+        elif request == v4l2_probe.VIDIOC_ENUM_FRAMEINTERVALS:
+            index, pixelformat, w, h = struct.unpack_from('<IIII', buf)
+            entries = self.intervals.get((pixelformat, w, h), [])
+            if index >= len(entries):
+                raise OSError(22, 'Invalid argument')
+            ival_type, union = entries[index]
+            buf[:] = v4l2_probe._FRMIVALENUM.pack(index, pixelformat, w, h, ival_type, *union, 0, 0)
+        else:
+            raise OSError(25, 'Inappropriate ioctl')
+        return 0
+
+
+@pytest.fixture
+def device(monkeypatch):
+    def install(fake):
+        monkeypatch.setattr(v4l2_probe.os, 'open', lambda path, flags: 3)
+        monkeypatch.setattr(v4l2_probe.os, 'close', lambda fd: None)
+        monkeypatch.setattr(v4l2_probe.fcntl, 'ioctl', fake.ioctl)
+    return install
+
+
+def test_struct_sizes_and_requests_match_the_kernel_headers():
+    assert v4l2_probe._CAPABILITY.size == 104
+    assert v4l2_probe._FMTDESC.size == 64
+    assert v4l2_probe._FRMSIZEENUM.size == 44
+    assert v4l2_probe._FRMIVALENUM.size == 52
+    assert v4l2_probe.VIDIOC_QUERYCAP == 0x80685600
+    assert v4l2_probe.VIDIOC_ENUM_FMT == 0xc0405602
+    assert v4l2_probe.VIDIOC_ENUM_FRAMESIZES == 0xc02c564a
+    assert v4l2_probe.VIDIOC_ENUM_FRAMEINTERVALS == 0xc034564b
+
+
+def test_fourcc_to_str():
+    assert v4l2_probe._fourcc_to_str(fourcc('MJPG')) == 'MJPG'
+    assert v4l2_probe._fourcc_to_str(fourcc('YUYV')) == 'YUYV'
+
+
+def test_enumerate_discrete_formats(device):
+    mjpg, yuyv = fourcc('MJPG'), fourcc('YUYV')
+    device(FakeDevice(
+        formats=[mjpg, yuyv],
+        sizes={
+            mjpg: [(1, (1920, 1080, 0, 0, 0, 0)), (1, (1280, 720, 0, 0, 0, 0))],
+            yuyv: [(1, (640, 480, 0, 0, 0, 0))],
+        },
+        intervals={
+            (mjpg, 1920, 1080): [(1, (1, 30, 0, 0, 0, 0)), (1, (1, 15, 0, 0, 0, 0))],
+            (mjpg, 1280, 720): [(1, (1, 60, 0, 0, 0, 0))],
+            (yuyv, 640, 480): [(1, (1, 30, 0, 0, 0, 0)), (1, (0, 0, 0, 0, 0, 0))],
+        },
+    ))
+    assert v4l2_probe.enumerate_formats('/dev/video0') == [
+        (1920, 1080, 'MJPG', 30),
+        (1920, 1080, 'MJPG', 15),
+        (1280, 720, 'MJPG', 60),
+        (640, 480, 'YUYV', 30),  # The zero interval is skipped
+    ]
+
+
+def test_stepwise_sizes_report_the_fitting_candidates(device):
+    yuyv = fourcc('YUYV')
+    device(FakeDevice(
+        formats=[yuyv],
+        # min_w, max_w, step_w, min_h, max_h, step_h
+        sizes={yuyv: [(v4l2_probe.V4L2_FRMSIZE_TYPE_STEPWISE, (160, 1920, 16, 120, 1080, 8))]},
+        intervals={
+            # Continuous from 1/60s to 1/5s
+            (yuyv, 1280, 720): [(2, (1, 60, 1, 5, 1, 1))],
+            (yuyv, 1920, 1080): [(2, (1, 25, 1, 5, 1, 1))],
+        },
+    ))
+    formats = v4l2_probe.enumerate_formats('/dev/video0', [(1280, 720), (1920, 1080), (3840, 2160), (1000, 1000)])
+    assert formats == [
+        (1280, 720, 'YUYV', 60),
+        (1280, 720, 'YUYV', 30),  # 30fps is inside the range, so it is offered too
+        (1920, 1080, 'YUYV', 25),
+    ]
+
+
+def test_enumerate_formats_without_device_is_empty(monkeypatch):
+    def fail(path, flags):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(v4l2_probe.os, 'open', fail)
+    assert v4l2_probe.enumerate_formats('/dev/video9') == []
+
+
+def test_query_capabilities_uses_device_caps(device):
+    capability = (b'uvcvideo', b'HD Webcam', b'usb-0000:00:14.0-1', 0x60000,
+                  v4l2_probe.V4L2_CAP_VIDEO_CAPTURE | v4l2_probe.V4L2_CAP_DEVICE_CAPS, 0x04200000, 0, 0, 0)
+    device(FakeDevice([], {}, {}, capability))
+    caps = v4l2_probe.query_capabilities('/dev/video1')
+    # The node's own caps lack VIDEO_CAPTURE: a metadata node of a capture device
+    assert caps == {'driver': 'uvcvideo', 'card': 'HD Webcam', 'bus_info': 'usb-0000:00:14.0-1', 'capture': False}
+
+
+def test_query_capabilities_failure(device):
+    device(FakeDevice([], {}, {}))
+    assert v4l2_probe.query_capabilities('/dev/video0') is None
@@ -1,19 +1,67 @@
+import os
 import threading
-import whisper
-import sounddevice as sd
 import numpy as np
 import queue
 import logging
 
+# --- CONFIGURATION ---
+VOICE_BACKEND = os.environ.get('VOICE_BACKEND', 'whisper')        # whisper (PyTorch) or faster-whisper (CTranslate2)
+VOICE_MODEL = os.environ.get('VOICE_MODEL', 'tiny.en')            # Whisper model name
+VOICE_COMPUTE_TYPE = os.environ.get('VOICE_COMPUTE_TYPE', 'int8') # faster-whisper weight quantisation
+VOICE_THREADS = int(os.environ.get('VOICE_THREADS', '0'))         # faster-whisper CPU threads, 0 for its default
+# --- END CONFIGURATION ---
+
+VOICE_BACKENDS = ('whisper', 'faster-whisper')
+SAMPLERATE = 16000  # Whisper requires 16kHz sample rate
+WINDOW_SECONDS = 1.5  # Audio transcribed at a time
+
+
+def load_transcriber(backend=VOICE_BACKEND, model=VOICE_MODEL):
+    """
+    Loads a Whisper model with the given inference backend.
+
+    The backend's package is imported here, so only the one in use is loaded:
+    "whisper" brings in PyTorch, "faster-whisper" runs an int8 CTranslate2
+    conversion of the same model (by default) without it.
+
+    Args:
+        backend (str): "whisper" or "faster-whisper".
+        model (str): The name of the Whisper model to use (e.g., "tiny.en").
+
+    Returns:
+        A function that takes 16kHz mono float32 audio and returns its text.
+    """
+    if backend == 'faster-whisper':
+        from faster_whisper import WhisperModel
+        fast_model = WhisperModel(model, device='cpu', compute_type=VOICE_COMPUTE_TYPE,
+                                  cpu_threads=VOICE_THREADS)
+
+        def transcribe(audio):
+            # Greedy decoding, as the whisper backend does by default
+            segments, _ = fast_model.transcribe(audio, beam_size=1, condition_on_previous_text=False)
+            return ''.join(segment.text for segment in segments)
+        return transcribe
+
+    if backend != 'whisper':
+        raise ValueError(f"Unknown voice backend '{backend}'")
+    import whisper
+    torch_model = whisper.load_model(model)
+
+    def transcribe(audio):
+        return torch_model.transcribe(audio, fp16=False)['text'] # fp16=False if not using GPU
+    return transcribe
+
+
 class VoiceListener:
     """
     A class to listen for a specific keyword using the Whisper ASR model.
 
     This class runs in a separate thread, continuously recording audio from the
     microphone, transcribing it, and checking for a keyword. When the keyword
-    is detected, it invokes a callback function.
+    is detected, it invokes a callback function. The model runs on the
+    backend set by `VOICE_BACKEND` (see `load_transcriber`).
     """
-    def __init__(self, callback, model="tiny.en", keyword="smile"):
+    def __init__(self, callback, model=VOICE_MODEL, keyword="smile", backend=VOICE_BACKEND):
         """
         Initializes the VoiceListener.
 
@@ -21,14 +69,16 @@ class VoiceListener:
             callback: The function to call when the keyword is detected.
             model (str): The name of the Whisper model to use (e.g., "tiny.en").
             keyword (str): The keyword to listen for.
+            backend (str): "whisper" or "faster-whisper".
         """
         self.callback = callback
         self.model_name = model
+        self.backend = backend
         self.keyword = keyword.lower()
         self.stop_event = threading.Event()
         self.audio_queue = queue.Queue()
         self.thread = threading.Thread(target=self._run)
-        self.samplerate = 16000  # Whisper requires 16kHz sample rate
+        self.samplerate = SAMPLERATE
 
     def _record_callback(self, indata, frames, time, status):
         """
@@ -43,8 +93,8 @@ class VoiceListener:
         The main loop for the voice listener thread.
         """
         try:
-            logging.info(f"Loading whisper model '{self.model_name}'...")
-            model = whisper.load_model(self.model_name)
+            logging.info(f"Loading whisper model '{self.model_name}' with the {self.backend} backend...")
+            transcribe = load_transcriber(self.backend, self.model_name)
             logging.info("Whisper model loaded.")
         except Exception as e:
             logging.error(f"Failed to load whisper model: {e}")
@@ -52,6 +102,7 @@ class VoiceListener:
 
         # Use a context manager for the audio stream to ensure it's closed properly
         try:
+            import sounddevice as sd
             with sd.InputStream(samplerate=self.samplerate, channels=1, dtype='float32', callback=self._record_callback):
                 logging.info(f"Voice listener started. Listening for '{self.keyword}'...")
 
@@ -66,10 +117,9 @@ class VoiceListener:
 
                         # Transcribe when we have a few seconds of audio
                         # This is a trade-off between responsiveness and accuracy
-                        if len(audio_buffer) >= int(self.samplerate * 1.5):
+                        if len(audio_buffer) >= int(self.samplerate * WINDOW_SECONDS):
                             # Transcribe the audio buffer
-                            result = model.transcribe(audio_buffer, fp16=False) # fp16=False if not using GPU
-                            transcript = result['text'].lower()
+                            transcript = transcribe(audio_buffer).lower()
                             logging.info(f"Transcription: '{transcript}'")
 
                             # Check if the keyword is in the transcript